@@ -0,0 +1,495 @@
+import json
+import logging
+import pathlib
+import sqlite3
+
+import laspy
+from laspy.vlrs.known import GeoKeyDirectoryVlr, WktCoordinateSystemVlr
+import numpy as np
+import shapefile
+
+from laserfarm.grid import Grid
+from laserfarm.utils import check_path_exists
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    point_count INTEGER,
+    min_x REAL, min_y REAL, min_z REAL,
+    max_x REAL, max_y REAL, max_z REAL,
+    scale_x REAL, scale_y REAL, scale_z REAL,
+    offset_x REAL, offset_y REAL, offset_z REAL,
+    crs TEXT
+);
+CREATE TABLE IF NOT EXISTS tiles (
+    path TEXT,
+    tile_x INTEGER,
+    tile_y INTEGER
+);
+CREATE INDEX IF NOT EXISTS tiles_by_index ON tiles (tile_x, tile_y);
+CREATE INDEX IF NOT EXISTS tiles_by_path ON tiles (path);
+"""
+
+
+class PointCloudCatalogue(object):
+    """
+    On-disk (SQLite) catalogue of LAS/LAZ files, built from the file headers
+    only. For each file, the catalogue stores the number of points, the
+    bounding box, the scales, the offsets and the CRS, together with the tiles
+    of a regular grid that the bounding box touches.
+
+    Example:
+        >>> grid = Grid(-113107.81, 214783.87, 398892.19, 726783.87, 256)
+        >>> catalogue = PointCloudCatalogue('catalogue.sqlite', grid=grid)
+        >>> catalogue.update('point_clouds/')
+        >>> catalogue.get_tiles()
+        [(101, 101), (101, 102)]
+    """
+
+    def __init__(self, path, grid=None):
+        """
+        Open the catalogue, creating it if it does not exist.
+
+        :param path: Path to the catalogue file
+        :param grid: (Optional) Grid used to assign files to tiles. If the
+        catalogue was created with a different grid, the assignment is
+        recomputed from the stored bounding boxes. If not given, the grid
+        stored in the catalogue is employed (if any).
+        """
+        self.path = pathlib.Path(path)
+        self._connection = sqlite3.connect(self.path.as_posix(), timeout=60.)
+        self._connection.executescript(_SCHEMA)
+        stored_grid = self._get_metadata('grid')
+        if grid is not None and grid.is_set:
+            grid_parameters = _get_grid_parameters(grid)
+            if grid_parameters != stored_grid:
+                self._set_metadata('grid', grid_parameters)
+                self.grid = grid
+                self._update_all_tiles()
+            else:
+                self.grid = grid
+        elif stored_grid is not None:
+            self.grid = Grid(**stored_grid)
+        else:
+            self.grid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Close the connection to the catalogue file. """
+        self._connection.close()
+
+    def update(self, path):
+        """
+        Add a file or all the LAS/LAZ files in a directory to the catalogue.
+        Files that are already in the catalogue are re-read only if their
+        modification time or size have changed. When a directory is given,
+        entries of files that have been removed from it are dropped.
+
+        :param path: Path to a LAS/LAZ file or to a directory
+        """
+        p = pathlib.Path(path)
+        check_path_exists(p, should_exist=True)
+        if p.is_dir():
+            files = [f.absolute() for f in sorted(p.iterdir())
+                     if f.is_file() and f.suffix.lower() in ('.las', '.laz')]
+            self._remove_missing_files(p.absolute())
+        else:
+            files = [p.absolute()]
+        n_updated = 0
+        with self._connection:
+            for file in files:
+                stat = file.stat()
+                row = self._connection.execute(
+                    'SELECT mtime, size FROM files WHERE path = ?',
+                    (file.as_posix(),)
+                ).fetchone()
+                if row is not None and row == (stat.st_mtime, stat.st_size):
+                    continue
+                self._add_file(file, stat)
+                n_updated += 1
+        logger.info('{} file(s) added or updated in catalogue '
+                    '{}'.format(n_updated, self.path))
+        return self
+
+    def get_details(self, path):
+        """
+        Retrieve the header details of a file in the catalogue.
+
+        :param path: Path to the LAS/LAZ file
+        :return: (point count, mins, maxs, scales, offsets), or None if the
+        file is not in the catalogue
+        """
+        row = self._connection.execute(
+            'SELECT point_count, min_x, min_y, min_z, max_x, max_y, max_z, '
+            'scale_x, scale_y, scale_z, offset_x, offset_y, offset_z '
+            'FROM files WHERE path = ?', (_to_key(path),)
+        ).fetchone()
+        if row is None:
+            return None
+        count, values = row[0], np.array(row[1:], dtype=float)
+        mins, maxs, scales, offsets = np.split(values, 4)
+        return count, mins, maxs, scales, offsets
+
+    def get_crs(self, path):
+        """
+        Retrieve the CRS of a file in the catalogue as stored in its header
+        (WKT string or 'EPSG:<code>'), or None if not available.
+
+        :param path: Path to the LAS/LAZ file
+        """
+        row = self._connection.execute('SELECT crs FROM files WHERE path = ?',
+                                       (_to_key(path),)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_files(self, tile_index_x=None, tile_index_y=None):
+        """
+        List the files in the catalogue. If tile indices are provided, only
+        the files overlapping the given tile are returned.
+
+        :param tile_index_x: (Optional) tile index along X
+        :param tile_index_y: (Optional) tile index along Y
+        """
+        if tile_index_x is None or tile_index_y is None:
+            rows = self._connection.execute('SELECT path FROM files')
+        else:
+            self._check_grid()
+            rows = self._connection.execute(
+                'SELECT path FROM tiles WHERE tile_x = ? AND tile_y = ?',
+                (int(tile_index_x), int(tile_index_y))
+            )
+        return sorted(row[0] for row in rows)
+
+    def get_tiles(self, path=None):
+        """
+        List the grid tiles that contain data. If a path is provided, only
+        the tiles overlapping the given file are returned.
+
+        :param path: (Optional) path to the LAS/LAZ file
+        """
+        self._check_grid()
+        if path is None:
+            rows = self._connection.execute(
+                'SELECT DISTINCT tile_x, tile_y FROM tiles'
+            )
+        else:
+            rows = self._connection.execute(
+                'SELECT tile_x, tile_y FROM tiles WHERE path = ?',
+                (_to_key(path),)
+            )
+        return sorted(tuple(row) for row in rows)
+
+    def get_active_tiles(self):
+        """
+        Get the tiles of the grid that overlap the footprint of the files in
+        the catalogue (i.e. the tiles that can contain data).
+
+        :return: (n_tiles_x, n_tiles_y) boolean mask of the active tiles
+        """
+        self._check_grid()
+        mask = np.zeros((self.grid.n_tiles_x, self.grid.n_tiles_y), dtype=bool)
+        tiles = self.get_tiles()
+        if tiles:
+            mask[tuple(np.array(tiles).T)] = True
+        return mask
+
+    def get_point_count(self, paths=None):
+        """
+        Get the total number of points in the catalogue.
+
+        :param paths: (Optional) only consider the given files
+        """
+        if paths is None:
+            row = self._connection.execute(
+                'SELECT SUM(point_count) FROM files'
+            ).fetchone()
+            return row[0] or 0
+        return sum(self.get_details(path)[0] for path in paths)
+
+    def _add_file(self, file, stat):
+        with laspy.open(file) as f:
+            header = f.header
+            values = (file.as_posix(), stat.st_mtime, stat.st_size,
+                      header.point_count, *header.mins, *header.maxs,
+                      *header.scales, *header.offsets, _get_crs(header))
+        self._connection.execute(
+            'INSERT OR REPLACE INTO files VALUES '
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', values
+        )
+        self._update_tiles(file.as_posix(), values[4:6], values[7:9])
+
+    def _update_tiles(self, path, mins, maxs):
+        self._connection.execute('DELETE FROM tiles WHERE path = ?', (path,))
+        if self.grid is None:
+            return
+        tiles = _get_overlapping_tiles(self.grid, mins, maxs)
+        self._connection.executemany(
+            'INSERT INTO tiles VALUES (?, ?, ?)',
+            [(path, tile_x, tile_y) for tile_x, tile_y in tiles]
+        )
+
+    def _update_all_tiles(self):
+        with self._connection:
+            rows = self._connection.execute(
+                'SELECT path, min_x, min_y, max_x, max_y FROM files'
+            ).fetchall()
+            for path, min_x, min_y, max_x, max_y in rows:
+                self._update_tiles(path, (min_x, min_y), (max_x, max_y))
+
+    def _remove_missing_files(self, directory):
+        rows = self._connection.execute('SELECT path FROM files').fetchall()
+        missing = [(path,) for (path,) in rows
+                   if (pathlib.Path(path).parent == directory
+                       and not pathlib.Path(path).is_file())]
+        with self._connection:
+            self._connection.executemany('DELETE FROM files WHERE path = ?',
+                                         missing)
+            self._connection.executemany('DELETE FROM tiles WHERE path = ?',
+                                         missing)
+
+    def _get_metadata(self, key):
+        row = self._connection.execute(
+            'SELECT value FROM metadata WHERE key = ?', (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _set_metadata(self, key, value):
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO metadata VALUES (?, ?)',
+                (key, json.dumps(value))
+            )
+
+    def _check_grid(self):
+        if self.grid is None:
+            raise ValueError('The grid of the catalogue has not been set!')
+
+
+_SHP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    min_x REAL, min_y REAL,
+    max_x REAL, max_y REAL
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    path TEXT,
+    record INTEGER
+);
+CREATE INDEX IF NOT EXISTS records_by_path ON records (path);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_index USING rtree (
+    id,
+    min_x, max_x,
+    min_y, max_y
+);
+"""
+
+
+class ShapefileCatalogue(object):
+    """
+    On-disk (SQLite) catalogue of shapefiles. For each file, the catalogue
+    stores the bounding box of the file and of all its records, the latter
+    in a R-tree index. Records overlapping a given area can then be found
+    without opening the shapefiles.
+
+    Example:
+        >>> catalogue = ShapefileCatalogue('shp_catalogue.sqlite')
+        >>> catalogue.update('shapefiles/')
+        >>> catalogue.get_records((226897.19, 428788.88, 228887.19, 430778.88))
+        {'/path/to/shapefiles/41W_waterdeel.shp': [0]}
+    """
+
+    def __init__(self, path):
+        """
+        Open the catalogue, creating it if it does not exist.
+
+        :param path: Path to the catalogue file
+        """
+        self.path = pathlib.Path(path)
+        self._connection = sqlite3.connect(self.path.as_posix(), timeout=60.)
+        self._connection.executescript(_SHP_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Close the connection to the catalogue file. """
+        self._connection.close()
+
+    def update(self, path):
+        """
+        Add a shapefile or all the shapefiles in a directory to the
+        catalogue. Files that are already in the catalogue are re-read only
+        if their modification time or size have changed. When a directory is
+        given, entries of files that have been removed from it are dropped.
+
+        :param path: Path to a shapefile or to a directory
+        """
+        p = pathlib.Path(path)
+        check_path_exists(p, should_exist=True)
+        if p.is_dir():
+            files = [f.absolute() for f in sorted(p.iterdir())
+                     if f.is_file() and f.suffix.lower() == '.shp']
+            self._remove_missing_files(p.absolute())
+        else:
+            files = [p.absolute()]
+        n_updated = 0
+        with self._connection:
+            for file in files:
+                stat = file.stat()
+                row = self._connection.execute(
+                    'SELECT mtime, size FROM files WHERE path = ?',
+                    (file.as_posix(),)
+                ).fetchone()
+                if row is not None and row == (stat.st_mtime, stat.st_size):
+                    continue
+                self._add_file(file, stat)
+                n_updated += 1
+        if n_updated > 0:
+            logger.info('{} file(s) added or updated in catalogue '
+                        '{}'.format(n_updated, self.path))
+        return self
+
+    def get_files(self, bbox=None):
+        """
+        List the shapefiles in the catalogue. If a bounding box is provided,
+        only the files whose bounding box overlaps it are returned.
+
+        :param bbox: (Optional) bounding box (min_x, min_y, max_x, max_y)
+        """
+        if bbox is None:
+            rows = self._connection.execute('SELECT path FROM files')
+        else:
+            min_x, min_y, max_x, max_y = (float(v) for v in bbox)
+            rows = self._connection.execute(
+                'SELECT path FROM files WHERE max_x >= ? AND min_x <= ? '
+                'AND max_y >= ? AND min_y <= ?', (min_x, max_x, min_y, max_y)
+            )
+        return sorted(row[0] for row in rows)
+
+    def get_records(self, bbox, directory=None):
+        """
+        Find the shapefile records whose bounding box overlaps a given
+        bounding box, using the R-tree index of the catalogue. Note that
+        the index stores bounding boxes with single precision (rounded
+        outwards), so a few non-overlapping records might be returned.
+
+        :param bbox: bounding box (min_x, min_y, max_x, max_y)
+        :param directory: (Optional) only consider the shapefiles in the
+        given directory
+        :return: dictionary with the paths to the shapefiles as keys and the
+        sorted lists of record indices as values
+        """
+        min_x, min_y, max_x, max_y = (float(v) for v in bbox)
+        rows = self._connection.execute(
+            'SELECT records.path, records.record FROM records_index '
+            'JOIN records ON records.id = records_index.id '
+            'WHERE records_index.max_x >= ? AND records_index.min_x <= ? '
+            'AND records_index.max_y >= ? AND records_index.min_y <= ? '
+            'ORDER BY records.path, records.record',
+            (min_x, max_x, min_y, max_y)
+        )
+        if directory is not None:
+            directory = _to_key(directory)
+        records = {}
+        for path, record in rows:
+            if (directory is not None
+                    and pathlib.Path(path).parent.as_posix() != directory):
+                continue
+            records.setdefault(path, []).append(record)
+        return records
+
+    def _add_file(self, file, stat):
+        path = file.as_posix()
+        with shapefile.Reader(path) as sf:
+            bbox = tuple(sf.bbox)
+            # Records without bounding box (null shapes, points) are skipped
+            record_bboxes = [(n, tuple(shape.bbox))
+                             for n, shape in enumerate(sf.iterShapes())
+                             if getattr(shape, 'bbox', None) is not None]
+        self._connection.execute(
+            'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (path, stat.st_mtime, stat.st_size, *bbox)
+        )
+        self._remove_records(path)
+        for n, (min_x, min_y, max_x, max_y) in record_bboxes:
+            cursor = self._connection.execute(
+                'INSERT INTO records (path, record) VALUES (?, ?)', (path, n)
+            )
+            self._connection.execute(
+                'INSERT INTO records_index VALUES (?, ?, ?, ?, ?)',
+                (cursor.lastrowid, min_x, max_x, min_y, max_y)
+            )
+
+    def _remove_records(self, path):
+        self._connection.execute(
+            'DELETE FROM records_index WHERE id IN '
+            '(SELECT id FROM records WHERE path = ?)', (path,)
+        )
+        self._connection.execute('DELETE FROM records WHERE path = ?',
+                                 (path,))
+
+    def _remove_missing_files(self, directory):
+        rows = self._connection.execute('SELECT path FROM files').fetchall()
+        missing = [path for (path,) in rows
+                   if (pathlib.Path(path).parent == directory
+                       and not pathlib.Path(path).is_file())]
+        with self._connection:
+            for path in missing:
+                self._connection.execute('DELETE FROM files WHERE path = ?',
+                                         (path,))
+                self._remove_records(path)
+
+
+def _to_key(path):
+    return pathlib.Path(path).absolute().as_posix()
+
+
+def _get_grid_parameters(grid):
+    return {'min_x': float(grid.min_x),
+            'min_y': float(grid.min_y),
+            'max_x': float(grid.max_x),
+            'max_y': float(grid.max_y),
+            'n_tiles_x': int(grid.n_tiles_x),
+            'n_tiles_y': int(grid.n_tiles_y)}
+
+
+def _get_overlapping_tiles(grid, mins, maxs):
+    """ List the tiles of the grid overlapping a bounding box. """
+    n_tiles = (grid.n_tiles_x, grid.n_tiles_y)
+    tile_mins = np.maximum(grid.get_tile_index(*mins), 0)
+    tile_maxs = np.minimum(grid.get_tile_index(*maxs), np.subtract(n_tiles, 1))
+    return [(int(tile_x), int(tile_y))
+            for tile_x in range(tile_mins[0], tile_maxs[0] + 1)
+            for tile_y in range(tile_mins[1], tile_maxs[1] + 1)]
+
+
+def _get_crs(header):
+    for vlr in header.vlrs:
+        if isinstance(vlr, WktCoordinateSystemVlr):
+            return vlr.string
+    for vlr in header.vlrs:
+        if isinstance(vlr, GeoKeyDirectoryVlr):
+            for key in vlr.geo_keys:
+                # ProjectedCSTypeGeoKey and GeographicTypeGeoKey
+                if key.id in (3072, 2048):
+                    return 'EPSG:{}'.format(key.value_offset)
+    return None
@@ -6,10 +6,10 @@ import shapely
 import laserfarm
 import laserchicken
 from shapely.geometry import shape
+from laserfarm.catalogue import ShapefileCatalogue
 from laserfarm.pipeline_remote_data import PipelineRemoteData
 from laserchicken.io.load import load
 from laserchicken.io.export import export
-from laserchicken import filter
 
 logger = logging.getLogger(__name__)
 
@@ -22,28 +22,33 @@ class Classification(PipelineRemoteData):
                          'classification',
                          'export_point_cloud')
         self.input_shp = []
+        self.input_records = {}
+        self.input_classes = {}
         self.point_cloud = None
         if input_file is not None:
             self.input_path = input_file
         if label is not None:
             self.label = label
 
-    def locate_shp(self, shp_dir):
+    def locate_shp(self, shp_dir, catalogue_file=None):
         """
         Locate the corresponding ESRI shape file of the point cloud
-        
+
         :param shp_dir: directory which contains all candidate shp file for
-        classification
+        classification. For multi-class classification, provide a dictionary
+        with the ground types as keys and the corresponding directories as
+        values.
+        :param catalogue_file: (optional) path to a catalogue of the
+        shapefiles, which is created if it does not exist and updated if
+        files are added, modified or removed. The candidate files and records
+        are then retrieved from the catalogue's spatial index, without
+        opening the shapefiles.
         """
 
         laserfarm.utils.check_file_exists(self.input_path,
                                           should_exist=True)
         pc = load(self.input_path.as_posix())
 
-        shp_path = self.input_folder / shp_dir
-
-        laserfarm.utils.check_dir_exists(shp_path, should_exist=True)
-
         # Get boundary of the point cloud
         self.point_cloud = pc
         x = pc[laserchicken.keys.point]['x']['data']
@@ -51,39 +56,84 @@ class Classification(PipelineRemoteData):
         point_box = shapely.geometry.box(np.min(x), np.min(y),
                                          np.max(x), np.max(y))
 
-        for shp in sorted([f.absolute() for f in shp_path.iterdir()
-                           if f.suffix == '.shp']):
-            sf = shapefile.Reader(shp.as_posix())
-            mbr = shapely.geometry.box(*sf.bbox)
-
-            if point_box.intersects(mbr):
-                self.input_shp.append(shp)
-
+        if isinstance(shp_dir, dict):
+            for ground_type, class_shp_dir in shp_dir.items():
+                self.input_classes[int(ground_type)] = self._locate_shp(
+                    class_shp_dir, point_box, catalogue_file
+                )
+        else:
+            shp_files, records = self._locate_shp(shp_dir, point_box,
+                                                  catalogue_file)
+            self.input_shp.extend(shp_files)
+            self.input_records.update(records)
         return self
 
-    def classification(self, ground_type):
+    def classification(self, ground_type=None, cell_size=None,
+                       priority=None):
         """
         Classify the pointset according to the given shape file.
         A new feature "ground_type" will be added to the point cloud.
         The value of the column identify the ground type.
-        
+
+        All the polygons overlapping the point cloud are loaded at once and
+        indexed in a R-tree. Points are binned in a coarse grid: points in
+        cells fully within a polygon are classified as a whole, and the
+        point-in-polygon test is run only for the points in the cells that
+        intersect the polygons' boundaries.
+
+        If shapefiles have been located for multiple ground types, all the
+        classes are assigned in one pass and "ground_type" is stored as an
+        unsigned 8-bit integer. Points falling within polygons of different
+        classes get the ground type with the highest priority.
+
         :param ground_type: identifier of the groud type. 0 is not identified.
+        Not used for multi-class classification.
+        :param cell_size: (optional) size of the cells used to bin the points.
+        If not provided, it is set to have ~1000 points per cell on average.
+        :param priority: (optional) list of ground types, from the highest to
+        the lowest priority, for multi-class classification. Default: the
+        order in which the classes are provided to locate_shp.
         """
+        x = self.point_cloud[laserchicken.keys.point]['x']['data']
+        y = self.point_cloud[laserchicken.keys.point]['y']['data']
+        bbox = (np.min(x), np.min(y), np.max(x), np.max(y)) if x.size else None
 
-        # Get the mask of points which fall in the shape file(s)
-        pc_mask = np.zeros(len(self.point_cloud['vertex']['x']['data']),
-                           dtype=bool)
-        for shp in self.input_shp:
-            this_mask = filter.select_polygon(self.point_cloud,
-                                              shp.as_posix(),
-                                              read_from_file=True,
-                                              return_mask=True)
-            pc_mask = np.logical_or(pc_mask, this_mask)
-
-        # Add the ground type feature 
+        if self.input_classes:
+            if ground_type is not None:
+                raise ValueError('ground_type should not be provided for '
+                                 'multi-class classification')
+            priority = _check_priority(priority, self.input_classes)
+            # Classify in order of priority, only testing points that have
+            # not been assigned to a class yet
+            labels = np.zeros(x.size, dtype=np.uint8)
+            for class_ground_type in priority:
+                unclassified = np.flatnonzero(labels == 0)
+                if unclassified.size == 0:
+                    break
+                shp_files, records = self.input_classes[class_ground_type]
+                polygons = _read_polygons(shp_files, bbox, records=records)
+                mask = _get_polygons_mask(x[unclassified], y[unclassified],
+                                          polygons, cell_size=cell_size)
+                labels[unclassified[mask]] = class_ground_type
+            pc_mask = labels > 0
+            value = labels[pc_mask]
+        else:
+            if ground_type is None:
+                raise ValueError('ground_type should be provided')
+            # Get the mask of points which fall in the shape file(s)
+            if x.size > 0:
+                polygons = _read_polygons(self.input_shp, bbox,
+                                          records=self.input_records)
+                pc_mask = _get_polygons_mask(x, y, polygons,
+                                             cell_size=cell_size)
+            else:
+                pc_mask = np.zeros(0, dtype=bool)
+            value = ground_type
+
+        # Add the ground type feature
         laserchicken.utils.update_feature(self.point_cloud,
                                           feature_name='ground_type',
-                                          value=ground_type,
+                                          value=value,
                                           array_mask=pc_mask)
         # Clear the cached KDTree
         laserchicken.kd_tree.initialize_cache()
@@ -106,3 +156,143 @@ class Classification(PipelineRemoteData):
         export(self.point_cloud, export_path, overwrite=overwrite)
 
         return self
+
+    def _locate_shp(self, shp_dir, point_box, catalogue_file=None):
+        shp_path = self.input_folder / shp_dir
+
+        laserfarm.utils.check_dir_exists(shp_path, should_exist=True)
+
+        if catalogue_file is not None:
+            with ShapefileCatalogue(catalogue_file) as catalogue:
+                catalogue.update(shp_path)
+                records = catalogue.get_records(point_box.bounds,
+                                                directory=shp_path)
+            records = {pathlib.Path(shp): shp_records
+                       for shp, shp_records in records.items()}
+            return list(records.keys()), records
+
+        shp_files = []
+        for shp in sorted([f.absolute() for f in shp_path.iterdir()
+                           if f.suffix == '.shp']):
+            sf = shapefile.Reader(shp.as_posix())
+            mbr = shapely.geometry.box(*sf.bbox)
+
+            if point_box.intersects(mbr):
+                shp_files.append(shp)
+
+        return shp_files, {}
+
+
+# Average number of points per cell used to bin the points for classification
+_POINTS_PER_CELL = 1024
+
+
+def _check_priority(priority, classes):
+    for ground_type in classes:
+        if not 0 < ground_type < 256:
+            raise ValueError('Ground types should be in the range 1-255 for '
+                             'multi-class classification')
+    if priority is None:
+        return list(classes.keys())
+    priority = [int(ground_type) for ground_type in priority]
+    if sorted(priority) != sorted(classes.keys()):
+        raise ValueError('Priority should include all the ground types: '
+                         '{}'.format(', '.join(str(gt) for gt in classes)))
+    return priority
+
+
+def _read_polygons(shp_files, bbox, records=None):
+    """
+    Read the polygons overlapping a bounding box from a set of shapefiles.
+
+    :param shp_files: list of paths to the shapefiles
+    :param bbox: bounding box (xmin, ymin, xmax, ymax)
+    :param records: (optional) dictionary with the indices of the candidate
+    records for (some of) the shapefiles. Only these records are read.
+    :return: list of (valid) polygons, multi-polygons are split into parts
+    """
+    records = records if records is not None else {}
+    polygons = []
+    for shp in shp_files:
+        with shapefile.Reader(pathlib.Path(shp).as_posix()) as sf:
+            if shp in records:
+                shapes = (sf.shape(n, bbox=bbox) for n in records[shp])
+            else:
+                shapes = sf.iterShapes(bbox=bbox)
+            for record in shapes:
+                if record is not None:
+                    polygons.extend(_get_polygon_parts(shape(record)))
+    return polygons
+
+
+def _get_polygon_parts(geometry):
+    if geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+        raise ValueError('Geometry in shapefile is not a Polygon or '
+                         'MultiPolygon: {}'.format(geometry.geom_type))
+    if not geometry.is_valid:
+        raise ValueError('Invalid polygon in input')
+    return list(shapely.get_parts(geometry))
+
+
+def _get_polygons_mask(x, y, polygons, cell_size=None):
+    """
+    Identify the points contained in a set of polygons (points on the
+    boundaries are excluded).
+
+    :param x: X coordinates of the points
+    :param y: Y coordinates of the points
+    :param polygons: list of polygons
+    :param cell_size: size of the cells used to bin the points
+    :return: boolean mask of the points within the polygons
+    """
+    mask = np.zeros(x.size, dtype=bool)
+    if x.size == 0 or not polygons:
+        return mask
+
+    # Bin the points in a coarse grid, sorting the point indices by cell
+    xmin, ymin = np.min(x), np.min(y)
+    width, height = np.max(x) - xmin, np.max(y) - ymin
+    if cell_size is None:
+        cell_size = np.sqrt(width * height * _POINTS_PER_CELL / x.size)
+    cell_size = cell_size or max(width, height) or 1.
+    ny = int(height // cell_size) + 1
+    ix = ((x - xmin) // cell_size).astype(np.int64)
+    iy = ((y - ymin) // cell_size).astype(np.int64)
+    cells = ix * ny + iy
+    order = np.argsort(cells, kind='stable')
+    counts = np.bincount(cells)
+    starts = np.cumsum(counts) - counts
+
+    # Find the cells that intersect or that are fully within the polygons.
+    # Cells are slightly enlarged to safely include points on their edges
+    occupied = np.flatnonzero(counts)
+    cell_x = xmin + (occupied // ny) * cell_size
+    cell_y = ymin + (occupied % ny) * cell_size
+    margin = 1.e-6 * cell_size
+    boxes = shapely.box(cell_x - margin, cell_y - margin,
+                        cell_x + cell_size + margin,
+                        cell_y + cell_size + margin)
+    polygons = np.asarray(polygons, dtype=object)
+    shapely.prepare(polygons)
+    tree = shapely.STRtree(polygons)
+    cell_idx, polygon_idx = tree.query(boxes, predicate='intersects')
+    within = shapely.contains_properly(polygons[polygon_idx],
+                                       boxes[cell_idx])
+
+    def _get_points(cell_indices):
+        cell_indices = occupied[cell_indices]
+        return np.concatenate([order[start:start+count] for start, count
+                               in zip(starts[cell_indices],
+                                      counts[cell_indices])])
+
+    if np.any(within):
+        mask[_get_points(np.unique(cell_idx[within]))] = True
+
+    # Run the point-in-polygon test for the remaining points
+    cell_idx, polygon_idx = cell_idx[~within], polygon_idx[~within]
+    for n in np.unique(polygon_idx):
+        points = _get_points(cell_idx[polygon_idx == n])
+        points = points[~mask[points]]
+        mask[points[shapely.contains_xy(polygons[n], x[points],
+                                        y[points])]] = True
+    return mask
@@ -1,5 +1,8 @@
+import collections
+import concurrent.futures
 import inspect
 import logging
+from multiprocessing import shared_memory
 import numpy as np
 import pathlib
 
@@ -16,15 +19,27 @@ from laserchicken.io import io_handlers
 from laserchicken.kd_tree import initialize_cache
 from laserchicken.normalize import normalize
 from laserchicken.utils import create_point_cloud, add_to_point_cloud, \
-    get_point
+    copy_point_cloud, get_point
 
+from laserfarm.catalogue import PointCloudCatalogue
 from laserfarm.grid import Grid
+from laserfarm.kd_tree_cache import install_kd_tree_cache
+import laserfarm.parquet_handler  # add Parquet to the laserchicken formats
 from laserfarm.pipeline_remote_data import PipelineRemoteData
+from laserfarm.point_cloud_loader import list_las_attributes, \
+    load_las_files
 from laserfarm.utils import check_path_exists, check_file_exists, \
     check_dir_exists, DictToObj
 
 logger = logging.getLogger(__name__)
 
+# Point-cloud attributes employed by feature extractors, in addition to the
+# ones listed by the extractors themselves
+_EXTRA_REQUIRED_ATTRIBUTES = {
+    'DensityAbsoluteMeanFeatureExtractor': ['raw_classification'],
+    'PulsePenetrationFeatureExtractor': ['raw_classification'],
+}
+
 
 class DataProcessing(PipelineRemoteData):
     """ Read, process and write point cloud data using laserchicken. """
@@ -32,6 +47,8 @@ class DataProcessing(PipelineRemoteData):
     def __init__(self, input=None, label=None, tile_index=(None, None)):
         self.pipeline = ('add_custom_feature',
                          'add_custom_features',
+                         'set_catalogue',
+                         'set_kd_tree_cache',
                          'load',
                          'normalize',
                          'apply_filter',
@@ -49,6 +66,9 @@ class DataProcessing(PipelineRemoteData):
                                            select_equal,
                                            select_polygon]})
         self.extractors = DictToObj(_get_extractor_dict())
+        self.catalogue_file = None
+        self._custom_extractors = []
+        self._existing_features = []
         self._features = None
         self._tile_index = tile_index
         if input is not None:
@@ -77,6 +97,7 @@ class DataProcessing(PipelineRemoteData):
         _check_parameters_for_extractor(extractor, parameters)
         logger.info('Setting up feature extractor {}'.format(extractor_name))
         register_new_feature_extractor(extractor(**parameters))
+        self._custom_extractors.append((extractor_name, parameters))
         return self
 
     def add_custom_features(self, custom_feature_list):
@@ -90,18 +111,87 @@ class DataProcessing(PipelineRemoteData):
             self.add_custom_feature(**custom_feature)
         return self
 
-    def load(self, **load_opts):
+    def set_catalogue(self, catalogue_file):
+        """
+        Setup a catalogue of the input files (see the retiler). When loading
+        data for a given tile, input files whose bounding box does not overlap
+        the tile are skipped.
+
+        :param catalogue_file: path to an existing catalogue file, which is
+        opened when loading the data
         """
-        Read point cloud from disk.
+        check_file_exists(catalogue_file, should_exist=True)
+        self.catalogue_file = catalogue_file
+        return self
 
+    def set_kd_tree_cache(self, max_memory=1024**3, persist=False,
+                          cache_dir=None):
+        """
+        Setup a cache for the KD-trees employed to compute neighborhoods. The
+        cache is shared by all the tasks running in the same process, and the
+        trees are identified by the point-cloud coordinates, so that they are
+        not rebuilt when the same point cloud is processed again.
+
+        :param max_memory: Memory budget for the trees kept in memory (bytes).
+        The least recently used trees are dropped when exceeded
+        :param persist: If True, trees are also stored on disk and retrieved
+        in later runs
+        :param cache_dir: Directory where the trees are stored if persist is
+        True. Default is the 'kd_trees' directory next to the input files
+        """
+        if persist and cache_dir is None:
+            input_dir = (self.input_path if self.input_path.is_dir()
+                         else self.input_path.parent)
+            cache_dir = input_dir / 'kd_trees'
+        logger.info('Setting up KD-tree cache')
+        install_kd_tree_cache(max_memory, cache_dir if persist else None)
+        return self
+
+    def load(self, scratch_dir=None, n_threads=1, **load_opts):
+        """
+        Read point cloud from disk. LAS/LAZ files are read in one go into
+        preallocated arrays (one per attribute), other formats are read with
+        laserchicken one file at a time.
+
+        :param scratch_dir: (Optional) directory where to memory-map the
+        point-cloud arrays read from LAS/LAZ files
+        :param n_threads: Number of LAS/LAZ files decoded concurrently
         :param load_opts: Arguments passed to the laserchicken load function
+        (only 'attributes' is used for LAS/LAZ files). If the attributes are
+        not provided when running the pipeline, only the attributes required
+        by the following tasks are read from LAS/LAZ files
         """
         check_path_exists(self.input_path, should_exist=True)
         input_file_list = _get_input_file_list(self.input_path)
+        if self.catalogue_file is not None:
+            with PointCloudCatalogue(self.catalogue_file) as catalogue:
+                input_file_list = self._select_files_in_tile(input_file_list,
+                                                             catalogue)
         logger.info('Loading point cloud data ...')
-        for file in input_file_list:
-            logger.info('... loading {}'.format(file))
-            add_to_point_cloud(self.point_cloud, load(file, **load_opts))
+        if _is_las_input(input_file_list, load_opts):
+            logger.info('... loading {} LAS/LAZ file(s)'
+                        ''.format(len(input_file_list)))
+            if scratch_dir is not None:
+                check_dir_exists(scratch_dir, should_exist=True)
+            if 'attributes' not in load_opts and 'load' in self.input:
+                attributes = _get_pipeline_attributes(self.input)
+                if attributes is not None:
+                    available = list_las_attributes(input_file_list[0])
+                    load_opts['attributes'] = [a for a in attributes
+                                               if a in available]
+                    logger.info('... reading attributes: {}'.format(
+                        ', '.join(['x', 'y', 'z'] + load_opts['attributes'])
+                    ))
+            self.point_cloud = _merge_point_clouds(
+                self.point_cloud,
+                load_las_files(input_file_list, scratch_dir=scratch_dir,
+                               n_threads=n_threads, **load_opts)
+            )
+        else:
+            for file in input_file_list:
+                logger.info('... loading {}'.format(file))
+                self.point_cloud = _merge_point_clouds(self.point_cloud,
+                                                       load(file, **load_opts))
         logger.info('... loading completed.')
         return self
 
@@ -157,9 +247,10 @@ class DataProcessing(PipelineRemoteData):
         logger.info('... exporting completed.')
         return self
 
-    def generate_targets(self, min_x, min_y, max_x, max_y, n_tiles_side,
-                         tile_mesh_size, validate=True,
-                         validate_precision=None):
+    def generate_targets(self, min_x, min_y, max_x, max_y, n_tiles_side=None,
+                         tile_mesh_size=None, validate=True,
+                         validate_precision=None, n_tiles_x=None,
+                         n_tiles_y=None):
         """
         Generate the target point cloud.
 
@@ -175,9 +266,16 @@ class DataProcessing(PipelineRemoteData):
         to the same tile
         :param validate_precision: Optional precision threshold to determine
         whether point belong to tile
+        :param n_tiles_x: Number of tiles along X (alternative to n_tiles_side,
+        tiles can be rectangular)
+        :param n_tiles_y: Number of tiles along Y (alternative to n_tiles_side,
+        tiles can be rectangular)
         """
+        if tile_mesh_size is None:
+            raise ValueError('The target mesh size must be provided!')
         logger.info('Setting up the target grid')
-        self.grid.setup(min_x, min_y, max_x, max_y, n_tiles_side)
+        self.grid = Grid(min_x, min_y, max_x, max_y, n_tiles_side=n_tiles_side,
+                         n_tiles_x=n_tiles_x, n_tiles_y=n_tiles_y)
 
         if any([idx is None for idx in self._tile_index]):
             raise RuntimeError('Tile index not set!')
@@ -205,7 +303,8 @@ class DataProcessing(PipelineRemoteData):
         return self
 
     def extract_features(self, volume_type, volume_size, feature_names,
-                         sample_size=None):
+                         sample_size=None, block_size=None, n_processes=1,
+                         incremental=False):
         """
         Extract point-cloud features and assign them to the specified target
         point cloud.
@@ -214,9 +313,35 @@ class DataProcessing(PipelineRemoteData):
         :param volume_size: Size of the volume-related parameter (in m)
         :param feature_names: List of the feature names to be computed
         :param sample_size: Sample neighborhoods with a random subset of points
+        :param block_size: (Optional) side of the square blocks (in m) in which
+        the target points are split. Features are computed block by block,
+        using only the environment points within the block bounds plus the
+        volume size, to bound memory usage
+        :param n_processes: Number of processes computing the features of
+        different blocks in parallel. The environment point cloud is shared
+        among processes. If block_size is not given, the target points are
+        split in about four blocks per process. NOTE: processes cannot be
+        spawned from daemonic processes (e.g. Dask workers using processes)
+        :param incremental: If True, features that are found in the target
+        files previously exported for this tile (see export_targets) are read
+        from disk, and only the missing features are computed. All the
+        features stored in the existing target file are kept when this is
+        overwritten by export_targets
         """
+        if incremental:
+            feature_names = self._load_existing_features(feature_names)
+            if not feature_names:
+                logger.info('All features found in existing target files')
+                return self
         logger.info('Building volume of type {}'.format(volume_type))
         volume = build_volume(volume_type, volume_size)
+        if n_processes > 1 and block_size is None:
+            block_size = _get_block_size(self.targets, 4 * n_processes)
+        if block_size is not None:
+            return self._extract_features_in_blocks(volume_type, volume_size,
+                                                    feature_names,
+                                                    sample_size, block_size,
+                                                    n_processes)
         logger.info('Constructing neighborhoods')
         neighborhoods = compute_neighborhoods(self.point_cloud,
                                               self.targets,
@@ -231,6 +356,52 @@ class DataProcessing(PipelineRemoteData):
         logger.info('... feature extraction completed.')
         return self
 
+    def _extract_features_in_blocks(self, volume_type, volume_size,
+                                    feature_names, sample_size, block_size,
+                                    n_processes=1):
+        if not block_size > 0.:
+            raise ValueError('Block size should be > 0.!')
+        x_trgts, y_trgts, _ = get_point(self.targets, ...)
+        blocks = _get_blocks(x_trgts, y_trgts, block_size)
+        env_indices = _get_env_indices(self.point_cloud, self.targets, blocks,
+                                       volume_size)
+        trgts_blocks = (copy_point_cloud(self.targets, trgt_indices)
+                        for trgt_indices in blocks)
+        task_args = (volume_type, volume_size, feature_names, sample_size)
+        if n_processes > 1:
+            logger.info('Starting feature extraction in {} blocks with {} '
+                        'processes ...'.format(len(blocks), n_processes))
+            shared_memory_blocks, arrays = _copy_to_shared_memory(
+                self.point_cloud
+            )
+            results = _compute_features_in_processes(
+                arrays, self.point_cloud.get(laserchicken.keys.provenance, []),
+                trgts_blocks, env_indices, task_args, n_processes,
+                self._custom_extractors
+            )
+            try:
+                features, log_entries = _gather_block_features(
+                    blocks, results, x_trgts.size
+                )
+            finally:
+                results.close()
+                _release_shared_memory(shared_memory_blocks)
+        else:
+            logger.info('Starting feature extraction in {} blocks '
+                        '...'.format(len(blocks)))
+            results = (_compute_features_for_block(
+                copy_point_cloud(self.point_cloud, indices), trgts_block,
+                *task_args
+            ) for trgts_block, indices in zip(trgts_blocks, env_indices))
+            features, log_entries = _gather_block_features(blocks, results,
+                                                           x_trgts.size)
+        self.targets[laserchicken.keys.point].update(features)
+        if log_entries:
+            self.targets.setdefault(laserchicken.keys.provenance, [])
+            self.targets[laserchicken.keys.provenance].extend(log_entries)
+        logger.info('... feature extraction completed.')
+        return self
+
     def export_targets(self, filename='', attributes='all',
                        multi_band_files=True, **export_opts):
         """
@@ -240,10 +411,27 @@ class DataProcessing(PipelineRemoteData):
         :param attributes: List of attributes to be written in the output file
         :param multi_band_files: If true, write all attributes in one file
         :param export_opts: Optional arguments passed to the laserchicken
-                            export function
+                            export function. Use format='.parquet' to write
+                            the targets in columnar format (one compressed
+                            column per feature)
         """
         expath = self._get_export_path(filename)
         file_handle = 'tile_{}_{}'.format(*self._tile_index)
+        if self._existing_features:
+            # features read from existing target files (incremental mode)
+            attributes = self._get_target_attributes(attributes)
+            if multi_band_files:
+                logger.info('Target file including existing features is '
+                            'overwritten')
+                attributes += [f for f in self._existing_features
+                               if f not in attributes]
+                export_opts.update(overwrite=True)
+            else:
+                attributes = [a for a in attributes
+                              if a not in self._existing_features]
+                if not attributes:
+                    logger.info('No new feature to export')
+                    return self
         logger.info('Exporting target point-cloud ...')
         self._export(self.targets, expath, attributes, multi_band_files,
                      file_handle, **export_opts)
@@ -251,7 +439,10 @@ class DataProcessing(PipelineRemoteData):
         return self
 
     def clear_cache(self):
-        """ Clear KDTree's cached by Laserchicken. """
+        """
+        Clear KDTree's cached by Laserchicken. Trees in the laserfarm cache
+        (see set_kd_tree_cache) are kept, since its memory usage is bounded.
+        """
         logger.info('Clearing cached KDTrees ...')
         initialize_cache()
         return self
@@ -279,6 +470,83 @@ class DataProcessing(PipelineRemoteData):
             logger.info('... exporting {}'.format(file))
             export(point_cloud, file, attributes=feature_set, **export_opts)
 
+    def _select_files_in_tile(self, files, catalogue):
+        """
+        Skip the input files that the catalogue reports as not overlapping
+        the current tile. Files that are not in the catalogue (e.g. the
+        output of the retiler, when the catalogue lists the files that have
+        been retiled) are always loaded.
+        """
+        if any([idx is None for idx in self._tile_index]):
+            raise RuntimeError('Tile index not set!')
+        catalogued = set(catalogue.get_files())
+        in_tile = set(catalogue.get_files(*self._tile_index))
+        paths = [pathlib.Path(f).absolute().as_posix() for f in files]
+        if not catalogued.intersection(paths):
+            logger.warning('None of the input files is in the catalogue: '
+                           'loading all of them')
+            return files
+        selected = [f for f, path in zip(files, paths)
+                    if path in in_tile or path not in catalogued]
+        if not selected:
+            raise FileNotFoundError('No input file overlaps tile '
+                                    '({},{})'.format(*self._tile_index))
+        logger.info('{} out of {} input files overlap tile '
+                    '({},{})'.format(len(selected), len(files),
+                                     *self._tile_index))
+        return selected
+
+    def _load_existing_features(self, feature_names):
+        """
+        Read the requested features from the target files exported for the
+        current tile, returning the list of the features still to compute.
+        """
+        export_input = self.input.get('export_targets', {})
+        if not isinstance(export_input, dict):
+            export_input = {}
+        path = pathlib.Path(
+            self._get_export_path(export_input.get('filename', ''))
+        )
+        file_handle = 'tile_{}_{}'.format(*self._tile_index)
+        suffix = export_input.get('format', '.ply')
+        if path.suffix:
+            files = [path]
+        else:
+            files = [(path / file_handle).with_suffix(suffix)]
+            files += [(path / feature / file_handle).with_suffix(suffix)
+                      for feature in feature_names]
+        x_trgts, y_trgts, _ = get_point(self.targets, ...)
+        points = self.targets[laserchicken.keys.point]
+        for n, file in enumerate(files):
+            missing = [f for f in feature_names
+                       if f not in self._existing_features]
+            # the first file (including all features) is always read, since
+            # it is overwritten when exporting: features that are stored but
+            # not requested in this run should not be lost
+            if not file.is_file() or (n > 0 and not missing):
+                continue
+            targets = load(file.as_posix())
+            x, y, _ = get_point(targets, ...)
+            if x.shape != x_trgts.shape or not (np.allclose(x, x_trgts)
+                                                and np.allclose(y, y_trgts)):
+                logger.warning('Targets in {} do not match the current '
+                               'ones, file ignored'.format(file))
+                continue
+            for feature, attribute in targets[laserchicken.keys.point].items():
+                if feature not in ('x', 'y', 'z') and feature not in points:
+                    points[feature] = attribute
+                    self._existing_features.append(feature)
+        if self._existing_features:
+            logger.info('Features read from existing target files: '
+                        '{}'.format(', '.join(self._existing_features)))
+        return [f for f in feature_names if f not in self._existing_features]
+
+    def _get_target_attributes(self, attributes='all'):
+        if attributes == 'all':
+            return [f for f in self.targets[laserchicken.keys.point].keys()
+                    if f not in 'xyz']
+        return list(attributes)
+
     def _get_export_path(self, filename=''):
         check_dir_exists(self.output_folder, should_exist=True)
         if pathlib.Path(filename).parent.name:
@@ -318,10 +586,233 @@ def _get_required_attributes(features=[]):
     attributes = []
     for feature, extractor in list_feature_names().items():
         if feature in features:
-            attributes += extractor.requires()
+            required = list(extractor.requires())
+            data_key = getattr(extractor, 'data_key', None)
+            if data_key is not None:
+                required.append(data_key)
+            required += _EXTRA_REQUIRED_ATTRIBUTES.get(
+                extractor.__class__.__name__, []
+            )
+            attributes += [a for a in required if a not in attributes]
+    return attributes
+
+
+def _get_pipeline_attributes(input):
+    """
+    Determine the point-cloud attributes required by the tasks configured in
+    the pipeline input (besides x, y and z). None is returned if all
+    attributes might be needed.
+    """
+    attributes = []
+    for task, args in input.items():
+        if task not in ('apply_filter', 'export_point_cloud',
+                        'extract_features'):
+            continue
+        if not isinstance(args, dict):
+            return None
+        if task == 'apply_filter':
+            required = [args['attribute']] if 'attribute' in args else []
+            if args.get('filter_type') != 'select_polygon' and not required:
+                return None
+        elif task == 'export_point_cloud':
+            required = args.get('attributes', 'all')
+            if required == 'all' or 'all' in required:
+                return None
+        else:
+            if 'feature_names' not in args:
+                return None
+            required = _get_required_attributes(args['feature_names'])
+        attributes += [a for a in required
+                       if a not in attributes and a not in ('x', 'y', 'z')]
     return attributes
 
 
+def _get_blocks(x, y, block_size):
+    """ Group point indices in square blocks of given size. """
+    if x.size == 0:
+        return []
+    block_x = np.floor((x - x.min()) / block_size).astype(np.int64)
+    block_y = np.floor((y - y.min()) / block_size).astype(np.int64)
+    block_ids = block_x * (block_y.max() + 1) + block_y
+    order = np.argsort(block_ids, kind='stable')
+    _, starts = np.unique(block_ids[order], return_index=True)
+    return np.split(order, starts[1:])
+
+
+def _get_range(coords, margin):
+    return coords.min() - margin, coords.max() + margin
+
+
+def _get_block_size(point_cloud, n_blocks):
+    """ Side of the square blocks splitting a point cloud in ~n_blocks. """
+    x, y, _ = get_point(point_cloud, ...)
+    if x.size == 0:
+        return 1.
+    extent = max(np.ptp(x), np.ptp(y))
+    n_blocks_side = np.ceil(np.sqrt(n_blocks))
+    return extent / n_blocks_side if extent > 0. else 1.
+
+
+def _get_env_indices(env_point_cloud, target_point_cloud, blocks, margin):
+    """
+    For each block of target points, yield the indices of the environment
+    points within the block bounds plus a margin.
+    """
+    x_trgts, y_trgts, _ = get_point(target_point_cloud, ...)
+    x_env, y_env, _ = get_point(env_point_cloud, ...)
+    # sort environment points along X to select them by block quickly
+    env_order = np.argsort(x_env, kind='stable')
+    x_env_sorted = x_env[env_order]
+    for trgt_indices in blocks:
+        min_x, max_x = _get_range(x_trgts[trgt_indices], margin)
+        min_y, max_y = _get_range(y_trgts[trgt_indices], margin)
+        env_indices = env_order[np.searchsorted(x_env_sorted, min_x):
+                                np.searchsorted(x_env_sorted, max_x,
+                                                side='right')]
+        y_block = y_env[env_indices]
+        yield np.sort(env_indices[(y_block >= min_y) & (y_block <= max_y)])
+
+
+def _compute_features_for_block(env_point_cloud, target_point_cloud,
+                                volume_type, volume_size, feature_names,
+                                sample_size):
+    """
+    Compute features for a block of target points, returning the new target
+    attributes and the new provenance entries.
+    """
+    volume = build_volume(volume_type, volume_size)
+    attributes = list(target_point_cloud[laserchicken.keys.point].keys())
+    n_logs = len(target_point_cloud.get(laserchicken.keys.provenance, []))
+    neighborhoods = compute_neighborhoods(env_point_cloud,
+                                          target_point_cloud,
+                                          volume,
+                                          sample_size=sample_size)
+    compute_features(env_point_cloud,
+                     neighborhoods,
+                     target_point_cloud,
+                     feature_names,
+                     volume,
+                     verbose=False)
+    features = {name: attribute for name, attribute
+                in target_point_cloud[laserchicken.keys.point].items()
+                if name not in attributes}
+    logs = target_point_cloud.get(laserchicken.keys.provenance, [])[n_logs:]
+    return features, logs
+
+
+def _gather_block_features(blocks, results, n_targets):
+    """
+    Assemble the features computed for the blocks of target points into
+    arrays for all the target points.
+    """
+    features = {}
+    log_entries = None
+    for trgt_indices, (features_block, logs) in zip(blocks, results):
+        if log_entries is None:
+            # provenance is taken from the first block only
+            log_entries = logs
+        for name, attribute in features_block.items():
+            if name not in features:
+                features[name] = {
+                    'type': attribute['type'],
+                    'data': np.zeros(n_targets,
+                                     dtype=attribute['data'].dtype)
+                }
+            features[name]['data'][trgt_indices] = attribute['data']
+    return features, log_entries
+
+
+def _copy_to_shared_memory(point_cloud):
+    """
+    Copy the point-cloud arrays to shared memory. The shared memory blocks
+    should be released with _release_shared_memory.
+
+    :return: list of shared memory blocks, dictionary with the attribute
+    names as keys and (block name, shape, dtype, type) as values
+    """
+    shared_memory_blocks = []
+    arrays = {}
+    try:
+        for name, attribute in point_cloud[laserchicken.keys.point].items():
+            data = np.ascontiguousarray(attribute['data'])
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=max(data.nbytes, 1))
+            shared_memory_blocks.append(shm)
+            np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[:] = data
+            arrays[name] = (shm.name, data.shape, data.dtype.str,
+                            attribute['type'])
+    except BaseException:
+        _release_shared_memory(shared_memory_blocks)
+        raise
+    return shared_memory_blocks, arrays
+
+
+def _release_shared_memory(shared_memory_blocks):
+    for shm in shared_memory_blocks:
+        shm.close()
+        shm.unlink()
+
+
+def _compute_features_in_processes(arrays, logs, target_blocks, env_indices,
+                                   task_args, n_processes,
+                                   custom_extractors=()):
+    """
+    Compute features for blocks of target points in a pool of processes,
+    yielding the results in the order of the blocks. The environment
+    point-cloud arrays are read from shared memory (see
+    _copy_to_shared_memory), and each process selects the points of a block
+    from there. At most 2 * n_processes blocks are submitted at any time, so
+    that only a few blocks of target points and environment indices are held
+    in memory. Pending blocks are cancelled when the generator is closed.
+    """
+    max_pending = 2 * n_processes
+    executor = concurrent.futures.ProcessPoolExecutor(
+        n_processes,
+        initializer=_init_feature_worker,
+        initargs=(arrays, logs, list(custom_extractors))
+    )
+    try:
+        pending = collections.deque()
+        for target_block, indices in zip(target_blocks, env_indices):
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(executor.submit(_compute_features_in_worker,
+                                           target_block, indices, task_args))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Environment point cloud of the feature-extraction worker processes, with
+# arrays backed by shared memory
+_worker_point_cloud = {}
+_worker_shared_memory = []
+
+
+def _init_feature_worker(arrays, logs, custom_extractors):
+    extractors = _get_extractor_dict()
+    for extractor_name, parameters in custom_extractors:
+        register_new_feature_extractor(
+            extractors[extractor_name](**parameters)
+        )
+    points = {}
+    for name, (shm_name, shape, dtype, type_name) in arrays.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_shared_memory.append(shm)
+        points[name] = {'type': type_name,
+                        'data': np.ndarray(shape, dtype=dtype,
+                                           buffer=shm.buf)}
+    _worker_point_cloud.update({laserchicken.keys.point: points,
+                                laserchicken.keys.provenance: logs})
+
+
+def _compute_features_in_worker(target_point_cloud, env_indices, task_args):
+    env_point_cloud = copy_point_cloud(_worker_point_cloud, env_indices)
+    return _compute_features_for_block(env_point_cloud, target_point_cloud,
+                                       *task_args)
+
+
 def _get_input_file_list(p):
     check_path_exists(p, should_exist=True)
     if p.is_file():
@@ -336,6 +827,23 @@ def _get_input_file_list(p):
     return files
 
 
+def _merge_point_clouds(point_cloud, other):
+    """
+    Add the points of other to point_cloud. If point_cloud is empty, other is
+    returned as it is, so that its (possibly memory-mapped) arrays are not
+    copied.
+    """
+    if len(point_cloud[laserchicken.keys.point]['x']['data']) == 0:
+        return other
+    return add_to_point_cloud(point_cloud, other)
+
+
+def _is_las_input(files, load_opts):
+    return (all([pathlib.Path(f).suffix.lower() in ('.las', '.laz')
+                 for f in files])
+            and set(load_opts.keys()).issubset({'attributes'}))
+
+
 def _check_point_cloud_is_not_empty(point_cloud):
     pts = point_cloud['vertex']
     if not all([pts[attr]['data'].size > 0 for attr in pts.keys()]):
@@ -1,22 +1,38 @@
+import concurrent.futures
+import functools
+import json
 import logging
 import os
-import plyfile
+import pathlib
+import re
 import numpy
+import tempfile
+import threading
 import time
 
 from osgeo import osr, gdal
 
+from laserfarm.grid import Grid
+from laserfarm.parquet_handler import read_parquet_columns
+from laserfarm.ply_reader import read_ply_columns
 from laserfarm.utils import check_dir_exists
 from laserfarm.pipeline_remote_data import PipelineRemoteData
 
 logger = logging.getLogger(__name__)
 
+# Sidecar file with the number of points and the extent of the tiles
+_MANIFEST_FILENAME = 'geotiff_writer_manifest.json'
+_MANIFEST_VERSION = 1
+# Serialize the updates of the manifest files by the threads of a process
+_manifest_lock = threading.Lock()
+
 
 class GeotiffWriter(PipelineRemoteData):
     """ Write specified bands from point cloud data into separate geotiff files. """
 
     def __init__(self, input_dir=None, bands=None, label=None):
-        self.pipeline = ('parse_point_cloud',
+        self.pipeline = ('set_grid',
+                         'parse_point_cloud',
                          'data_split',
                          'create_subregion_geotiffs')
         self.InputTiles = []
@@ -24,6 +40,9 @@ class GeotiffWriter(PipelineRemoteData):
         self.LengthDataRecord = 0
         self.xResolution = 0
         self.yResolution = 0
+        self.format = '.ply'
+        self.tileExtents = None
+        self.grid = Grid()
         if input_dir is not None:
             self.input_path = input_dir
         if bands is not None:
@@ -31,47 +50,95 @@ class GeotiffWriter(PipelineRemoteData):
         if label is not None:
             self.label = label
 
-    def parse_point_cloud(self):
+    def set_grid(self, min_x, min_y, max_x, max_y, n_tiles_side=None,
+                 n_tiles_x=None, n_tiles_y=None):
+        """
+        Setup the grid employed to tile the point-cloud data. If set, the
+        sub-regions are defined on the grid, and the position of the tiles in
+        the geotiffs is determined from the grid rather than from the input
+        point coordinates.
+
+        :param min_x: min x value of tiling schema
+        :param min_y: min y value of tiling schema
+        :param max_x: max x value of tiling schema
+        :param max_y: max y value of tiling schema
+        :param n_tiles_side: number of tiles along axis (square tiling)
+        :param n_tiles_x: number of tiles along X (alternative to n_tiles_side,
+        tiles can be rectangular)
+        :param n_tiles_y: number of tiles along Y (alternative to n_tiles_side,
+        tiles can be rectangular)
+        """
+        logger.info('Setting up the grid')
+        self.grid = Grid(min_x, min_y, max_x, max_y, n_tiles_side=n_tiles_side,
+                         n_tiles_x=n_tiles_x, n_tiles_y=n_tiles_y)
+        return self
+
+    def parse_point_cloud(self, format='.ply', manifest=False):
         """
         Parse input point cloud and get the following information:
             - Tile list
             - Length of a single band
             - x and y resolution
+
+        :param format: (Optional) format of the input tiles, either '.ply'
+        (default) or '.parquet'. For Parquet files, only the columns of the
+        bands exported are read from disk
+        :param manifest: (Optional) If true, the number of points and the
+        extent of the tiles are read from (and stored in) a manifest file in
+        the input directory, so that the tiles are parsed only once (tiles
+        modified after the manifest was written are parsed again). The tile
+        extents are also employed to set up the geotiffs' coordinate frames
         """
         check_dir_exists(self.input_path, should_exist=True)
+        format = format.lower()
+        if format not in _readers:
+            raise ValueError('Unsupported format: {}'.format(format))
+        self.format = format
 
         # Get list of input tiles
         self.InputTiles = [TileFile
                            for TileFile in os.listdir(self.input_path)
-                           if TileFile.lower().endswith('.ply')]
+                           if TileFile.lower().endswith(format)]
         if not self.InputTiles:
-            raise IOError('No PLY file in dir: {}'.format(self.input_path))
+            raise IOError('No {} file in dir: {}'.format(
+                format.strip('.').upper(), self.input_path))
         else:
-            logger.info('{} PLY files found'.format(len(self.InputTiles)))
-
-        # Read one tile and get the template
-        file = os.path.join(self.input_path, self.InputTiles[0])
-        template = plyfile.PlyData.read(file)
-        if not template.elements[0].name == 'vertex':
-            raise ValueError('Tile PLY file should '
-                             'have vertex as first object')
+            logger.info('{} {} files found'.format(
+                len(self.InputTiles), format.strip('.').upper()))
+
+        # Get the template from the manifest or from one of the tiles
+        if manifest:
+            tiles = _updateManifest(self.input_path, self.InputTiles, format)
+            self.tileExtents = {tile: (tiles[tile]['min'], tiles[tile]['max'])
+                                for tile in self.InputTiles}
+            template = tiles[self.InputTiles[0]]
+        else:
+            self.tileExtents = None
+            file = os.path.join(self.input_path, self.InputTiles[0])
+            template = _getTileStats(file, format)
 
         # Get length of data record (Nr. of elements in each band)
-        self.LengthDataRecord = len(template.elements[0].data)
+        self.LengthDataRecord = template['n_points']
         logger.info('No. of points per file: {}'.format(self.LengthDataRecord))
 
-        # Get resolution, assume a square tile
-        delta_x = (template.elements[0].data['x'].max()
-                   - template.elements[0].data['x'].min())
-        delta_y = (template.elements[0].data['y'].max()
-                   - template.elements[0].data['y'].min())
+        # Get resolution: the tiles are regular meshes of points with square
+        # cells, but they can be rectangular (e.g. for rectangular grids)
+        delta_x = template['max'][0] - template['min'][0]
+        delta_y = template['max'][1] - template['min'][1]
         if numpy.isclose(delta_x, 0.) or numpy.isclose(delta_y, 0.):
             raise ValueError('Tile should have finite extend in X and Y!')
-        self.xResolution = (delta_x / (numpy.sqrt(template.elements[0].data['x'].size) - 1))
-        self.yResolution = (delta_y / (numpy.sqrt(template.elements[0].data['y'].size) - 1))
-        if not (numpy.isclose(self.xResolution, self.yResolution) and
-                numpy.isclose(delta_x, delta_y)):
-            raise ValueError('Tile read is not square!')
+        n_points = template['n_points']
+        if self.grid.is_set:
+            tile_width_x, tile_width_y = self.grid.tile_width
+            resolution = numpy.sqrt(tile_width_x * tile_width_y / n_points)
+        else:
+            resolution = _getResolution(delta_x, delta_y, n_points)
+        n_cells = numpy.array([delta_x, delta_y]) / resolution + 1
+        if not (numpy.allclose(n_cells, numpy.rint(n_cells))
+                and numpy.prod(numpy.rint(n_cells)) == n_points):
+            raise ValueError('Tile read is not a regular mesh of points!')
+        self.xResolution = resolution
+        self.yResolution = resolution
 
         logger.info('Resolution: ({}m x {}m)'.format(self.xResolution,
                                                      self.yResolution))
@@ -79,76 +146,38 @@ class GeotiffWriter(PipelineRemoteData):
 
     def data_split(self, xSub, ySub):
         """
-        Split the input data into sub-regions
+        Split the input data into sub-regions. If the grid is set, the
+        sub-regions partition the grid, otherwise they partition the range of
+        tile indices spanned by the input tiles.
 
         :param xSub: number of sub-regions in horizontal direction
         :param ySub: number of sub-regions in vertical direction
         """
-        xcoord = []
-        ycoord = []
         if not self.InputTiles:
             raise ValueError('Input tile list is empty!')
-        for f in self.InputTiles:
-            comp = f.split('_')
-            xc = comp[1]
-            yc = comp[2].split('.')[0]
-            xcoord.append(xc)
-            ycoord.append(yc)
-
-        # Tile index list
-        xcint = list(map(float, xcoord))
-        ycint = list(map(float, ycoord))
-        # Extent of the tiles
-        maxxc = max(xcint)
-        minxc = min(xcint)
-        maxyc = max(ycint)
-        minyc = min(ycint)
-        # Range tile index
-        xcRange = maxxc - minxc + 1
-        ycRange = maxyc - minyc + 1
-        # Range of each sub-region
-        xcSubRange = numpy.floor(xcRange / xSub)
-        ycSubRange = numpy.floor(ycRange / ySub)
-
-        # Loop per sub-region, find relevant tile of this new tile
-        # Start from bottom left
+        if self.grid.is_set:
+            xcint, ycint = _getGridTileIndices(self.grid, self.InputTiles)
+            xcRange = (0, self.grid.n_tiles_x - 1)
+            ycRange = (0, self.grid.n_tiles_y - 1)
+        else:
+            xcint, ycint = _getTileIndices(self.InputTiles)
+            xcRange = (xcint.min(), xcint.max())
+            ycRange = (ycint.min(), ycint.max())
+
+        # Sub-region of each tile, start from bottom left
         logger.info('Splitting data into ({}x{}) sub-regions'.format(xSub,
                                                                      ySub))
-        for i in range(xSub):
-            for j in range(ySub):
-                if i != xSub - 1 and j != ySub - 1:
-                    # Not the last line/colunm
-                    # Include left/bottom; Exclude right/up
-                    # [Left, Right): [minxc + i*xcSubRange, minxc + (i+1)*xcSubRange);
-                    # [Bottom, top): [minyc + j*ycSubRange, minyc + (j+1)*ycSubRange);
-                    subtiles = [f for k, f in enumerate(self.InputTiles)
-                                if ((minxc + i * xcSubRange) <= xcint[k] < (minxc + (i + 1) * xcSubRange)
-                                and (minyc + j * ycSubRange) <= ycint[k] < (minyc + (j + 1) * ycSubRange))]
-                if i == xSub - 1 and j == ySub - 1:
-                    # top right corner
-                    # [Left, right]: [minxc + i*xcSubRange; maxxc];
-                    # [Bottom, top]: [minyc + j*ycSubRange; maxyc];
-                    subtiles = [f for k, f in enumerate(self.InputTiles)
-                                if ((minxc + i * xcSubRange) <= xcint[k] <= maxxc
-                                and (minyc + j * ycSubRange) <= ycint[k] <= maxyc)]
-                if i != xSub - 1 and j == ySub - 1:
-                    # Top line but not top right corner
-                    # [Left, right]: [minxc + i*xcSubRange; minxc + (i+1)*xcSubRange];
-                    # [Bottom, top]: [minyc + j*ycSubRange; maxyc];
-                    subtiles = [f for k, f in enumerate(self.InputTiles)
-                                if ((minxc + i * xcSubRange) <= xcint[k] < (minxc + (i + 1) * xcSubRange)
-                                and (minyc + j * ycSubRange) <= ycint[k] <= maxyc)]
-                if i == xSub - 1 and j != ySub - 1:
-                    # Right colunm but not top right corner
-                    # [Left, right]: [minxc + i*xcSubRange; maxxc];
-                    # [Bottom, top]: [minyc + j*ycSubRange; minyc + (j+1)*ycSubRange];
-                    subtiles = [f for k, f in enumerate(self.InputTiles)
-                                if ((minxc + i * xcSubRange) <= xcint[k] <= maxxc
-                                and (minyc + j * ycSubRange) <= ycint[k] < (minyc + (j + 1) * ycSubRange))]
-                self.subtilelists.append(subtiles)
+        subRegion = (_getSubRegionIndex(xcint, xcRange, xSub) * ySub
+                     + _getSubRegionIndex(ycint, ycRange, ySub))
+        self.subtilelists = [[] for _ in range(xSub * ySub)]
+        for tile, k in zip(self.InputTiles, subRegion):
+            self.subtilelists[k].append(tile)
         return self
 
-    def create_subregion_geotiffs(self, output_handle, EPSG=28992):
+    def create_subregion_geotiffs(self, output_handle, EPSG=28992,
+                                  multi_band_files=False, streaming=False,
+                                  cog=False, compress='LZW', predictor=None,
+                                  n_threads=1):
         """
         Export geotiff per sub-region, loop in band dimension
 
@@ -156,64 +185,120 @@ class GeotiffWriter(PipelineRemoteData):
         as <output_handle>_TILE_<tile ID>_BAND_<band name>
         :param EPSG: (Optional) EPSG code of the spatial reference system of
         the input data. Default 28992.
+        :param multi_band_files: (Optional) If true, write all bands in a
+        single (tiled) geotiff per sub-region, named as
+        <output_handle>_TILE_<tile ID>. Input tiles are then read only once.
+        :param streaming: (Optional) If true, the (tiled) geotiffs are created
+        empty and each input tile is written as a window, so that memory usage
+        is bounded by the size of an input tile rather than by the size of the
+        sub-region. Empty regions are stored as sparse blocks of no-data values.
+        :param cog: (Optional) If true, write Cloud-Optimized GeoTIFFs
+        (internally tiled, with overviews)
+        :param compress: (Optional) Compression method of the COG files.
+        Default LZW.
+        :param predictor: (Optional) Predictor employed for the compression of
+        the COG files (e.g. 'FLOATING_POINT'). Default no predictor.
+        :param n_threads: (Optional) Number of sub-regions processed
+        concurrently. Default 1.
         """
         check_dir_exists(self.output_folder, should_exist=True)
         outfilestem = os.path.join(self.output_folder.as_posix(),
                                    output_handle)
-        for subTiffNumber in range(len(self.subtilelists)):
-            infiles = self.subtilelists[subTiffNumber]
-            logger.info('Processing sub-region GeoTiff no. {} '
-                        '...'.format(subTiffNumber))
-            logger.info('... number of constituent tiles: '
-                        '{}'.format(len(infiles)))
-            if infiles:
-                outfile = '{}_TILE_{:03d}'.format(outfilestem, subTiffNumber)
-                _make_geotiff_per_band(infiles,
-                                       outfile,
-                                       self.bands,
-                                       self.input_path.as_posix(),
-                                       self.LengthDataRecord,
-                                       self.xResolution,
-                                       self.yResolution,
-                                       EPSG)
-            else:
-                logger.warning(
-                    'No data in sub-region no. ' + str(subTiffNumber))
-            logger.info('... processing of sub-region completed.')
+        if streaming:
+            make_geotiff = functools.partial(_make_geotiff_streaming,
+                                             multi_band_files=multi_band_files)
+        elif multi_band_files:
+            make_geotiff = _make_multi_band_geotiff
+        else:
+            make_geotiff = _make_geotiff_per_band
+        if self.grid.is_set:
+            make_geotiff = functools.partial(make_geotiff, grid=self.grid)
+        elif self.tileExtents is not None:
+            make_geotiff = functools.partial(make_geotiff,
+                                             tileExtents=self.tileExtents)
+        if cog:
+            make_geotiff = functools.partial(_make_cog, make_geotiff,
+                                             compress=compress,
+                                             predictor=predictor)
+        make_subregion_geotiff = functools.partial(
+            self._make_subregion_geotiff, make_geotiff, outfilestem, EPSG
+        )
+        subTiffNumbers = range(len(self.subtilelists))
+        if n_threads > 1 and len(self.subtilelists) > 1:
+            # GDAL releases the GIL while compressing and writing data
+            logger.info('Processing sub-regions using {} '
+                        'threads'.format(n_threads))
+            with concurrent.futures.ThreadPoolExecutor(n_threads) as executor:
+                futures = [executor.submit(make_subregion_geotiff, number)
+                           for number in subTiffNumbers]
+                for future in futures:
+                    future.result()
+        else:
+            for subTiffNumber in subTiffNumbers:
+                make_subregion_geotiff(subTiffNumber)
         return self
 
+    def _make_subregion_geotiff(self, make_geotiff, outfilestem, EPSG,
+                                subTiffNumber):
+        infiles = self.subtilelists[subTiffNumber]
+        logger.info('Processing sub-region GeoTiff no. {} '
+                    '...'.format(subTiffNumber))
+        logger.info('... number of constituent tiles: '
+                    '{}'.format(len(infiles)))
+        if infiles:
+            outfile = '{}_TILE_{:03d}'.format(outfilestem, subTiffNumber)
+            make_geotiff(infiles,
+                         outfile,
+                         self.bands,
+                         self.input_path.as_posix(),
+                         self.LengthDataRecord,
+                         self.xResolution,
+                         self.yResolution,
+                         EPSG,
+                         self.format)
+        else:
+            logger.warning(
+                'No data in sub-region no. ' + str(subTiffNumber))
+        logger.info('... processing of sub-region no. {} '
+                    'completed.'.format(subTiffNumber))
+
+
+def _make_cog(make_geotiff, *args, compress='LZW', predictor=None, **kwargs):
+    outfiles = make_geotiff(*args, **kwargs)
+    for file in outfiles:
+        _convertToCOG(file, compress, predictor)
+    return outfiles
 
-def _make_geotiff_per_band(infiles, outfile, band_export, data_directory,
-                           lengthDataRecord, xResolution, yResolution, EPSG):
-    # Set the coordinate frame
-    logger.debug('... setting the coordinate frame')
-    xyData = _plyIntoNumpyArray(data_directory, infiles, lengthDataRecord,
-                                ['x', 'y'])
-    # Shift the coordinates to the center of the cell
-    xyDataShifted = _shiftTerrain(xyData, xResolution, yResolution)
-    geoTransform, arrayinfo = _getGeoTransform(xyDataShifted,
-                                               xResolution,
-                                               yResolution)
-    # GeoCoding: get the index of each point in the raster
-    indexX, indexY = _getGeoCoding(xyDataShifted, arrayinfo)
-    ncols = int(arrayinfo[3])
-    nrows = int(arrayinfo[7])
 
+def _make_geotiff_per_band(infiles, outfile, band_export, data_directory,
+                           lengthDataRecord, xResolution, yResolution, EPSG,
+                           format='.ply', grid=None, tileExtents=None):
+    geoTransform, indexX, indexY, ncols, nrows = _getRasterFrame(
+        infiles, data_directory, lengthDataRecord, xResolution, yResolution,
+        format, grid, tileExtents
+    )
+    # Position of the points in the (flattened) raster, for all bands
+    flatIndex = _getFlatIndex(indexX, indexY, ncols)
+    del indexX, indexY
+    RasterData = numpy.empty((nrows, ncols), dtype='float32')
+    RasterDataFlat = RasterData.reshape(-1)
+
+    outfiles = []
     for band_name in band_export:
         if band_name not in ['x', 'y']:
             logger.debug('... creating GeoTiff for band {!s}'.format(band_name))
             ct0 = time.time()
 
-            # Import one band from PLY
+            # Import one band from the tiles, and convert from pointcloud to
+            # raster
             logger.debug('... importing data')
-            terrainDataOneBand = _plyIntoNumpyArray(data_directory,
-                                                    infiles,
-                                                    lengthDataRecord,
-                                                    [band_name])
-
-            # Convert from pointcloud to raster
-            RasterData = numpy.full((nrows, ncols), numpy.nan)
-            RasterData[indexY, indexX] = terrainDataOneBand[:, 0]
+            RasterData.fill(numpy.nan)
+            for i, file in enumerate(infiles):
+                data = _readers[format](data_directory + "/" + file,
+                                        [band_name])
+                tileSlice = slice(lengthDataRecord * i,
+                                  lengthDataRecord * (i + 1))
+                RasterDataFlat[flatIndex[tileSlice]] = data[band_name]
 
             # Write the single band to geotiff
             outfile_band = outfile + "_BAND_" + band_name
@@ -223,6 +308,164 @@ def _make_geotiff_per_band(infiles, outfile, band_export, data_directory,
             dct = ct1 - ct0
             logger.debug(('... Tiff created in {!s} seconds. Location: '
                           '{!s}.tif'.format(str(dct), outfile_band)))
+            outfiles.append(outfile_band + ".tif")
+    return outfiles
+
+
+def _make_multi_band_geotiff(infiles, outfile, band_export, data_directory,
+                             lengthDataRecord, xResolution, yResolution, EPSG,
+                             format='.ply', grid=None, tileExtents=None):
+    geoTransform, indexX, indexY, ncols, nrows = _getRasterFrame(
+        infiles, data_directory, lengthDataRecord, xResolution, yResolution,
+        format, grid, tileExtents
+    )
+    flatIndex = _getFlatIndex(indexX, indexY, ncols)
+    del indexX, indexY
+    band_names = [band for band in band_export if band not in ['x', 'y']]
+    logger.debug('... creating GeoTiff for bands {!s}'.format(band_names))
+    ct0 = time.time()
+
+    # Read all bands from each tile, and fill the rasters in a single pass
+    RasterData = numpy.full((len(band_names), nrows, ncols), numpy.nan,
+                            dtype='float32')
+    RasterDataFlat = RasterData.reshape(len(band_names), -1)
+    for i, file in enumerate(infiles):
+        if i % 25 == 0 or i == len(infiles) - 1:  # first, every 25, and last
+            logger.debug('... processing tile ' + str(i+1) + ' of ' + str(len(infiles)))
+        data = _readers[format](data_directory + "/" + file, band_names)
+        tileSlice = slice(lengthDataRecord * i, lengthDataRecord * (i + 1))
+        for j, band_name in enumerate(band_names):
+            RasterDataFlat[j, flatIndex[tileSlice]] = data[band_name]
+
+    _writeMultiBandGeoTiff(RasterData, band_names, geoTransform, outfile,
+                           ncols, nrows, EPSG)
+    ct1 = time.time()
+    dct = ct1 - ct0
+    logger.debug(('... Tiff created in {!s} seconds. Location: '
+                  '{!s}.tif'.format(str(dct), outfile)))
+    return [outfile + ".tif"]
+
+
+def _make_geotiff_streaming(infiles, outfile, band_export, data_directory,
+                            lengthDataRecord, xResolution, yResolution, EPSG,
+                            format='.ply', multi_band_files=False,
+                            grid=None, tileExtents=None):
+    geoTransform, arrayinfo = _getStreamingRasterFrame(
+        infiles, data_directory, xResolution, yResolution, format, grid,
+        tileExtents
+    )
+    ncols = int(arrayinfo[3])
+    nrows = int(arrayinfo[7])
+    band_names = [band for band in band_export if band not in ['x', 'y']]
+    logger.debug('... creating GeoTiff for bands {!s}'.format(band_names))
+    ct0 = time.time()
+
+    # Create the (empty) output rasters, and get the output band of each input
+    # band
+    if multi_band_files:
+        outfiles = [outfile]
+        datasets = [_createGeoTiff(outfile, band_names, geoTransform, ncols,
+                                   nrows, EPSG, sparse=True)]
+        raster_bands = [datasets[0].GetRasterBand(i + 1)
+                        for i in range(len(band_names))]
+    else:
+        outfiles = [outfile + "_BAND_" + band_name
+                    for band_name in band_names]
+        datasets = [_createGeoTiff(outfile_band, [band_name], geoTransform,
+                                   ncols, nrows, EPSG, sparse=True)
+                    for outfile_band, band_name in zip(outfiles, band_names)]
+        raster_bands = [dataset.GetRasterBand(1) for dataset in datasets]
+
+    # Write each tile as a window of the output rasters
+    for i, file in enumerate(infiles):
+        if i % 25 == 0 or i == len(infiles) - 1:  # first, every 25, and last
+            logger.debug('... processing tile ' + str(i+1) + ' of ' + str(len(infiles)))
+        data = _readers[format](data_directory + "/" + file,
+                                ['x', 'y'] + band_names)
+        xyData = numpy.column_stack((data['x'], data['y']))
+        xyDataShifted = _shiftTerrain(xyData, xResolution, yResolution)
+        xoff, yoff, indexX, indexY, wcols, wrows = _getTileWindow(
+            xyDataShifted, arrayinfo
+        )
+        flatIndex = _getFlatIndex(indexX, indexY, wcols)
+        window = numpy.empty((wrows, wcols), dtype='float32')
+        for band_name, raster_band in zip(band_names, raster_bands):
+            window.fill(numpy.nan)
+            window.reshape(-1)[flatIndex] = data[band_name]
+            raster_band.WriteArray(window, xoff, yoff)
+
+    for dataset in datasets:
+        dataset.FlushCache()
+    # close the datasets
+    raster_bands = datasets = None
+    ct1 = time.time()
+    dct = ct1 - ct0
+    logger.debug(('... Tiff(s) created in {!s} seconds. Location: '
+                  '{!s}*.tif'.format(str(dct), outfile)))
+    return [outfile + ".tif" for outfile in outfiles]
+
+
+def _getStreamingRasterFrame(infiles, data_directory, xResolution,
+                             yResolution, format='.ply', grid=None,
+                             tileExtents=None):
+    # Set the coordinate frame from the extent of the tiles, reading the
+    # coordinates of one tile at a time (if the extents are not known)
+    logger.debug('... setting the coordinate frame')
+    if grid is not None:
+        return _getGridGeoTransform(grid, infiles, xResolution, yResolution)
+    extent = numpy.empty((2 * len(infiles), 2))
+    for i, file in enumerate(infiles):
+        if tileExtents is not None:
+            extent[2 * i], extent[2 * i + 1] = tileExtents[file]
+        else:
+            stats = _getTileStats(data_directory + "/" + file, format)
+            extent[2 * i], extent[2 * i + 1] = stats['min'], stats['max']
+    # Shift the coordinates to the center of the cell
+    extentShifted = _shiftTerrain(extent, xResolution, yResolution)
+    return _getGeoTransform(extentShifted, xResolution, yResolution)
+
+
+def _getTileWindow(xyData, arrayinfo):
+    """
+    Get the window of the raster grid covered by a tile, and the indices of
+    the tile points within the window.
+    """
+    indexX, indexY = _getGeoCoding(xyData, arrayinfo)
+    xoff, yoff = int(indexX.min()), int(indexY.min())
+    ncols = int(indexX.max()) - xoff + 1
+    nrows = int(indexY.max()) - yoff + 1
+    indexX -= xoff
+    indexY -= yoff
+    return xoff, yoff, indexX, indexY, ncols, nrows
+
+
+def _getRasterFrame(infiles, data_directory, lengthDataRecord, xResolution,
+                    yResolution, format='.ply', grid=None, tileExtents=None):
+    # Set the coordinate frame
+    logger.debug('... setting the coordinate frame')
+    xyData = _tilesIntoNumpyArray(data_directory, infiles, lengthDataRecord,
+                                  ['x', 'y'], format)
+    # Shift the coordinates to the center of the cell
+    xyDataShifted = _shiftTerrain(xyData, xResolution, yResolution)
+    if grid is not None:
+        geoTransform, arrayinfo = _getGridGeoTransform(grid, infiles,
+                                                       xResolution,
+                                                       yResolution)
+    elif tileExtents is not None:
+        geoTransform, arrayinfo = _getStreamingRasterFrame(
+            infiles, data_directory, xResolution, yResolution,
+            tileExtents=tileExtents
+        )
+    else:
+        geoTransform, arrayinfo = _getGeoTransform(xyDataShifted,
+                                                   xResolution,
+                                                   yResolution)
+    # GeoCoding: get the index of each point in the raster
+    indexX, indexY = _getGeoCoding(xyDataShifted, arrayinfo)
+    del xyData, xyDataShifted
+    ncols = int(arrayinfo[3])
+    nrows = int(arrayinfo[7])
+    return geoTransform, indexX, indexY, ncols, nrows
 
 
 def _getGeoTransform(xyData, xres, yres):
@@ -237,29 +480,164 @@ def _getGeoTransform(xyData, xres, yres):
     return geotransform, arrayinfo
 
 
+def _getTileStats(file, format='.ply'):
+    """ Number of points and extent of a tile. """
+    data = _readers[format](file, ['x', 'y'])
+    return {'n_points': len(data['x']),
+            'min': [float(data['x'].min()), float(data['y'].min())],
+            'max': [float(data['x'].max()), float(data['y'].max())]}
+
+
+def _updateManifest(directory, tiles, format='.ply'):
+    """
+    Get the number of points and the extents of the tiles from the manifest
+    file in the given directory, parsing (and adding to the manifest) the
+    tiles that are not in the manifest or that have been modified.
+    """
+    path = pathlib.Path(directory) / _MANIFEST_FILENAME
+    with _manifest_lock:
+        manifest = {}
+        if path.is_file():
+            try:
+                with open(path) as f:
+                    manifest = json.load(f)
+            except ValueError:
+                logger.warning('Invalid manifest file {}, '
+                               'ignored'.format(path))
+        if manifest.get('version') != _MANIFEST_VERSION:
+            manifest = {'version': _MANIFEST_VERSION, 'tiles': {}}
+
+        entries = manifest['tiles']
+        n_parsed = 0
+        for tile in tiles:
+            stat = (pathlib.Path(directory) / tile).stat()
+            entry = entries.get(tile)
+            if (entry is None or entry['mtime_ns'] != stat.st_mtime_ns
+                    or entry['size'] != stat.st_size):
+                entry = _getTileStats(os.path.join(directory, tile), format)
+                entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                entries[tile] = entry
+                n_parsed += 1
+        logger.info('{} out of {} tiles read from manifest '
+                    '{}'.format(len(tiles) - n_parsed, len(tiles), path))
+        if n_parsed > 0:
+            # write to a (uniquely named) temporary file first, other tasks
+            # might be reading or writing the manifest
+            with tempfile.NamedTemporaryFile('w', dir=path.parent,
+                                             prefix=path.name + '.',
+                                             suffix='.tmp',
+                                             delete=False) as f:
+                json.dump(manifest, f)
+            os.replace(f.name, path)
+    return entries
+
+
+def _getResolution(delta_x, delta_y, n_points):
+    """
+    Get the spacing of a mesh of n_points points with square cells, given
+    the extent of the mesh: (delta_x/res + 1) * (delta_y/res + 1) = n_points.
+    """
+    if n_points < 2:
+        raise ValueError('Tile should include more than one point!')
+    b = delta_x + delta_y
+    return ((b + numpy.sqrt(b**2 + 4 * (n_points - 1) * delta_x * delta_y))
+            / (2 * (n_points - 1)))
+
+
+def _getGridGeoTransform(grid, infiles, xres, yres):
+    """
+    Same as _getGeoTransform, but the raster extent is determined from the
+    grid and the indices of the tiles, without scanning the point coordinates.
+    """
+    n_cells = grid.tile_width / numpy.array([xres, yres])
+    if not numpy.allclose(n_cells, numpy.rint(n_cells)):
+        raise ValueError('The tile width is not multiple of the resolution!')
+    xcint, ycint = _getGridTileIndices(grid, infiles)
+    tile_mins, _ = grid.get_tile_bounds(xcint.min(), ycint.min())
+    _, tile_maxs = grid.get_tile_bounds(xcint.max(), ycint.max())
+    # the coordinates are shifted by half a cell (see _shiftTerrain)
+    xmin, ymax = tile_mins[0], tile_maxs[1]
+    xmax, ymin = tile_maxs[0] - xres, tile_mins[1] + yres
+    ncols = round(((xmax - xmin) / xres) + 1)
+    nrows = round(((ymax - ymin) / yres) + 1)
+    geotransform = (xmin, xres, 0, ymax, 0, -1. * yres)
+    arrayinfo = (xmin, xmax, xres, ncols, ymin, ymax, yres, nrows)
+    return geotransform, arrayinfo
+
+
+def _getTileIndices(tiles):
+    """ Extract the tile indices from file names (tile_<x>_<y>.ply). """
+    indices = numpy.empty((len(tiles), 2), dtype=int)
+    for i, tile in enumerate(tiles):
+        match = re.match(r'[^_]*_(\d+)_(\d+)', tile)
+        if match is None:
+            raise ValueError('Tile indices not found in name: '
+                             '{}'.format(tile))
+        indices[i] = match.groups()
+    return indices[:, 0], indices[:, 1]
+
+
+def _getGridTileIndices(grid, tiles):
+    """ Same as _getTileIndices, checking that the tiles are in the grid. """
+    xcint, ycint = _getTileIndices(tiles)
+    outside = ((xcint >= grid.n_tiles_x) | (ycint >= grid.n_tiles_y))
+    if numpy.any(outside):
+        raise ValueError('Tile(s) outside the grid: {}'.format(
+            ', '.join(numpy.array(tiles)[outside])
+        ))
+    return xcint, ycint
+
+
+def _getSubRegionIndex(tileIndices, tileRange, nSub):
+    """
+    Assign tiles to sub-regions along one axis: sub-regions span the same
+    number of tiles, with the last one including all remaining tiles.
+    """
+    subRange = (tileRange[1] - tileRange[0] + 1) // nSub
+    if subRange == 0:
+        return numpy.full_like(tileIndices, nSub - 1)
+    return numpy.minimum((tileIndices - tileRange[0]) // subRange, nSub - 1)
+
+
 def _shiftTerrain(terrainData, xres, yres):
     """ 
     This shifts the coordinates by half a cell to account for shift between 
     target list and cell coordinate assumption made by gdal accommodating
-    geotiff orientation convention.
+    geotiff orientation convention. The shift is applied in place.
     """
-    tdc = terrainData.copy()
-    tdx = tdc[:, 0]
-    tdy = tdc[:, 1]
-    tdx = tdx - 0.5 * xres
-    tdy = tdy - 0.5 * yres * (-1.)
-    tdc[:, 0] = tdx
-    tdc[:, 1] = tdy
-    return tdc
+    terrainData[:, 0] -= 0.5 * xres
+    terrainData[:, 1] -= 0.5 * yres * (-1.)
+    return terrainData
 
 
 def _getGeoCoding(xyData, arrayinfo):
-    """Geocoding the point-wise x/y to a raster grid. """
-    x_idx = (xyData[:, 0] - arrayinfo[0]) / arrayinfo[2]
-    y_idx = -(xyData[:, 1] - arrayinfo[5]) / arrayinfo[6]
-    assert numpy.allclose(x_idx, numpy.rint(x_idx)), 'Geo coding failed!'
-    assert numpy.allclose(y_idx, numpy.rint(y_idx)), 'Geo coding failed!'
-    return x_idx.astype(int).tolist(), y_idx.astype(int).tolist()
+    """
+    Geocoding the point-wise x/y to a raster grid. Indices are returned as
+    int32 arrays.
+    """
+    indices = []
+    for coords, origin, res in ((xyData[:, 0], arrayinfo[0], arrayinfo[2]),
+                                (xyData[:, 1], arrayinfo[5], -arrayinfo[6])):
+        idx = numpy.subtract(coords, origin)
+        idx /= res
+        rounded = numpy.rint(idx)
+        # same tolerance as numpy.allclose, without further temporary arrays
+        idx -= rounded
+        numpy.abs(idx, out=idx)
+        tolerance = numpy.abs(rounded)
+        tolerance *= 1.e-5
+        tolerance += 1.e-8
+        assert numpy.all(idx <= tolerance), 'Geo coding failed!'
+        indices.append(rounded.astype('int32'))
+    return tuple(indices)
+
+
+def _getFlatIndex(indexX, indexY, ncols):
+    """ Index of the points in the flattened (row-major) raster. """
+    flatIndex = indexY.astype('int64')
+    flatIndex *= ncols
+    flatIndex += indexX
+    return flatIndex
 
 
 def _writeGeoTiff(featureArrays, bandName, geoTransform, outputFileName, ncols,
@@ -279,13 +657,95 @@ def _writeGeoTiff(featureArrays, bandName, geoTransform, outputFileName, ncols,
     output_raster.FlushCache()
 
 
-def _plyIntoNumpyArray(directory, tileList, gridLength, columnList):
+def _writeMultiBandGeoTiff(featureArrays, bandNames, geoTransform,
+                           outputFileName, ncols, nrows, EPSG_code):
+    output_raster = _createGeoTiff(outputFileName, bandNames, geoTransform,
+                                   ncols, nrows, EPSG_code)
+    for i in range(len(bandNames)):
+        output_raster.GetRasterBand(i + 1).WriteArray(featureArrays[i])
+    output_raster.FlushCache()
+
+
+def _createGeoTiff(outputFileName, bandNames, geoTransform, ncols, nrows,
+                   EPSG_code, sparse=False):
+    options = ['COMPRESS=LZW', 'TILED=YES', 'BIGTIFF=IF_SAFER']
+    if len(bandNames) > 1:
+        options.append('INTERLEAVE=BAND')
+    if sparse:
+        options.append('SPARSE_OK=TRUE')
+    output_raster = gdal.GetDriverByName('GTiff').Create(
+        outputFileName+".tif", ncols, nrows, len(bandNames),
+        gdal.GDT_Float32, options)
+    output_raster.SetGeoTransform(geoTransform)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG_code)
+    output_raster.SetProjection(srs.ExportToWkt())
+    if len(bandNames) > 1:
+        output_raster.SetMetadata({'bands': ','.join(bandNames)})
+    else:
+        output_raster.SetMetadata({'band': bandNames[0]})
+    for i, bandName in enumerate(bandNames):
+        rb = output_raster.GetRasterBand(i + 1)
+        rb.SetDescription(bandName)
+        rb.SetMetadata({"band_key": bandName})
+        if sparse:
+            # unwritten blocks are read as no-data
+            rb.SetNoDataValue(numpy.nan)
+    return output_raster
+
+
+def _convertToCOG(fileName, compress='LZW', predictor=None):
+    """
+    Convert a GeoTIFF file into a Cloud-Optimized GeoTIFF, with overviews.
+    Cells without data (NaN) are ignored when computing the overviews.
+    """
+    logger.debug('... converting {} to COG'.format(fileName))
+    tmpFileName = fileName + ".tmp"
+    os.replace(fileName, tmpFileName)
+    src = dst = None
+    try:
+        src = gdal.Open(tmpFileName, gdal.GA_Update)
+        if src is None:
+            raise RuntimeError('Cannot open GeoTIFF file: {}'.format(fileName))
+        for i in range(src.RasterCount):
+            rb = src.GetRasterBand(i + 1)
+            if rb.GetNoDataValue() is None:
+                rb.SetNoDataValue(numpy.nan)
+        options = ['COMPRESS={}'.format(compress), 'OVERVIEWS=AUTO',
+                   'RESAMPLING=AVERAGE', 'BIGTIFF=IF_SAFER']
+        if predictor is not None:
+            options.append('PREDICTOR={}'.format(predictor))
+        dst = gdal.GetDriverByName('COG').CreateCopy(fileName, src,
+                                                     options=options)
+        if dst is None:
+            raise RuntimeError('Conversion to COG failed: {}'.format(fileName))
+    except Exception:
+        # do not leave a partially written COG behind
+        dst = None
+        if os.path.exists(fileName):
+            os.remove(fileName)
+        raise
+    finally:
+        # close the datasets before removing the temporary file
+        rb = dst = src = None
+        os.remove(tmpFileName)
+
+
+def _tilesIntoNumpyArray(directory, tileList, gridLength, columnList,
+                         format='.ply'):
     terrainData = numpy.empty((gridLength * len(tileList), len(columnList)))
     for i, file in enumerate(tileList):
         if i % 25 == 0 or i == len(tileList) - 1:  # first, every 25, and last
             logger.debug('... processing tile ' + str(i+1) + ' of ' + str(len(tileList)))
 
-        plydata = plyfile.PlyData.read(directory + "/" + file)
+        data = _readers[format](directory + "/" + file, columnList)
         for j, column in enumerate(columnList):
-            terrainData[gridLength * i:gridLength * i + gridLength, j] = plydata.elements[0].data[column]
+            terrainData[gridLength * i:gridLength * i + gridLength, j] = data[column]
     return terrainData
+
+
+# Readers of the tile formats: return the requested columns of a file
+_readers = {
+    '.ply': read_ply_columns,
+    '.parquet': read_parquet_columns,
+}
@@ -9,67 +9,167 @@ class Grid(object):
     """
     Class to manage the retiling of large-scale point-cloud data to a regular
     grid. Tools allow to verify whether points belong to a given tile, and to
-    generate target points for feature extraction
+    generate target points for feature extraction. The grid can consist of
+    a different number of tiles along X and Y, and the tiles need not be
+    square.
+
+    Once set up, a grid is immutable: its geometry constants are computed only
+    once, grids with the same definition compare equal (and can be used as
+    dictionary keys), and they are pickled as their definition only.
     """
-    def __init__(self):
-        self.min_x = 0.
-        self.min_y = 0.
-        self.max_x = 0.
-        self.max_y = 0.
-        self.n_tiles_side = 1
-        self.is_set = False
+    __slots__ = ('_min_x', '_min_y', '_max_x', '_max_y', '_n_tiles_x',
+                 '_n_tiles_y', '_n_tiles', '_grid_mins', '_grid_maxs',
+                 '_grid_width', '_tile_width', '_tile_width_x',
+                 '_tile_width_y', '_is_set')
+
+    def __init__(self, min_x=None, min_y=None, max_x=None, max_y=None,
+                 n_tiles_side=None, n_tiles_x=None, n_tiles_y=None):
+        """
+        Initialize the grid. If the grid extent and the number of tiles are
+        provided, the grid is also set up (see setup).
+        """
+        self._set('_min_x', 0.)
+        self._set('_min_y', 0.)
+        self._set('_max_x', 0.)
+        self._set('_max_y', 0.)
+        self._set('_n_tiles_x', 1)
+        self._set('_n_tiles_y', 1)
+        self._set('_is_set', False)
+        self._set_constants()
+        extent = (min_x, min_y, max_x, max_y)
+        n_tiles = (n_tiles_side, n_tiles_x, n_tiles_y)
+        if (all([arg is not None for arg in extent])
+                and any([arg is not None for arg in n_tiles])):
+            self.setup(*extent, *n_tiles)
 
-    def setup(self, min_x, min_y, max_x, max_y, n_tiles_side):
+    def setup(self, min_x, min_y, max_x, max_y, n_tiles_side=None,
+              n_tiles_x=None, n_tiles_y=None):
         """
-        Setup the grid.
+        Setup the grid. The number of tiles is given either as n_tiles_side
+        (same number of tiles along X and Y, tiles MUST be square) or as
+        n_tiles_x and n_tiles_y (tiles can be rectangular).
 
         :param min_x: Min x value of the tiling schema
         :param min_y: Min y value of the tiling schema
         :param max_x: Max x value of the tiling schema
         :param max_y: Max y value of the tiling schema
-        :param n_tiles_side: Number of tiles along X and Y (tiling MUST be
-        square)
-        """
-        self.n_tiles_side = n_tiles_side
-        self.min_x = min_x
-        self.min_y = min_y
-        self.max_x = max_x
-        self.max_y = max_y
+        :param n_tiles_side: Number of tiles along X and Y
+        :param n_tiles_x: Number of tiles along X
+        :param n_tiles_y: Number of tiles along Y
+        """
+        if self.is_set:
+            raise RuntimeError('The grid has already been set: create a new '
+                               'Grid instead!')
+        if n_tiles_side is not None:
+            if n_tiles_x is not None or n_tiles_y is not None:
+                raise ValueError('Provide either n_tiles_side or n_tiles_x '
+                                 'and n_tiles_y!')
+            _check_number_of_tiles('n_tiles_side', n_tiles_side)
+            n_tiles_x = n_tiles_y = n_tiles_side
+        else:
+            _check_number_of_tiles('n_tiles_x', n_tiles_x)
+            _check_number_of_tiles('n_tiles_y', n_tiles_y)
+        self._set('_n_tiles_x', n_tiles_x)
+        self._set('_n_tiles_y', n_tiles_y)
+        self._set('_min_x', float(min_x))
+        self._set('_min_y', float(min_y))
+        self._set('_max_x', float(max_x))
+        self._set('_max_y', float(max_y))
+        self._set_constants()
         self._check_finite_extent()
-        self._check_grid_is_square()
-        self.is_set = True
+        if n_tiles_side is not None:
+            self._check_grid_is_square()
+        self._set('_is_set', True)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Grid objects are immutable!')
+
+    def __eq__(self, other):
+        if not isinstance(other, Grid):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __reduce__(self):
+        if not self.is_set:
+            return self.__class__, ()
+        min_x, min_y, max_x, max_y, n_tiles_x, n_tiles_y, _ = self._key()
+        return (self.__class__,
+                (min_x, min_y, max_x, max_y, None, n_tiles_x, n_tiles_y))
+
+    def __repr__(self):
+        return ('Grid(min_x={}, min_y={}, max_x={}, max_y={}, n_tiles_x={}, '
+                'n_tiles_y={})'.format(*self._key()[:-1]))
+
+    @property
+    def is_set(self):
+        """ Whether the grid has been set up. """
+        return self._is_set
+
+    @property
+    def min_x(self):
+        """ Min x value of the tiling schema. """
+        return self._min_x
+
+    @property
+    def min_y(self):
+        """ Min y value of the tiling schema. """
+        return self._min_y
+
+    @property
+    def max_x(self):
+        """ Max x value of the tiling schema. """
+        return self._max_x
+
+    @property
+    def max_y(self):
+        """ Max y value of the tiling schema. """
+        return self._max_y
 
     @property
     def n_tiles_side(self):
-        """ Number of tiles along each direction. """
-        return self._n_tiles_side
+        """ Number of tiles along each direction (equal along X and Y). """
+        if self._n_tiles_x != self._n_tiles_y:
+            raise ValueError('Different number of tiles along X and Y: use '
+                             'n_tiles_x and n_tiles_y instead!')
+        return self._n_tiles_x
+
+    @property
+    def n_tiles_x(self):
+        """ Number of tiles along X. """
+        return self._n_tiles_x
 
-    @n_tiles_side.setter
-    def n_tiles_side(self, n_tiles_side):
-        if not isinstance(n_tiles_side, int) or n_tiles_side < 1:
-            raise ValueError('n_tiles_side must be int > 0! Got instead: '
-                             '{}'.format(n_tiles_side))
-        self._n_tiles_side = n_tiles_side
+    @property
+    def n_tiles_y(self):
+        """ Number of tiles along Y. """
+        return self._n_tiles_y
+
+    @property
+    def n_tiles(self):
+        """ Total number of tiles. """
+        return self._n_tiles_x * self._n_tiles_y
 
     @property
     def grid_mins(self):
-        """ Lower grid boundaries. """
-        return np.array([self.min_x, self.min_y], dtype=float)
+        """ Lower grid boundaries (read-only array). """
+        return self._grid_mins
 
     @property
     def grid_maxs(self):
-        """ Upper grid boundaries. """
-        return np.array([self.max_x, self.max_y], dtype=float)
+        """ Upper grid boundaries (read-only array). """
+        return self._grid_maxs
 
     @property
     def grid_width(self):
-        """ Width of the grid. """
-        return self.grid_maxs - self.grid_mins
+        """ Width of the grid (read-only array). """
+        return self._grid_width
 
     @property
     def tile_width(self):
-        """ Width of a tile. """
-        return self.grid_width / self.n_tiles_side
+        """ Width of a tile (read-only array). """
+        return self._tile_width
 
     def get_tile_index(self, px, py):
         """
@@ -78,33 +178,123 @@ class Grid(object):
         :param px: X coordinate(s) of the point(s)
         :param py: Y coordinate(s) of the point(s)
         """
-        self._check_finite_extent()
-        point_cart = np.array([px, py], dtype=float).T
-        point_dir = (point_cart - self.grid_mins) / self.tile_width
-        indices = np.floor(point_dir).astype('int')
+        self._check_is_set()
+        index_x = np.floor((np.asarray(px, dtype=float) - self._min_x)
+                           / self._tile_width_x)
+        index_y = np.floor((np.asarray(py, dtype=float) - self._min_y)
+                           / self._tile_width_y)
+        indices = np.stack((index_x, index_y), axis=-1).astype('int')
         # If point falls outside the edge of the grid raise warning
-        mask_invalid_indices = np.logical_or(indices >= self.n_tiles_side,
+        mask_invalid_indices = np.logical_or(indices >= self._n_tiles,
                                              indices < 0)
         if mask_invalid_indices.any():
-            # axis = 1 if len(mask_invalid_indices.shape) > 1 else 0
-            # num_invalid_points = np.all(mask_invalid_indices, axis=axis).sum()
             logger.warning("Points fall outside the bounds Min X={} Y={}, "
                            "Max X={} Y={}".format(*self.grid_mins,
                                                   *self.grid_maxs))
         return indices
 
+    def get_tile_ids(self, px, py, chunk_size=10000000, return_counts=False):
+        """
+        Determine the linear indices of the tiles to which points belong. The
+        linear index of tile (i, j) is i * n_tiles_y + j, while points
+        outside the grid are assigned the index -1. Points are processed in
+        chunks, so that no copy of the input coordinates is made.
+
+        :param px: X coordinates of the points (1D array, it can be a
+        memory-mapped array or a field of a structured array)
+        :param py: Y coordinates of the points
+        :param chunk_size: Number of points processed at once
+        :param return_counts: If True, also return the number of points in
+        each tile
+        :return: int32 array with the linear tile indices and, optionally,
+        the array with the number of points per linear tile index
+        """
+        self._check_is_set()
+        if chunk_size <= 0:
+            raise ValueError('The chunk size should be a positive number of '
+                             'points, got {}'.format(chunk_size))
+        n_points = len(px)
+        tile_ids = np.empty(n_points, dtype=np.int32)
+        counts = np.zeros(self.n_tiles, dtype=np.int64)
+        buffer_size = min(chunk_size, n_points)
+        buffer_x = np.empty(buffer_size, dtype=float)
+        buffer_y = np.empty(buffer_size, dtype=float)
+        n_invalid = 0
+        for start in range(0, n_points, chunk_size):
+            stop = min(start + chunk_size, n_points)
+            tx = buffer_x[:stop-start]
+            ty = buffer_y[:stop-start]
+            _get_index_along_axis(px[start:stop], self._min_x,
+                                  self._tile_width_x, tx)
+            _get_index_along_axis(py[start:stop], self._min_y,
+                                  self._tile_width_y, ty)
+            invalid = ~((tx >= 0) & (tx < self._n_tiles_x)
+                        & (ty >= 0) & (ty < self._n_tiles_y))
+            tx[invalid] = 0
+            ty[invalid] = 0
+            np.multiply(tx, self._n_tiles_y, out=tx)
+            np.add(tx, ty, out=tx)
+            ids = tile_ids[start:stop]
+            ids[:] = tx
+            ids[invalid] = -1
+            n_invalid += np.count_nonzero(invalid)
+            if return_counts:
+                counts += np.bincount(ids[~invalid],
+                                      minlength=counts.size)
+        if n_invalid > 0:
+            logger.warning("{} points fall outside the bounds Min X={} Y={}, "
+                           "Max X={} Y={}".format(n_invalid,
+                                                  *self.grid_mins,
+                                                  *self.grid_maxs))
+        if return_counts:
+            return tile_ids, counts
+        return tile_ids
+
+    def get_tile_index_from_id(self, tile_ids):
+        """
+        Convert linear tile indices to tile indices along X and Y.
+
+        :param tile_ids: Linear tile index (indices)
+        """
+        return np.divmod(tile_ids, self._n_tiles_y)
+
     def get_tile_bounds(self, tile_index_x, tile_index_y):
         """
-        Determine the boundaries of a tile given its X and Y indices.
+        Determine the boundaries of one or more tiles given their X and Y
+        indices. For arrays of N tile indices, the lower and upper boundaries
+        are returned as (2, N) arrays (X and Y boundaries along the first
+        axis).
 
-        :param tile_index_x: Tile index along X
-        :param tile_index_y: Tile index along Y
+        :param tile_index_x: Tile index (indices) along X
+        :param tile_index_y: Tile index (indices) along Y
         """
-        tile_index = np.array([tile_index_x, tile_index_y], dtype=int)
-        tile_mins = tile_index * self.tile_width + self.grid_mins
-        tile_maxs = tile_mins + self.tile_width
+        tile_min_x = (np.asarray(tile_index_x, dtype=int) * self._tile_width_x
+                      + self._min_x)
+        tile_min_y = (np.asarray(tile_index_y, dtype=int) * self._tile_width_y
+                      + self._min_y)
+        tile_mins = np.array([tile_min_x, tile_min_y])
+        tile_maxs = np.array([tile_min_x + self._tile_width_x,
+                              tile_min_y + self._tile_width_y])
         return tile_mins, tile_maxs
 
+    def get_active_tiles(self, mins, maxs):
+        """
+        Determine which tiles overlap a footprint, given as a collection of
+        bounding boxes (e.g. the extents of the input files).
+
+        :param mins: (N, 2) array with the lower X and Y bounds of the boxes
+        :param maxs: (N, 2) array with the upper X and Y bounds of the boxes
+        :return: (n_tiles_x, n_tiles_y) boolean mask of the active tiles
+        """
+        self._check_is_set()
+        mask = np.zeros((self._n_tiles_x, self._n_tiles_y), dtype=bool)
+        for (min_x, min_y), (max_x, max_y) in zip(np.atleast_2d(mins),
+                                                  np.atleast_2d(maxs)):
+            (x_start, x_stop), (y_start, y_stop) = \
+                self._get_tile_range(min_x, min_y, max_x, max_y)
+            mask[x_start:x_stop, y_start:y_stop] = True
+        return mask
+
     def is_point_in_tile(self, px, py, tile_index_x, tile_index_y,
                          precision=None):
         """
@@ -118,7 +308,12 @@ class Grid(object):
         :param precision: Optional precision threshold to determine whether
         the point(s) belong to the tile
         """
-        if precision is None:
+        if precision is None and self.is_set and np.ndim(px) == 1 \
+                and 0 <= tile_index_x < self._n_tiles_x \
+                and 0 <= tile_index_y < self._n_tiles_y:
+            tile_id = tile_index_x * self._n_tiles_y + tile_index_y
+            return self.get_tile_ids(px, py) == tile_id
+        elif precision is None:
             indices = np.array([tile_index_x, tile_index_y], dtype=int).T
             mask = indices == self.get_tile_index(px, py)
         else:
@@ -153,11 +348,62 @@ class Grid(object):
         xv, yv = np.meshgrid(x, y)
         return xv.flatten(), yv.flatten()
 
+    def _set(self, name, value):
+        object.__setattr__(self, name, value)
+
+    def _key(self):
+        return (self._min_x, self._min_y, self._max_x, self._max_y,
+                self._n_tiles_x, self._n_tiles_y, self._is_set)
+
+    def _get_tile_range(self, min_x, min_y, max_x, max_y):
+        """ Range of tile indices (clipped to the grid) overlapping a box. """
+        x_start = max(int(np.floor((min_x - self._min_x)
+                                   / self._tile_width_x)), 0)
+        x_stop = min(int(np.floor((max_x - self._min_x)
+                                  / self._tile_width_x)) + 1, self._n_tiles_x)
+        y_start = max(int(np.floor((min_y - self._min_y)
+                                   / self._tile_width_y)), 0)
+        y_stop = min(int(np.floor((max_y - self._min_y)
+                                  / self._tile_width_y)) + 1, self._n_tiles_y)
+        return (x_start, max(x_stop, x_start)), (y_start, max(y_stop, y_start))
+
+    def _set_constants(self):
+        grid_mins = np.array([self._min_x, self._min_y], dtype=np.float64)
+        grid_maxs = np.array([self._max_x, self._max_y], dtype=np.float64)
+        grid_width = grid_maxs - grid_mins
+        n_tiles = np.array([self._n_tiles_x, self._n_tiles_y], dtype=int)
+        tile_width = grid_width / n_tiles
+        for name, array in zip(('_grid_mins', '_grid_maxs', '_grid_width',
+                                '_tile_width', '_n_tiles'),
+                               (grid_mins, grid_maxs, grid_width, tile_width,
+                                n_tiles)):
+            array.flags.writeable = False
+            self._set(name, array)
+        self._set('_tile_width_x', float(tile_width[0]))
+        self._set('_tile_width_y', float(tile_width[1]))
+
+    def _check_is_set(self):
+        if not self.is_set:
+            raise ValueError('The grid has not been set!')
+
     def _check_finite_extent(self):
-        for n_dim in range(1):
+        for n_dim in range(2):
             if np.isclose(self.grid_width[n_dim], 0.):
                 raise ValueError('Zero grid extend in {}!'.format('xy'[n_dim]))
 
     def _check_grid_is_square(self):
         if not np.isclose(self.tile_width[0], self.tile_width[1]):
             raise ValueError('Grid is not square!')
+
+
+def _check_number_of_tiles(name, n_tiles):
+    if not isinstance(n_tiles, int) or n_tiles < 1:
+        raise ValueError('{} must be int > 0! Got instead: '
+                         '{}'.format(name, n_tiles))
+
+
+def _get_index_along_axis(coords, grid_min, tile_width, out):
+    np.subtract(coords, grid_min, out=out)
+    np.divide(out, tile_width, out=out)
+    np.floor(out, out=out)
+    return out
@@ -0,0 +1,184 @@
+import collections
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import threading
+import weakref
+
+import laserchicken.kd_tree
+from laserchicken import keys
+import numpy as np
+
+from laserfarm.utils import check_dir_exists
+
+
+logger = logging.getLogger(__name__)
+
+# Approximate memory footprint of a node of scipy's cKDTree (in bytes)
+_NODE_SIZE = 72
+
+
+class KDTreeCache(object):
+    """
+    Cache of the KD-trees employed by laserchicken to compute neighborhoods.
+    Trees are identified by a hash of the point-cloud X and Y coordinates, so
+    that they can be reused across pipeline steps and tasks running in the
+    same process, and (optionally) across runs if persisted to disk. The
+    least recently used trees are dropped when the memory budget is exceeded.
+
+    Example:
+        >>> cache = KDTreeCache(max_memory=2*1024**3, cache_dir='kd_trees')
+        >>> cache.install()  # laserchicken now retrieves trees from the cache
+
+    A single cache shared by all the tasks running in a process can be set up
+    with install_kd_tree_cache.
+    """
+
+    def __init__(self, max_memory=1024**3, cache_dir=None):
+        """
+        :param max_memory: Memory budget for the trees kept in memory (bytes)
+        :param cache_dir: (Optional) directory where the trees are persisted
+        """
+        self.max_memory = max_memory
+        self.cache_dir = _get_cache_dir(cache_dir)
+        self._trees = collections.OrderedDict()
+        self._keys = {}
+        self._memory = 0
+        self._lock = threading.RLock()
+
+    @property
+    def memory(self):
+        """ Approximate memory occupied by the trees in the cache (bytes). """
+        return self._memory
+
+    def __len__(self):
+        return len(self._trees)
+
+    def get_kdtree_for_pc(self, pc):
+        """
+        Retrieve the KD-tree of a point cloud based on its x and y attributes,
+        building it if not in the cache (same interface as in laserchicken).
+
+        :param pc: point cloud
+        :return: kdtree object
+        """
+        x = pc[keys.point]['x']['data']
+        y = pc[keys.point]['y']['data']
+        with self._lock:
+            key = self._get_key(x, y)
+            if key in self._trees:
+                self._trees.move_to_end(key)
+                return self._trees[key]
+            tree = self._load(key)
+            if tree is None:
+                tree = laserchicken.kd_tree._build_kdtree(pc)
+                self._dump(key, tree)
+            self._add(key, tree)
+            return tree
+
+    def clear(self):
+        """ Drop all the trees kept in memory (persisted trees are kept). """
+        with self._lock:
+            self._trees.clear()
+            self._keys.clear()
+            self._memory = 0
+
+    def install(self):
+        """ Let laserchicken retrieve KD-trees from this cache. """
+        laserchicken.kd_tree.get_kdtree_for_pc = self.get_kdtree_for_pc
+        return self
+
+    @staticmethod
+    def uninstall():
+        """ Restore the KD-tree caching mechanism of laserchicken. """
+        laserchicken.kd_tree.get_kdtree_for_pc = _laserchicken_get_kdtree
+
+    def _get_key(self, x, y):
+        # hash the coordinates only once per pair of arrays
+        cached = self._keys.get((id(x), id(y)))
+        if cached is not None:
+            (x_ref, y_ref), key = cached
+            if x_ref() is x and y_ref() is y:
+                return key
+        digest = hashlib.blake2b(digest_size=16)
+        for coords in (x, y):
+            coords = np.ascontiguousarray(coords)
+            digest.update(coords.dtype.str.encode())
+            digest.update(np.int64(coords.size).tobytes())
+            digest.update(coords.data)
+        key = digest.hexdigest()
+        self._keys[(id(x), id(y))] = ((weakref.ref(x), weakref.ref(y)), key)
+        self._drop_dead_keys()
+        return key
+
+    def _drop_dead_keys(self):
+        dead = [ids for ids, (refs, _) in self._keys.items()
+                if any(ref() is None for ref in refs)]
+        for ids in dead:
+            self._keys.pop(ids)
+
+    def _add(self, key, tree):
+        size = _get_tree_size(tree)
+        self._trees[key] = tree
+        self._memory += size
+        while self._memory > self.max_memory and len(self._trees) > 1:
+            _, evicted = self._trees.popitem(last=False)
+            self._memory -= _get_tree_size(evicted)
+
+    def _get_path(self, key):
+        return self.cache_dir / '{}.kdtree'.format(key)
+
+    def _load(self, key):
+        if self.cache_dir is None or not self._get_path(key).is_file():
+            return None
+        logger.debug('Loading KD-tree {} from disk'.format(key))
+        with open(self._get_path(key), 'rb') as f:
+            return pickle.load(f)
+
+    def _dump(self, key, tree):
+        if self.cache_dir is None:
+            return
+        path = self._get_path(key)
+        tmp_path = path.with_name('{}.{}.tmp'.format(key, os.getpid()))
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
+
+
+_laserchicken_get_kdtree = laserchicken.kd_tree.get_kdtree_for_pc
+
+_process_cache = None
+
+
+def install_kd_tree_cache(max_memory=1024**3, cache_dir=None):
+    """
+    Install the KD-tree cache shared by all the tasks running in the current
+    process, creating it if it does not exist yet. If the cache exists, its
+    memory budget and persistence directory are updated, while the trees are
+    kept.
+
+    :param max_memory: Memory budget for the trees kept in memory (bytes)
+    :param cache_dir: (Optional) directory where the trees are persisted
+    :return: the process-wide KDTreeCache
+    """
+    global _process_cache
+    if _process_cache is None:
+        _process_cache = KDTreeCache(max_memory, cache_dir)
+    else:
+        with _process_cache._lock:
+            _process_cache.max_memory = max_memory
+            _process_cache.cache_dir = _get_cache_dir(cache_dir)
+    return _process_cache.install()
+
+
+def _get_cache_dir(cache_dir):
+    if cache_dir is None:
+        return None
+    check_dir_exists(cache_dir, should_exist=True, mkdir=True)
+    return pathlib.Path(cache_dir)
+
+
+def _get_tree_size(tree):
+    return tree.data.nbytes + tree.indices.nbytes + tree.size * _NODE_SIZE
@@ -3,6 +3,7 @@ import sys
 import traceback
 
 from dask.distributed import Client, LocalCluster, SSHCluster, as_completed
+import numpy as np
 
 from laserfarm.pipeline import Pipeline
 
@@ -65,6 +66,32 @@ class MacroPipeline(object):
         self.tasks.append(task)
         return self
 
+    def select_active_tiles(self, active_tiles):
+        """
+        Drop the tasks of the tiles that do not contain any data. Tasks are
+        matched to tiles through their tile index (e.g. set via
+        DataProcessing(tile_index=...)), tasks without a tile index are kept.
+
+        :param active_tiles: (n_tiles_x, n_tiles_y) boolean mask of the active
+        tiles, e.g. from PointCloudCatalogue.get_active_tiles()
+        """
+        active_tiles = np.asarray(active_tiles, dtype=bool)
+        tasks = []
+        for task in self.tasks:
+            tile_index = getattr(task, '_tile_index', None)
+            if tile_index is None or any(idx is None for idx in tile_index):
+                tasks.append(task)
+                continue
+            tile_x, tile_y = (int(idx) for idx in tile_index)
+            if (0 <= tile_x < active_tiles.shape[0]
+                    and 0 <= tile_y < active_tiles.shape[1]
+                    and active_tiles[tile_x, tile_y]):
+                tasks.append(task)
+        logger.info('{} out of {} tasks are run on active tiles'.format(
+            len(tasks), len(self.tasks)))
+        self._tasks = tasks
+        return self
+
     def set_labels(self, labels):
         labels_ = [labels]*len(self.tasks) if isinstance(labels, str) else labels
         try:
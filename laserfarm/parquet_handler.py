@@ -0,0 +1,89 @@
+import json
+
+from laserchicken import keys
+from laserchicken.io import io_handlers
+from laserchicken.io.base_io_handler import IOHandler
+from laserchicken.io.utils import select_valid_attributes
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Key of the Parquet schema metadata where the point-cloud log is stored
+_LOG_KEY = b'laserchicken_log'
+
+
+class ParquetHandler(IOHandler):
+    """
+    Class for IO of point-cloud data in Parquet format. Point attributes are
+    stored as compressed columns (one per attribute) in chunks of rows, so
+    that single attributes can be read without parsing the full file. The
+    point-cloud log is stored in the file metadata.
+    """
+
+    def __init__(self, path, mode, overwrite=False):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required for the Parquet format')
+        super().__init__(path, mode, overwrite=overwrite)
+
+    def read(self, attributes='all'):
+        """
+        Read point-cloud data from the Parquet file.
+
+        :param attributes: List of attributes to read ('all' for all of them)
+        :return: point-cloud data structure (laserchicken format)
+        """
+        schema = pyarrow.parquet.read_schema(self.path)
+        attributes = select_valid_attributes(schema.names, attributes)
+        columns = read_parquet_columns(self.path, attributes)
+        metadata = schema.metadata or {}
+        log = json.loads(metadata[_LOG_KEY]) if _LOG_KEY in metadata else []
+        return {keys.point: {name: {'type': column.dtype.name,
+                                    'data': column}
+                             for name, column in columns.items()},
+                keys.provenance: log}
+
+    def write(self, point_cloud, attributes='all', row_group_size=1000000,
+              compression='zstd'):
+        """
+        Write point-cloud data to the Parquet file.
+
+        :param point_cloud: point-cloud data structure (laserchicken format)
+        :param attributes: List of attributes to write ('all' for all of them)
+        :param row_group_size: Number of points per chunk (row group)
+        :param compression: Compression codec applied to the columns
+        """
+        points = point_cloud[keys.point]
+        attributes = select_valid_attributes(list(points.keys()), attributes)
+        table = pyarrow.table({name: np.asarray(points[name]['data'])
+                               for name in attributes})
+        log = point_cloud.get(keys.provenance, [])
+        table = table.replace_schema_metadata(
+            {_LOG_KEY: json.dumps(log, default=str)}
+        )
+        pyarrow.parquet.write_table(table, self.path,
+                                    row_group_size=row_group_size,
+                                    compression=compression)
+
+
+def read_parquet_columns(path, columns):
+    """
+    Read a selection of columns from a Parquet file, without reading the
+    others from disk.
+
+    :param path: Path to the Parquet file
+    :param columns: List of column names
+    :return: dictionary with the columns as numpy arrays
+    """
+    if pyarrow is None:
+        raise ImportError('pyarrow is required for the Parquet format')
+    table = pyarrow.parquet.read_table(path, columns=list(columns),
+                                       use_threads=False)
+    return {name: table.column(name).to_numpy() for name in columns}
+
+
+io_handlers['.parquet'] = ParquetHandler
@@ -0,0 +1,120 @@
+import collections
+import functools
+import os
+
+import numpy as np
+
+
+# Numpy types corresponding to the PLY scalar types (laserchicken writes
+# numpy type names, which are also accepted)
+_PLY_TYPES = {
+    'char': 'i1',
+    'uchar': 'u1',
+    'short': 'i2',
+    'ushort': 'u2',
+    'int': 'i4',
+    'uint': 'u4',
+    'float': 'f4',
+    'double': 'f8',
+}
+
+_BYTE_ORDERS = {
+    'ascii': '=',
+    'binary_little_endian': '<',
+    'binary_big_endian': '>',
+}
+
+PLYHeader = collections.namedtuple(
+    'PLYHeader', ['format', 'n_vertices', 'properties', 'n_lines', 'offset']
+)
+
+
+def read_ply_columns(path, columns):
+    """
+    Read a selection of vertex properties from a PLY file. For binary files,
+    the vertex block is memory-mapped and the columns are returned as views
+    (no data is read from disk until accessed). For ASCII files, only the
+    requested columns are parsed. The file header is parsed once and cached.
+
+    :param path: Path to the PLY file
+    :param columns: List of vertex property names
+    :return: dictionary with the columns as numpy arrays
+    """
+    header = read_ply_header(path)
+    missing = [c for c in columns if c not in header.properties]
+    if missing:
+        raise ValueError('Properties not found in {}: '
+                         '{}'.format(path, ', '.join(missing)))
+    byte_order = _BYTE_ORDERS[header.format]
+    if header.n_vertices == 0:
+        dtype = [(c, header.properties[c]) for c in columns]
+        data = np.empty(0, dtype=dtype)
+    elif header.format == 'ascii':
+        names = list(header.properties.keys())
+        dtype = [(c, header.properties[c]) for c in columns]
+        data = np.loadtxt(path, dtype=dtype, skiprows=header.n_lines,
+                          max_rows=header.n_vertices, ndmin=1,
+                          usecols=[names.index(c) for c in columns])
+    else:
+        dtype = [(name, dt.newbyteorder(byte_order))
+                 for name, dt in header.properties.items()]
+        data = np.memmap(path, dtype=dtype, mode='r', offset=header.offset,
+                         shape=(header.n_vertices,))
+    return {c: data[c] for c in columns}
+
+
+def read_ply_header(path):
+    """
+    Parse the header of a PLY file. Results are cached as long as the file
+    is not modified.
+
+    :param path: Path to the PLY file
+    :return: PLYHeader with the file format, the number of vertices, the
+    vertex properties (names and types), the number of header lines and the
+    size of the header (bytes)
+    """
+    stat = os.stat(path)
+    return _read_ply_header(os.fspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=1024)
+def _read_ply_header(path, mtime, size):
+    elements = []
+    format = None
+    n_lines = 0
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            raise ValueError('Not a PLY file: {}'.format(path))
+        n_lines += 1
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError('PLY header not terminated: '
+                                 '{}'.format(path))
+            n_lines += 1
+            words = line.decode('ascii', errors='replace').split()
+            if not words or words[0] in ('comment', 'obj_info'):
+                continue
+            if words[0] == 'end_header':
+                break
+            if words[0] == 'format':
+                format = words[1]
+            elif words[0] == 'element':
+                elements.append((words[1], int(words[2]), {}))
+            elif words[0] == 'property':
+                if words[1] == 'list':
+                    raise ValueError('List properties are not supported: '
+                                     '{}'.format(path))
+                elements[-1][2][words[2]] = _get_dtype(words[1])
+        offset = f.tell()
+    if format not in _BYTE_ORDERS:
+        raise ValueError('Unknown PLY format: {}'.format(format))
+    if not elements or elements[0][0] != 'vertex':
+        raise ValueError('Tile PLY file should '
+                         'have vertex as first object')
+    _, n_vertices, properties = elements[0]
+    return PLYHeader(format, n_vertices, properties, n_lines, offset)
+
+
+def _get_dtype(ply_type):
+    return np.dtype(_PLY_TYPES.get(ply_type, ply_type))
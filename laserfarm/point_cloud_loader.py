@@ -0,0 +1,172 @@
+import concurrent.futures
+import logging
+import sys
+import tempfile
+import time
+
+import laspy
+from laserchicken import keys
+from laserchicken.io.las_handler import DEFAULT_LAS_ATTRIBUTES
+from laserchicken.io.utils import select_valid_attributes
+from laserchicken.utils import add_metadata
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Fields of the layered point formats (6-10) that need to be decompressed to
+# read a given attribute. X, Y and the return numbers are always decompressed.
+_DECOMPRESSION_FIELDS = {
+    'x': laspy.DecompressionSelection.XY_RETURNS_CHANNEL,
+    'y': laspy.DecompressionSelection.XY_RETURNS_CHANNEL,
+    'return_number': laspy.DecompressionSelection.XY_RETURNS_CHANNEL,
+    'number_of_returns': laspy.DecompressionSelection.XY_RETURNS_CHANNEL,
+    'scanner_channel': laspy.DecompressionSelection.XY_RETURNS_CHANNEL,
+    'z': laspy.DecompressionSelection.Z,
+    'classification': laspy.DecompressionSelection.CLASSIFICATION,
+    'raw_classification': laspy.DecompressionSelection.CLASSIFICATION,
+    'synthetic': laspy.DecompressionSelection.FLAGS,
+    'key_point': laspy.DecompressionSelection.FLAGS,
+    'withheld': laspy.DecompressionSelection.FLAGS,
+    'overlap': laspy.DecompressionSelection.FLAGS,
+    'classification_flags': laspy.DecompressionSelection.FLAGS,
+    'scan_direction_flag': laspy.DecompressionSelection.FLAGS,
+    'edge_of_flight_line': laspy.DecompressionSelection.FLAGS,
+    'intensity': laspy.DecompressionSelection.INTENSITY,
+    'scan_angle': laspy.DecompressionSelection.SCAN_ANGLE,
+    'user_data': laspy.DecompressionSelection.USER_DATA,
+    'point_source_id': laspy.DecompressionSelection.POINT_SOURCE_ID,
+    'gps_time': laspy.DecompressionSelection.GPS_TIME,
+    'red': laspy.DecompressionSelection.RGB,
+    'green': laspy.DecompressionSelection.RGB,
+    'blue': laspy.DecompressionSelection.RGB,
+    'nir': laspy.DecompressionSelection.NIR,
+}
+
+
+def load_las_files(files, attributes=DEFAULT_LAS_ATTRIBUTES, scratch_dir=None,
+                   chunk_size=1000000, n_threads=1):
+    """
+    Read point-cloud data from a list of LAS/LAZ files into a single point
+    cloud. The total number of points is determined from the file headers, so
+    that one contiguous array is allocated per attribute and filled in place
+    file by file. Only the requested attributes are decoded. Files can be
+    decoded concurrently using a pool of threads (LAZ decompression releases
+    the GIL).
+
+    :param files: List of paths to LAS/LAZ files
+    :param attributes: List of attributes to read ('all' for all attributes
+    available in the files)
+    :param scratch_dir: (Optional) directory where the arrays are memory-mapped
+    (temporary files are employed, and removed once the arrays are released).
+    If not given, the arrays are allocated in memory
+    :param chunk_size: Number of points read from file in one go
+    :param n_threads: Number of files decoded concurrently
+    :return: point-cloud data structure (laserchicken format)
+    """
+    headers = [_read_header(file) for file in files]
+    available = _get_available_attributes(headers[0].point_format)
+    attributes = select_valid_attributes(available, attributes)
+    for file, header in zip(files[1:], headers[1:]):
+        missing = set(attributes).difference(
+            _get_available_attributes(header.point_format)
+        )
+        if missing:
+            raise ValueError('Attributes not available in file {}: '
+                             '{}'.format(file, ', '.join(sorted(missing))))
+    n_points = sum(header.point_count for header in headers)
+    columns = {name: _allocate(n_points, _get_dtype(headers[0], name),
+                               scratch_dir)
+               for name in attributes}
+
+    selection = _get_decompression_selection(attributes)
+    offsets = np.cumsum([0] + [header.point_count for header in headers])
+    read_opts = dict(columns=columns, selection=selection,
+                     chunk_size=chunk_size)
+    if n_threads > 1 and len(files) > 1:
+        # decompression is parallelized over files, not within them
+        if laspy.LazBackend.Lazrs.is_available():
+            read_opts.update(laz_backend=laspy.LazBackend.Lazrs)
+        with concurrent.futures.ThreadPoolExecutor(n_threads) as executor:
+            futures = [executor.submit(_read_file, file, offset, **read_opts)
+                       for file, offset in zip(files, offsets)]
+            for future in futures:
+                future.result()
+    else:
+        for file, offset in zip(files, offsets):
+            _read_file(file, offset, **read_opts)
+
+    point_cloud = {keys.point: {name: {'type': column.dtype.name,
+                                       'data': column}
+                                for name, column in columns.items()}}
+    add_metadata(point_cloud, sys.modules[__name__],
+                 {'paths': [str(file) for file in files],
+                  'attributes': list(attributes)})
+    return point_cloud
+
+
+def list_las_attributes(path):
+    """
+    List the attributes that can be read from a LAS/LAZ file.
+
+    :param path: Path to the LAS/LAZ file
+    """
+    return _get_available_attributes(_read_header(path).point_format)
+
+
+def _read_file(file, offset, columns, selection, chunk_size,
+               laz_backend=None):
+    start = time.perf_counter()
+    n_read = 0
+    with laspy.open(file, laz_backend=laz_backend,
+                    decompression_selection=selection) as reader:
+        for points in reader.chunk_iterator(chunk_size):
+            n_chunk = len(points)
+            for name, column in columns.items():
+                column[offset+n_read:offset+n_read+n_chunk] = points[name]
+            n_read += n_chunk
+    elapsed = time.perf_counter() - start
+    logger.info('... decoded {}: {} points in {:.2f} s ({:.2f} Mpoints/s)'
+                ''.format(file, n_read, elapsed,
+                          n_read / max(elapsed, 1.e-9) / 1.e6))
+    return n_read
+
+
+def _read_header(file):
+    with laspy.open(file) as reader:
+        return reader.header
+
+
+def _get_available_attributes(point_format):
+    names = list(point_format.dimension_names)
+    names += [name for name in point_format.dtype().fields.keys()
+              if name not in names]
+    return [name.lower() if name in ('X', 'Y', 'Z') else name
+            for name in names]
+
+
+def _get_dtype(header, name):
+    if name in ('x', 'y', 'z'):
+        return np.dtype('float64')
+    points = laspy.ScaleAwarePointRecord.zeros(1, header=header)
+    return np.asarray(points[name]).dtype
+
+
+def _allocate(n_points, dtype, scratch_dir=None):
+    if scratch_dir is None:
+        return np.empty(n_points, dtype=dtype)
+    # the temporary file is removed as soon as the memory map is closed
+    with tempfile.TemporaryFile(dir=scratch_dir) as file:
+        data = np.memmap(file, dtype=dtype, mode='w+',
+                         shape=(max(n_points, 1),))
+    return np.asarray(data)[:n_points]
+
+
+def _get_decompression_selection(attributes):
+    selection = laspy.DecompressionSelection.base()
+    for name in attributes:
+        # extra bytes and less common fields: decompress everything else
+        selection |= _DECOMPRESSION_FIELDS.get(
+            name, laspy.DecompressionSelection.all()
+        )
+    return selection
@@ -1,29 +1,45 @@
+import collections
+import copy
 import logging
 import os
 import pdal
 import laspy
+from laspy.lasappender import LasAppender
 import json
+import numpy as np
+import pyproj
 
+from laserfarm.catalogue import PointCloudCatalogue
 from laserfarm.grid import Grid
 from laserfarm.pipeline_remote_data import PipelineRemoteData
-from laserfarm.utils import check_file_exists, check_dir_exists
+from laserfarm.utils import check_path_exists, check_dir_exists
 
 
 logger = logging.getLogger(__name__)
 
 
 class Retiler(PipelineRemoteData):
-    """ Split point cloud data into smaller tiles on a regular grid. """
+    """
+    Split point cloud data into smaller tiles on a regular grid. The input can
+    be either a single LAS/LAZ file or a directory: in the latter case all the
+    files in the directory are retiled in a single pass, and each tile is
+    written to one consolidated file, named after the input directory.
+    """
 
     def __init__(self, input_file=None, label=None):
-        self.pipeline = ('set_grid', 'split_and_redistribute', 'validate')
+        self.pipeline = ('set_grid',
+                         'set_catalogue',
+                         'split_and_redistribute',
+                         'validate')
         self.grid = Grid()
+        self.catalogue = None
         if input_file is not None:
             self.input_path = input_file
         if label is not None:
             self.label = label
 
-    def set_grid(self, min_x, min_y, max_x, max_y, n_tiles_side):
+    def set_grid(self, min_x, min_y, max_x, max_y, n_tiles_side=None,
+                 n_tiles_x=None, n_tiles_y=None):
         """
         Setup the grid to which the input file is retiled.
 
@@ -33,21 +49,83 @@ class Retiler(PipelineRemoteData):
         :param max_y: max y value of tiling schema
         :param n_tiles_side: number of tiles along axis. Tiling MUST be square
         (enforced)
+        :param n_tiles_x: number of tiles along X (alternative to n_tiles_side,
+        tiles can be rectangular)
+        :param n_tiles_y: number of tiles along Y (alternative to n_tiles_side,
+        tiles can be rectangular)
         """
         logger.info('Setting up the target grid')
-        self.grid.setup(min_x, min_y, max_x, max_y, n_tiles_side)
+        self.grid = Grid(min_x, min_y, max_x, max_y, n_tiles_side=n_tiles_side,
+                         n_tiles_x=n_tiles_x, n_tiles_y=n_tiles_y)
         return self
 
-    def split_and_redistribute(self, override_srs=None):
+    def set_catalogue(self, catalogue_file):
         """
-        Split the input file using PDAL and organize the tiles in subfolders
-        using the location on the input grid as naming scheme.
+        Setup a catalogue of the input files (built from the file headers
+        only). Input files that do not overlap the grid are skipped, and the
+        point counts required for validation are read from the catalogue.
+
+        :param catalogue_file: path to the catalogue file, which is created
+        if it does not exist
+        """
+        if not self.grid.is_set:
+            raise ValueError('The grid has not been set!')
+        logger.info('Updating catalogue {}'.format(catalogue_file))
+        self.catalogue = PointCloudCatalogue(catalogue_file, grid=self.grid)
+        self.catalogue.update(self.input_path)
+        return self
+
+    def split_and_redistribute(self, override_srs=None, streaming=False,
+                               chunk_size=1000000, max_open_files=128):
+        """
+        Split the input file and organize the tiles in subfolders using the
+        location on the input grid as naming scheme. By default, the splitting
+        is carried out using PDAL. In streaming mode, the input file is read in
+        chunks using laspy and the points are directly appended to the tiles in
+        the corresponding subfolders, so that memory usage is bounded by the
+        chunk size. Input directories are always split in streaming mode.
+
+        :param override_srs: (Optional) spatial reference system assigned to
+        the output files
+        :param streaming: If True, split the input file in chunks using laspy
+        :param chunk_size: Number of points read at once in streaming mode
+        :param max_open_files: Maximum number of tile files simultaneously
+        open in streaming mode
         """
         self._check_input()
+        input_files = self._get_input_files()
+        if not input_files:
+            logger.warning('Input does not overlap the grid: nothing to split')
+            return self
+        if self.input_path.is_dir():
+            logger.info('Splitting {} files from {} in chunks of {} points '
+                        '...'.format(len(input_files), self.input_path,
+                                     chunk_size))
+            # name the tiles after the input directory, so that different
+            # directories can be retiled to the same output folder
+            output_name = self.input_path.name + input_files[0].suffix
+            _run_laspy_splitter(input_files, self.output_folder, self.grid,
+                                chunk_size, override_srs,
+                                output_name=output_name,
+                                max_open_files=max_open_files)
+            logger.info('... splitting completed.')
+            return self
+        if streaming:
+            logger.info('Splitting file {} in chunks of {} points '
+                        '...'.format(self.input_path, chunk_size))
+            _run_laspy_splitter([self.input_path], self.output_folder,
+                                self.grid, chunk_size, override_srs,
+                                output_name=self.input_path.name,
+                                max_open_files=max_open_files)
+            logger.info('... splitting completed.')
+            return self
+        if not np.isclose(*self.grid.tile_width):
+            raise ValueError('Splitting with PDAL requires square tiles: use '
+                             'streaming=True for rectangular tiles!')
         logger.info('Splitting file {} with PDAL ...'.format(self.input_path))
         _run_PDAL_splitter(self.input_path, self.output_folder,
                            self.grid.grid_mins, self.grid.grid_maxs,
-                           self.grid.n_tiles_side, override_srs)
+                           self.grid.n_tiles_x, override_srs)
         logger.info('... splitting completed.')
         tiles = [f for f in self.output_folder.iterdir()
                  if (f.is_file()
@@ -77,12 +155,22 @@ class Retiler(PipelineRemoteData):
         """
         self._check_input()
         logger.info('Validating split ...')
-        (parent_points, _, _, _, _) = _get_details_pc_file(self.input_path.as_posix())
-        logger.info('... {} points in parent file'.format(parent_points))
+        if self.input_path.is_dir():
+            pattern = 'tile_*/{}.*'.format(self.input_path.name)
+        else:
+            pattern = 'tile_*/{}*'.format(self.input_path.stem)
+        parent_points = 0
+        for input_file in self._get_input_files():
+            if self.catalogue is not None:
+                details = self.catalogue.get_details(input_file)
+            else:
+                details = _get_details_pc_file(input_file.as_posix())
+            parent_points += details[0]
+        logger.info('... {} points in parent file(s)'.format(parent_points))
         valid_split = False
         split_points = 0
         redistributed_to = []
-        tiles = self.output_folder.glob('tile_*/{}*'.format(self.input_path.stem))
+        tiles = self.output_folder.glob(pattern)
 
         for tile in tiles:
             if tile.is_file():
@@ -111,9 +199,74 @@ class Retiler(PipelineRemoteData):
     def _check_input(self):
         if not self.grid.is_set:
             raise ValueError('The grid has not been set!')
-        check_file_exists(self.input_path, should_exist=True)
+        check_path_exists(self.input_path, should_exist=True)
+        if self.input_path.is_dir():
+            _ = _get_input_file_list(self.input_path)
         check_dir_exists(self.output_folder, should_exist=True)
 
+    def _get_input_files(self):
+        if self.input_path.is_dir():
+            input_files = _get_input_file_list(self.input_path)
+        else:
+            input_files = [self.input_path]
+        if self.catalogue is not None:
+            overlapping = [f for f in input_files
+                           if self.catalogue.get_tiles(f)]
+            for f in set(input_files) - set(overlapping):
+                logger.info('... skipping {} (outside grid)'.format(f.name))
+            input_files = overlapping
+        return input_files
+
+
+class _TileWriterPool(object):
+    """
+    Bounded pool of open writers, one per output tile file. When the maximum
+    number of open files is reached, the least recently used writer is closed.
+    Files that have been closed are re-opened in append mode if more points
+    need to be added.
+    """
+    def __init__(self, header, max_open_files=None):
+        self.header = header
+        self.max_open_files = max_open_files
+        self._writers = collections.OrderedDict()
+        self._created = set()
+
+    def write(self, path, points):
+        """
+        Write points to the given tile file, opening it if required.
+
+        :param path: Path of the tile file
+        :param points: Point record to be written
+        """
+        points = _rescale_points(points, self.header)
+        writer = self._writers.pop(path, None)
+        if writer is None:
+            self._evict()
+            if path in self._created:
+                writer = laspy.open(path, mode='a')
+            else:
+                writer = laspy.open(path, mode='w',
+                                    header=copy.deepcopy(self.header))
+                self._created.add(path)
+        self._writers[path] = writer
+        if isinstance(writer, LasAppender):
+            writer.append_points(points)
+        else:
+            writer.write_points(points)
+
+    def close(self):
+        """ Close all open writers. """
+        while self._writers:
+            _, writer = self._writers.popitem(last=False)
+            writer.close()
+
+    def _evict(self):
+        if self.max_open_files is None:
+            return
+        while len(self._writers) >= self.max_open_files:
+            _, writer = self._writers.popitem(last=False)
+            writer.close()
+
 
 def _get_details_pc_file(filename):
     try:
@@ -178,6 +331,85 @@ def _run_PDAL_splitter(filename, tiled_temp_folder, tiling_mins, tiling_maxs,
     PDAL_pipeline.execute()
 
 
+def _get_input_file_list(path):
+    files = sorted([f.absolute() for f in path.iterdir()
+                    if f.is_file() and f.suffix.lower() in ('.las', '.laz')])
+    if not files:
+        raise FileNotFoundError('No LAS/LAZ file in: {}'.format(path))
+    return files
+
+
+def _run_laspy_splitter(filenames, output_folder, grid, chunk_size,
+                        override_srs=None, output_name=None,
+                        max_open_files=None):
+    """
+    Split one or more LAS/LAZ files in chunks. If output_name is not given,
+    tiles are named after the corresponding tile directory.
+    """
+    pool = None
+    tile_paths = {}
+    try:
+        for filename in filenames:
+            logger.info('... reading {}'.format(filename))
+            with laspy.open(filename) as reader:
+                if pool is None:
+                    header = _get_tile_header(reader.header, override_srs)
+                    pool = _TileWriterPool(header, max_open_files)
+                for points in reader.chunk_iterator(chunk_size):
+                    indices = grid.get_tile_index(points.x, points.y)
+                    for tile_index, point_indices in _group_by_tile(indices):
+                        if tile_index not in tile_paths:
+                            tile_id = _get_tile_name(*tile_index)
+                            retiled_folder = output_folder.joinpath(tile_id)
+                            check_dir_exists(retiled_folder, should_exist=True,
+                                             mkdir=True)
+                            name = (output_name if output_name is not None
+                                    else tile_id + filename.suffix)
+                            logger.info('... writing to {}'.format(tile_id))
+                            tile_paths[tile_index] = retiled_folder / name
+                        pool.write(tile_paths[tile_index],
+                                   points[point_indices])
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def _get_tile_header(header, override_srs=None):
+    tile_header = copy.deepcopy(header)
+    if override_srs is not None:
+        tile_header.add_crs(pyproj.CRS.from_user_input(override_srs))
+    return tile_header
+
+
+def _rescale_points(points, header):
+    """ Convert points to the point format, scales and offsets of header. """
+    if points.point_format != header.point_format:
+        raise ValueError('Point format {} does not match the one of the '
+                         'output tiles ({})'.format(points.point_format.id,
+                                                    header.point_format.id))
+    if (np.array_equal(points.scales, header.scales)
+            and np.array_equal(points.offsets, header.offsets)):
+        return points
+    rescaled = laspy.ScaleAwarePointRecord(points.array.copy(),
+                                           header.point_format,
+                                           header.scales,
+                                           header.offsets)
+    rescaled.x = points.x
+    rescaled.y = points.y
+    rescaled.z = points.z
+    return rescaled
+
+
+def _group_by_tile(indices):
+    """ Group the points by tile, given the (N, 2) array of tile indices. """
+    tile_indices, inverse = np.unique(indices, axis=0, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind='stable')
+    bounds = np.cumsum(np.bincount(inverse.ravel()))[:-1]
+    for tile_index, point_indices in zip(tile_indices,
+                                         np.split(order, bounds)):
+        yield tuple(int(idx) for idx in tile_index), point_indices
+
+
 def _print_PDAL_pipeline_dict(dictionary):
     logger.debug('... PDAL input:')
     for el in dictionary.get("pipeline"):
@@ -0,0 +1,215 @@
+import os
+import pathlib
+import shutil
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from laserfarm.catalogue import PointCloudCatalogue, ShapefileCatalogue
+from laserfarm.grid import Grid
+from .tools import get_number_of_points_in_LAZ_file, write_shapefile
+
+
+class TestPointCloudCatalogue(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _input_files = ['C_43FN1_1.LAZ', 'C_43FN1_1_1.LAZ', 'C_43FN1_1_2.LAZ']
+    _catalogue_file = 'test_tmp_dir/catalogue.sqlite'
+    _grid_input = (-113107.8100, 214783.8700, 398892.1900, 726783.87, 256)
+
+    def setUp(self):
+        self._input_dir = os.path.join(self._test_dir, 'input')
+        os.makedirs(self._input_dir)
+        for input_file in self._input_files:
+            shutil.copy(os.path.join('testdata', input_file), self._input_dir)
+        self.grid = Grid()
+        self.grid.setup(*self._grid_input)
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _get_path(self, filename):
+        return pathlib.Path(self._input_dir).joinpath(filename).absolute()
+
+    def test_filesAreAdded(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            files = cat.get_files()
+        self.assertListEqual(files, [self._get_path(f).as_posix()
+                                     for f in self._input_files])
+
+    def test_details(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            path = self._get_path(self._input_files[0])
+            count, mins, maxs, scales, offsets = cat.get_details(path)
+        self.assertEqual(count, get_number_of_points_in_LAZ_file(path))
+        np.testing.assert_allclose(scales, [0.01, 0.01, 0.01])
+        self.assertTrue(np.all(mins < maxs))
+
+    def test_tilesPerFile(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            tiles = cat.get_tiles(self._get_path('C_43FN1_1.LAZ'))
+            all_tiles = cat.get_tiles()
+        self.assertListEqual(tiles, [(101, 101), (101, 102)])
+        self.assertListEqual(all_tiles, [(101, 101), (101, 102)])
+
+    def test_filesPerTile(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            files = cat.get_files(101, 102)
+            no_files = cat.get_files(0, 0)
+        self.assertIn(self._get_path('C_43FN1_1_2.LAZ').as_posix(), files)
+        self.assertNotIn(self._get_path('C_43FN1_1_1.LAZ').as_posix(), files)
+        self.assertListEqual(no_files, [])
+
+    def test_gridIsStored(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+        with PointCloudCatalogue(self._catalogue_file) as cat:
+            self.assertListEqual(cat.get_tiles(), [(101, 101), (101, 102)])
+
+    def test_gridIsChanged(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+        grid = Grid()
+        grid.setup(0., 0., 1., 1., 1)
+        with PointCloudCatalogue(self._catalogue_file, grid) as cat:
+            self.assertListEqual(cat.get_tiles(), [])
+
+    def test_activeTiles(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            mask = cat.get_active_tiles()
+        self.assertTupleEqual(mask.shape, (256, 256))
+        np.testing.assert_array_equal(np.argwhere(mask),
+                                      [[101, 101], [101, 102]])
+
+    def test_rectangularGrid(self):
+        grid = Grid(*self._grid_input[:4], n_tiles_x=256, n_tiles_y=128)
+        with PointCloudCatalogue(self._catalogue_file, grid) as cat:
+            cat.update(self._input_dir)
+        with PointCloudCatalogue(self._catalogue_file) as cat:
+            self.assertEqual(cat.grid, grid)
+            self.assertListEqual(cat.get_tiles(), [(101, 50), (101, 51)])
+
+    def test_removedFilesAreDropped(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            os.remove(self._get_path('C_43FN1_1.LAZ'))
+            cat.update(self._input_dir)
+            self.assertEqual(len(cat.get_files()), 2)
+
+    def test_pointCount(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            cat.update(self._input_dir)
+            paths = [self._get_path(f) for f in self._input_files[1:]]
+            self.assertEqual(cat.get_point_count(paths), 308880)
+
+    def test_gridNotSet(self):
+        with PointCloudCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            with self.assertRaises(ValueError):
+                cat.get_tiles()
+
+    def test_inputNonexistent(self):
+        with PointCloudCatalogue(self._catalogue_file, self.grid) as cat:
+            with self.assertRaises(FileNotFoundError):
+                cat.update(os.path.join(self._test_dir, 'tmp'))
+
+
+class TestShapefileCatalogue(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _catalogue_file = 'test_tmp_dir/catalogue.sqlite'
+
+    def setUp(self):
+        self._input_dir = os.path.join(self._test_dir, 'input')
+        os.makedirs(self._input_dir)
+        self._write_shapefile('polygons_1.shp', [(0., 0.), (5., 5.)])
+        self._write_shapefile('polygons_2.shp', [(10., 10.)])
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _get_path(self, filename):
+        return pathlib.Path(self._input_dir).joinpath(filename).absolute()
+
+    def _write_shapefile(self, filename, corners, size=1.):
+        polygons = [[[(x, y), (x, y + size), (x + size, y + size),
+                      (x + size, y), (x, y)]] for x, y in corners]
+        write_shapefile(self._get_path(filename), polygons)
+
+    def test_filesAreAdded(self):
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            files = cat.get_files()
+        self.assertListEqual(files, [self._get_path(f).as_posix() for f
+                                     in ['polygons_1.shp', 'polygons_2.shp']])
+
+    def test_filesInBoundingBox(self):
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            files = cat.get_files((8., 8., 20., 20.))
+        self.assertListEqual(files,
+                             [self._get_path('polygons_2.shp').as_posix()])
+
+    def test_recordsInBoundingBox(self):
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            records = cat.get_records((4.5, 4.5, 10.5, 10.5))
+            no_records = cat.get_records((2., 2., 3., 3.))
+        self.assertDictEqual(records,
+                             {self._get_path('polygons_1.shp').as_posix(): [1],
+                              self._get_path('polygons_2.shp').as_posix(): [0]})
+        self.assertDictEqual(no_records, {})
+
+    def test_recordsInDirectory(self):
+        other_dir = pathlib.Path(self._test_dir).joinpath('other').absolute()
+        other_dir.mkdir()
+        write_shapefile(other_dir / 'polygons.shp',
+                        [[[(0., 0.), (0., 1.), (1., 1.), (0., 0.)]]])
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            cat.update(other_dir)
+            all_records = cat.get_records((0., 0., 1., 1.))
+            records = cat.get_records((0., 0., 1., 1.),
+                                      directory=self._input_dir)
+        self.assertEqual(len(all_records), 2)
+        self.assertDictEqual(records,
+                             {self._get_path('polygons_1.shp').as_posix(): [0]})
+
+    def test_modifiedFileIsUpdated(self):
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+        self._write_shapefile('polygons_2.shp', [(20., 20.), (2., 2.)],
+                              size=2.)
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            records = cat.get_records((2.5, 2.5, 3., 3.))
+            no_records = cat.get_records((10., 10., 11., 11.))
+        self.assertDictEqual(records,
+                             {self._get_path('polygons_2.shp').as_posix(): [1]})
+        self.assertDictEqual(no_records, {})
+
+    def test_unchangedFileIsNotRead(self):
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            with patch.object(ShapefileCatalogue, '_add_file') as add_file:
+                cat.update(self._input_dir)
+        add_file.assert_not_called()
+
+    def test_removedFileIsDropped(self):
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+        for suffix in ['.shp', '.shx', '.dbf']:
+            os.remove(self._get_path('polygons_2' + suffix))
+        with ShapefileCatalogue(self._catalogue_file) as cat:
+            cat.update(self._input_dir)
+            files = cat.get_files()
+            records = cat.get_records((9., 9., 20., 20.))
+        self.assertListEqual(files,
+                             [self._get_path('polygons_1.shp').as_posix()])
+        self.assertDictEqual(records, {})
@@ -0,0 +1,219 @@
+import os
+import pathlib
+import shutil
+import unittest
+
+from laserchicken import export, filter, load
+import numpy as np
+
+from laserfarm.classification import Classification
+from .tools import create_test_point_cloud, write_shapefile
+
+
+class TestClassification(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _test_data_dir = 'testdata'
+    _test_file = 'tile_170_107.ply'
+
+    def setUp(self):
+        os.mkdir(self._test_dir)
+        self.pipeline = Classification()
+        self.pipeline.point_cloud = create_test_point_cloud(nx_values=10)
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _get_classified_points(self):
+        ground_type = self.pipeline.point_cloud['vertex']['ground_type']
+        return np.flatnonzero(ground_type['data'])
+
+    def test_locateShp(self):
+        self.pipeline.input_folder = self._test_data_dir
+        self.pipeline.input_path = self._test_file
+        self.pipeline.locate_shp('shp')
+        self.assertListEqual([shp.name for shp in self.pipeline.input_shp],
+                             ['41W_waterdeel.shp'])
+
+    def test_locateShpWithCatalogue(self):
+        catalogue_file = os.path.join(self._test_dir, 'catalogue.sqlite')
+        self.pipeline.input_folder = self._test_data_dir
+        self.pipeline.input_path = self._test_file
+        self.pipeline.locate_shp('shp', catalogue_file=catalogue_file)
+        self.assertListEqual([shp.name for shp in self.pipeline.input_shp],
+                             ['41W_waterdeel.shp'])
+        self.assertListEqual(list(self.pipeline.input_records.values()),
+                             [[0]])
+        self.assertTrue(os.path.isfile(catalogue_file))
+
+    def test_classificationWithRecords(self):
+        shp = pathlib.Path(self._test_dir) / 'polygons.shp'
+        write_shapefile(shp, [[[(.5, .5), (.5, 2.5), (1.5, 2.5),
+                                (1.5, .5), (.5, .5)]],
+                              [[(5.5, 5.5), (5.5, 6.5), (6.5, 6.5),
+                                (6.5, 5.5), (5.5, 5.5)]]])
+        self.pipeline.input_shp = [shp]
+        self.pipeline.input_records = {shp: [1]}
+        self.pipeline.classification(ground_type=1)
+        np.testing.assert_array_equal(self._get_classified_points(), [66])
+
+    def test_classificationAsSelectPolygon(self):
+        self.pipeline.input_folder = self._test_data_dir
+        self.pipeline.input_path = self._test_file
+        self.pipeline.locate_shp('shp')
+        self.pipeline.classification(ground_type=2)
+        point_cloud = load(os.path.join(self._test_data_dir,
+                                        self._test_file))
+        shp = self.pipeline.input_shp[0].as_posix()
+        mask = filter.select_polygon(point_cloud, shp, read_from_file=True,
+                                     return_mask=True)
+        ground_type = self.pipeline.point_cloud['vertex']['ground_type']
+        np.testing.assert_array_equal(ground_type['data'],
+                                      np.where(mask, 2, 0))
+
+    def test_pointsOnBoundaryAreExcluded(self):
+        shp = pathlib.Path(self._test_dir) / 'polygons.shp'
+        write_shapefile(shp, [[[(1., 1.), (1., 3.), (3., 3.), (3., 1.),
+                                (1., 1.)]]])
+        self.pipeline.input_shp = [shp]
+        self.pipeline.classification(ground_type=1)
+        np.testing.assert_array_equal(self._get_classified_points(), [22])
+
+    def test_polygonsFromMultipleFiles(self):
+        shp_1 = pathlib.Path(self._test_dir) / 'polygons_1.shp'
+        write_shapefile(shp_1, [[[(.5, .5), (.5, 2.5), (1.5, 2.5),
+                                  (1.5, .5), (.5, .5)]],
+                                [[(30., 30.), (30., 40.), (40., 40.),
+                                  (40., 30.), (30., 30.)]]])
+        shp_2 = pathlib.Path(self._test_dir) / 'polygons_2.shp'
+        write_shapefile(shp_2, [[[(5.5, 5.5), (5.5, 6.5), (6.5, 6.5),
+                                  (6.5, 5.5), (5.5, 5.5)]]])
+        self.pipeline.input_shp = [shp_1, shp_2]
+        self.pipeline.classification(ground_type=1)
+        np.testing.assert_array_equal(self._get_classified_points(),
+                                      [11, 21, 66])
+
+    def test_cellSize(self):
+        shp = pathlib.Path(self._test_dir) / 'polygons.shp'
+        # polygon with a hole
+        write_shapefile(shp, [[[(.5, .5), (.5, 8.5), (8.5, 8.5), (8.5, .5),
+                                (.5, .5)],
+                               [(2.5, 2.5), (6.5, 2.5), (6.5, 6.5),
+                                (2.5, 6.5), (2.5, 2.5)]]])
+        self.pipeline.input_shp = [shp]
+        x = self.pipeline.point_cloud['vertex']['x']['data']
+        y = self.pipeline.point_cloud['vertex']['y']['data']
+        in_outer = (x > .5) & (x < 8.5) & (y > .5) & (y < 8.5)
+        in_hole = (x > 2.5) & (x < 6.5) & (y > 2.5) & (y < 6.5)
+        expected = np.flatnonzero(in_outer & ~in_hole)
+        for cell_size in [None, .3, 1., 2.5, 100.]:
+            self.pipeline.classification(ground_type=1, cell_size=cell_size)
+            np.testing.assert_array_equal(self._get_classified_points(),
+                                          expected)
+            self.pipeline.point_cloud['vertex'].pop('ground_type')
+
+    def test_emptyPointCloud(self):
+        shp = pathlib.Path(self._test_dir) / 'polygons.shp'
+        write_shapefile(shp, [[[(1., 1.), (1., 3.), (3., 3.), (3., 1.),
+                                (1., 1.)]]])
+        self.pipeline.point_cloud = create_test_point_cloud(nx_values=0)
+        self.pipeline.input_shp = [shp]
+        self.pipeline.classification(ground_type=1)
+        self.assertEqual(self._get_classified_points().size, 0)
+
+    def test_invalidPolygon(self):
+        shp = pathlib.Path(self._test_dir) / 'polygons.shp'
+        write_shapefile(shp, [[[(1., 1.), (3., 3.), (3., 1.), (1., 3.),
+                                (1., 1.)]]])
+        self.pipeline.input_shp = [shp]
+        with self.assertRaises(ValueError):
+            self.pipeline.classification(ground_type=1)
+
+
+class TestMultiClassClassification(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _test_file = 'tile.ply'
+
+    def setUp(self):
+        os.mkdir(self._test_dir)
+        export(create_test_point_cloud(nx_values=10),
+               os.path.join(self._test_dir, self._test_file))
+        # classes with overlapping polygons
+        self._write_shapefile('water', [(.5, .5), (.5, 2.5), (2.5, 2.5),
+                                        (2.5, .5), (.5, .5)])
+        self._write_shapefile('buildings', [(1.5, .5), (1.5, 1.5),
+                                            (3.5, 1.5), (3.5, .5),
+                                            (1.5, .5)])
+        self.pipeline = Classification(input_file=self._test_file)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.output_folder = self._test_dir
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _write_shapefile(self, shp_dir, ring):
+        os.mkdir(os.path.join(self._test_dir, shp_dir))
+        write_shapefile(os.path.join(self._test_dir, shp_dir, 'polygons.shp'),
+                        [[ring]])
+
+    def _get_ground_type(self):
+        return self.pipeline.point_cloud['vertex']['ground_type']
+
+    def test_locateShp(self):
+        self.pipeline.locate_shp({'1': 'water', '2': 'buildings'})
+        self.assertListEqual(list(self.pipeline.input_classes.keys()),
+                             [1, 2])
+        self.assertListEqual(self.pipeline.input_shp, [])
+
+    def test_locateShpWithCatalogue(self):
+        catalogue_file = os.path.join(self._test_dir, 'catalogue.sqlite')
+        self.pipeline.locate_shp({1: 'water', 2: 'buildings'},
+                                 catalogue_file=catalogue_file)
+        for ground_type, shp_dir in [(1, 'water'), (2, 'buildings')]:
+            shp_files, records = self.pipeline.input_classes[ground_type]
+            self.assertListEqual([shp.parent.name for shp in shp_files],
+                                 [shp_dir])
+            self.assertListEqual(list(records.values()), [[0]])
+
+    def test_classification(self):
+        self.pipeline.locate_shp({1: 'water', 2: 'buildings'})
+        self.pipeline.classification()
+        ground_type = self._get_ground_type()
+        self.assertEqual(ground_type['type'], 'uint8')
+        np.testing.assert_array_equal(np.flatnonzero(ground_type['data']),
+                                      [11, 12, 13, 21, 22])
+        np.testing.assert_array_equal(ground_type['data'][[11, 12, 13]],
+                                      [1, 1, 2])
+
+    def test_priority(self):
+        self.pipeline.locate_shp({1: 'water', 2: 'buildings'})
+        self.pipeline.classification(priority=[2, 1])
+        ground_type = self._get_ground_type()
+        np.testing.assert_array_equal(ground_type['data'][[11, 12, 13]],
+                                      [1, 2, 2])
+
+    def test_export(self):
+        self.pipeline.locate_shp({1: 'water', 2: 'buildings'})
+        self.pipeline.classification()
+        self.pipeline.export_point_cloud()
+        point_cloud = load(os.path.join(self._test_dir,
+                                        'tile_classification.ply'))
+        ground_type = point_cloud['vertex']['ground_type']['data']
+        self.assertEqual(ground_type.dtype, np.uint8)
+        self.assertEqual(np.count_nonzero(ground_type), 5)
+
+    def test_groundTypeIsProvided(self):
+        self.pipeline.locate_shp({1: 'water', 2: 'buildings'})
+        with self.assertRaises(ValueError):
+            self.pipeline.classification(ground_type=1)
+
+    def test_incompletePriority(self):
+        self.pipeline.locate_shp({1: 'water', 2: 'buildings'})
+        with self.assertRaises(ValueError):
+            self.pipeline.classification(priority=[2])
+
+    def test_groundTypeOutOfRange(self):
+        self.pipeline.locate_shp({1: 'water', 256: 'buildings'})
+        with self.assertRaises(ValueError):
+            self.pipeline.classification()
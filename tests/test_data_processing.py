@@ -1,12 +1,24 @@
+import copy
 import os
 import pathlib
 import shutil
 import unittest
+from unittest.mock import patch
 
+from laserchicken import load
+from laserchicken.utils import copy_point_cloud
 import numpy as np
 
-from laserfarm.data_processing import DataProcessing
-from .tools import create_test_point_cloud, get_number_of_points_in_LAZ_file
+from laserfarm.catalogue import PointCloudCatalogue
+from laserfarm.data_processing import DataProcessing, \
+    _compute_features_in_processes, _copy_to_shared_memory, \
+    _release_shared_memory
+from laserfarm.grid import Grid
+from laserfarm.kd_tree_cache import KDTreeCache
+from laserfarm.parquet_handler import read_parquet_columns
+from laserfarm.retiler import Retiler
+from .tools import create_test_point_cloud, \
+    get_number_of_points_in_LAZ_file, is_memory_mapped
 
 
 class TestInitializeDataProcessing(unittest.TestCase):
@@ -120,6 +132,103 @@ class TestLoad(unittest.TestCase):
         self.pipeline.load()
         self.assertEqual(len(self.pipeline.point_cloud['log']), 1)
 
+    def test_loadDataWithCatalogue(self):
+        os.mkdir(self._test_dir)
+        for input_file in ('C_43FN1_1_1.LAZ', 'C_43FN1_1_2.LAZ'):
+            shutil.copy(os.path.join('testdata', input_file), self._test_dir)
+        grid = Grid()
+        grid.setup(-113107.81, 214783.87, 398892.19, 726783.87, 256)
+        catalogue_file = os.path.join(self._test_dir, 'catalogue.sqlite')
+        with PointCloudCatalogue(catalogue_file, grid) as catalogue:
+            catalogue.update(self._test_dir)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline._tile_index = (101, 102)
+        self.pipeline.set_catalogue(catalogue_file)
+        with patch('laserfarm.data_processing.PointCloudCatalogue.close',
+                   autospec=True,
+                   side_effect=PointCloudCatalogue.close) as mock_close:
+            self.pipeline.load()
+        mock_close.assert_called_once()
+        self.assertEqual(_get_point_cloud_size(self.pipeline.point_cloud),
+                         1210)
+
+    def test_loadRetiledDataWithCatalogue(self):
+        input_dir = os.path.join(self._test_dir, 'input')
+        os.makedirs(input_dir)
+        for input_file in ('C_43FN1_1_1.LAZ', 'C_43FN1_1_2.LAZ'):
+            shutil.copy(os.path.join('testdata', input_file), input_dir)
+        catalogue_file = os.path.join(self._test_dir, 'catalogue.sqlite')
+        retiler = Retiler(input_file=input_dir)
+        retiler.output_folder = self._test_dir
+        retiler.set_grid(-113107.81, 214783.87, 398892.19, 726783.87, 256)
+        retiler.set_catalogue(catalogue_file)
+        retiler.split_and_redistribute()
+        retiler.catalogue.close()
+        self.pipeline.input_folder = os.path.join(self._test_dir,
+                                                  'tile_101_102')
+        self.pipeline._tile_index = (101, 102)
+        self.pipeline.set_catalogue(catalogue_file)
+        with self.assertLogs('laserfarm.data_processing', 'WARNING'):
+            self.pipeline.load()
+        self.assertEqual(_get_point_cloud_size(self.pipeline.point_cloud),
+                         1210)
+
+    def test_loadDataFromManyFiles(self):
+        os.mkdir(self._test_dir)
+        for input_file in ('C_43FN1_1_1.LAZ', 'C_43FN1_1_2.LAZ'):
+            shutil.copy(os.path.join('testdata', input_file), self._test_dir)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.load(scratch_dir=self._test_dir, n_threads=2)
+        self.assertEqual(_get_point_cloud_size(self.pipeline.point_cloud),
+                         self._points_in_file)
+        self.assertEqual(len(self.pipeline.point_cloud['log']), 1)
+        for attribute in self.pipeline.point_cloud['vertex'].values():
+            self.assertTrue(is_memory_mapped(attribute['data']))
+
+    def test_loadDataMemoryMapped(self):
+        os.mkdir(self._test_dir)
+        self.pipeline.input_path = self._input_file_path
+        self.pipeline.load(scratch_dir=self._test_dir)
+        self.assertEqual(_get_point_cloud_size(self.pipeline.point_cloud),
+                         self._points_in_file)
+        for attribute in self.pipeline.point_cloud['vertex'].values():
+            self.assertTrue(is_memory_mapped(attribute['data']))
+
+    def test_loadDataNotMemoryMapped(self):
+        self.pipeline.input_path = self._input_file_path
+        self.pipeline.load()
+        for attribute in self.pipeline.point_cloud['vertex'].values():
+            self.assertFalse(is_memory_mapped(attribute['data']))
+
+    def test_loadRequiredAttributes(self):
+        self.pipeline.input_path = self._input_file_path
+        self.pipeline.input = {
+            'load': {},
+            'apply_filter': {'filter_type': 'select_above',
+                             'attribute': 'intensity',
+                             'threshold': 10},
+            'extract_features': {'feature_names': ['pulse_penetration_ratio',
+                                                   'mean_normalized_height'],
+                                 'volume_type': 'cell',
+                                 'volume_size': 10.}
+        }
+        self.pipeline.load()
+        read_attr = list(self.pipeline.point_cloud['vertex'].keys())
+        self.assertListEqual(read_attr, ['x', 'y', 'z', 'intensity',
+                                         'raw_classification'])
+
+    def test_loadAllAttributesForExport(self):
+        self.pipeline.input_path = self._input_file_path
+        self.pipeline.input = {'load': {},
+                               'export_point_cloud': {},
+                               'extract_features': {
+                                   'feature_names': ['mean_z'],
+                                   'volume_type': 'cell',
+                                   'volume_size': 10.}}
+        self.pipeline.load()
+        read_attr = list(self.pipeline.point_cloud['vertex'].keys())
+        self.assertIn('gps_time', read_attr)
+
     def test_loadDataEmptyDirectory(self):
         os.mkdir(self._test_dir)
         self.pipeline.input_folder = self._test_dir
@@ -280,6 +389,29 @@ class TestExportPointCloud(unittest.TestCase):
             self.pipeline.export_point_cloud(filename='folder/tmp.ply')
 
 
+class TestSetKDTreeCache(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+
+    def setUp(self):
+        os.mkdir(self._test_dir)
+        self.pipeline = DataProcessing()
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.point_cloud = create_test_point_cloud(nx_values=10)
+        self.pipeline.targets = create_test_point_cloud(nx_values=5,
+                                                        grid_spacing=2.)
+
+    def tearDown(self):
+        KDTreeCache.uninstall()
+        shutil.rmtree(self._test_dir)
+
+    def test_treesArePersisted(self):
+        self.pipeline.set_kd_tree_cache(persist=True)
+        self.pipeline.extract_features('sphere', 2., ['point_density'])
+        cache_dir = os.path.join(self._test_dir, 'kd_trees')
+        self.assertTrue(os.listdir(cache_dir))
+
+
 class TestExtractFeatures(unittest.TestCase):
 
     def setUp(self):
@@ -315,6 +447,79 @@ class TestExtractFeatures(unittest.TestCase):
         self.pipeline.extract_features(**self._input)
         self.assertEqual(len(self.pipeline.targets['log']), 2)
 
+    def test_blocksSameAsFullTile(self):
+        targets = copy.deepcopy(self.pipeline.targets)
+        self.pipeline.extract_features(**self._input)
+        expected = self.pipeline.targets['vertex'][self._feature]['data']
+        self.pipeline.targets = targets
+        self.pipeline.extract_features(**self._input, block_size=3.)
+        density = self.pipeline.targets['vertex'][self._feature]['data']
+        np.testing.assert_allclose(density, expected)
+
+    def test_blocksProvenanceIsAdded(self):
+        self.pipeline.targets.pop('log')
+        self.pipeline.extract_features(**self._input, block_size=3.)
+        self.assertEqual(len(self.pipeline.targets['log']), 2)
+
+    def test_processesSameAsSerial(self):
+        targets = copy.deepcopy(self.pipeline.targets)
+        self.pipeline.extract_features(**self._input)
+        expected = self.pipeline.targets['vertex'][self._feature]['data']
+        self.pipeline.targets = targets
+        self.pipeline.extract_features(**self._input, n_processes=2)
+        density = self.pipeline.targets['vertex'][self._feature]['data']
+        np.testing.assert_allclose(density, expected)
+
+    def test_processesWithCustomFeature(self):
+        self.pipeline.add_custom_feature('BandRatioFeatureExtractor',
+                                         lower_limit=None,
+                                         upper_limit=50,
+                                         data_key='z')
+        input = self._input.copy()
+        input['feature_names'] = ['band_ratio_z_50']
+        self.pipeline.extract_features(**input, block_size=3.,
+                                       n_processes=2)
+        self.assertIn('band_ratio_z_50', self.pipeline.targets['vertex'])
+
+    def test_processesBoundedBlocksInFlight(self):
+        n_processes = 2
+        n_submitted = []
+
+        def target_blocks():
+            for n in range(20):
+                n_submitted.append(n)
+                yield copy_point_cloud(self.pipeline.targets, [n])
+
+        shared_memory_blocks, arrays = _copy_to_shared_memory(
+            self.pipeline.point_cloud
+        )
+        env_indices = (np.arange(100) for _ in range(20))
+        task_args = ('cell', 2., [self._feature], None)
+        results = _compute_features_in_processes(arrays, [], target_blocks(),
+                                                 env_indices, task_args,
+                                                 n_processes)
+        try:
+            next(results)
+            self.assertEqual(len(n_submitted), 2 * n_processes + 1)
+            self.assertEqual(len(list(results)), 19)
+        finally:
+            results.close()
+            _release_shared_memory(shared_memory_blocks)
+
+    def test_processesSharedMemoryIsReleasedOnError(self):
+        with patch('laserfarm.data_processing._gather_block_features',
+                   side_effect=RuntimeError), \
+                patch('laserfarm.data_processing._release_shared_memory',
+                      wraps=_release_shared_memory) as mock_release:
+            with self.assertRaises(RuntimeError):
+                self.pipeline.extract_features(**self._input, block_size=3.,
+                                               n_processes=2)
+        mock_release.assert_called_once()
+
+    def test_blockSizeInvalid(self):
+        with self.assertRaises(ValueError):
+            self.pipeline.extract_features(**self._input, block_size=0.)
+
     def test_volumeTypeNonexistent(self):
         input = self._input.copy()
         input['volume_type'] = 'nonexistent_volume'
@@ -408,6 +613,104 @@ class TestGenerateTargets(unittest.TestCase):
             self.pipeline.generate_targets(**self._input)
 
 
+class TestIncrementalFeatureExtraction(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _input = {'volume_type': 'cell', 'volume_size': 2.}
+
+    def setUp(self):
+        os.mkdir(self._test_dir)
+        self.pipeline = self._get_pipeline()
+        self.pipeline.extract_features(**self._input,
+                                       feature_names=['point_density'])
+        self._point_density = \
+            self.pipeline.targets['vertex']['point_density']['data']
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _get_pipeline(self):
+        pipeline = DataProcessing(tile_index=(0, 0))
+        pipeline.output_folder = self._test_dir
+        pipeline.point_cloud = create_test_point_cloud(nx_values=10,
+                                                       grid_spacing=1.,
+                                                       offset=0.5)
+        pipeline.targets = create_test_point_cloud(nx_values=5,
+                                                   grid_spacing=2.,
+                                                   offset=1.,
+                                                   log=False)
+        return pipeline
+
+    def test_onlyMissingFeaturesAreComputed(self):
+        self.pipeline.export_targets()
+        pipeline = self._get_pipeline()
+        pipeline.extract_features(**self._input,
+                                  feature_names=['point_density', 'mean_z'],
+                                  incremental=True)
+        self.assertListEqual(pipeline._existing_features, ['point_density'])
+        np.testing.assert_allclose(
+            pipeline.targets['vertex']['point_density']['data'],
+            self._point_density
+        )
+        self.assertIn('mean_z', pipeline.targets['vertex'])
+        pipeline.export_targets()
+        path = os.path.join(self._test_dir, 'tile_0_0.ply')
+        attributes = _get_attributes_in_PLY_file(path)
+        self.assertIn('point_density', attributes)
+        self.assertIn('mean_z', attributes)
+
+    def test_featuresNotRequestedAreKept(self):
+        self.pipeline.export_targets()
+        pipeline = self._get_pipeline()
+        pipeline.extract_features(**self._input, feature_names=['mean_z'],
+                                  incremental=True)
+        pipeline.export_targets()
+        path = os.path.join(self._test_dir, 'tile_0_0.ply')
+        attributes = _get_attributes_in_PLY_file(path)
+        self.assertIn('point_density', attributes)
+        self.assertIn('mean_z', attributes)
+        # explicit list of attributes
+        pipeline = self._get_pipeline()
+        pipeline.extract_features(**self._input,
+                                  feature_names=['max_z'],
+                                  incremental=True)
+        pipeline.export_targets(attributes=['max_z'])
+        attributes = _get_attributes_in_PLY_file(path)
+        for feature in ['point_density', 'mean_z', 'max_z']:
+            self.assertIn(feature, attributes)
+
+    def test_singleBandFilesAreNotRewritten(self):
+        self.pipeline.export_targets(attributes=['point_density'],
+                                     multi_band_files=False)
+        pipeline = self._get_pipeline()
+        pipeline.input = {'export_targets': {'multi_band_files': False}}
+        pipeline.extract_features(**self._input,
+                                  feature_names=['point_density', 'mean_z'],
+                                  incremental=True)
+        pipeline.export_targets(attributes=['point_density', 'mean_z'],
+                                multi_band_files=False)
+        self.assertListEqual(sorted(os.listdir(self._test_dir)),
+                             ['mean_z', 'point_density'])
+
+    def test_allFeaturesExist(self):
+        self.pipeline.export_targets()
+        pipeline = self._get_pipeline()
+        pipeline.extract_features(**self._input,
+                                  feature_names=['point_density'],
+                                  incremental=True)
+        self.assertNotIn('log', pipeline.targets)
+
+    def test_differentTargetsAreIgnored(self):
+        self.pipeline.export_targets()
+        pipeline = self._get_pipeline()
+        pipeline.targets = create_test_point_cloud(nx_values=4,
+                                                   grid_spacing=2.)
+        pipeline.extract_features(**self._input,
+                                  feature_names=['point_density'],
+                                  incremental=True)
+        self.assertListEqual(pipeline._existing_features, [])
+
+
 class TestExportTargets(unittest.TestCase):
 
     _test_dir = 'test_tmp_dir'
@@ -467,6 +770,30 @@ class TestExportTargets(unittest.TestCase):
             with self.assertRaises(UnicodeDecodeError):
                 f.read()
 
+    def test_exportParquet(self):
+        self.pipeline.output_folder = self._test_dir
+        self.pipeline.export_targets(format='.parquet')
+        output_name = 'tile_{}_{}.parquet'.format(*self.pipeline._tile_index)
+        self.assertListEqual([output_name], os.listdir(self._test_dir))
+        columns = read_parquet_columns(
+            os.path.join(self._test_dir, output_name), ['x', 'feature_1']
+        )
+        points = self.pipeline.targets['vertex']
+        np.testing.assert_array_equal(columns['x'], points['x']['data'])
+        np.testing.assert_array_equal(columns['feature_1'],
+                                      points['feature_1']['data'])
+
+    def test_exportParquetSingleBandFiles(self):
+        self.pipeline.output_folder = self._test_dir
+        self.pipeline.export_targets(multi_band_files=False,
+                                     format='.parquet')
+        output_name = 'tile_{}_{}.parquet'.format(*self.pipeline._tile_index)
+        for feature in ['feature_1', 'feature_2']:
+            output_path = os.path.join(self._test_dir, feature, output_name)
+            point_cloud = load(output_path)
+            self.assertListEqual(['x', 'y', 'z', feature],
+                                 list(point_cloud['vertex'].keys()))
+
     def test_outputFolderNonexistent(self):
         self.pipeline.output_folder = os.path.join(self._test_dir, 'tmp')
         with self.assertRaises(FileNotFoundError):
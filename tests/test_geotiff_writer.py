@@ -1,13 +1,36 @@
+import concurrent.futures
+import json
 import os
 import pathlib
 import shutil
 import unittest
+from unittest.mock import patch
 
-from laserfarm.geotiff_writer import GeotiffWriter
+import numpy as np
+from osgeo import gdal
 
+from laserfarm.geotiff_writer import GeotiffWriter, _convertToCOG, \
+    _getFlatIndex, _getGeoCoding, _getRasterFrame, \
+    _getStreamingRasterFrame, _getTileStats, _getTileWindow, _updateManifest
+from laserfarm.grid import Grid
+
+from laserchicken import export
+from laserchicken.utils import create_point_cloud
 from .tools import write_PLY_targets
 
 
+def write_rectangular_PLY_targets(directory, indices, grid, mesh_size):
+    for (nx, ny) in indices:
+        x, y = grid.generate_tile_mesh(nx, ny, mesh_size)
+        export(create_point_cloud(x, y, np.zeros_like(x)),
+               os.path.join(directory, 'tile_{}_{}.ply'.format(nx, ny)))
+
+
+def read_geotiff(file_path):
+    dataset = gdal.Open(file_path)
+    return dataset.ReadAsArray(), dataset.GetGeoTransform()
+
+
 class test_parsePointCloud(unittest.TestCase):
 
     _test_dir = 'test_tmp_dir'
@@ -67,6 +90,105 @@ class test_parsePointCloud(unittest.TestCase):
         self.assertEqual(self.pipeline.LengthDataRecord,
                          expected_lenght)
 
+    def test_parquetFiles(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim,
+                          format='.parquet')
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.parse_point_cloud(format='.parquet')
+        expected_tile_list = ['tile_{}_{}.parquet'.format(nx, ny)
+                              for (nx, ny) in self._tile_indices]
+        self.assertListEqual(sorted(self.pipeline.InputTiles),
+                             sorted(expected_tile_list))
+        self.assertEqual(self.pipeline.LengthDataRecord,
+                         self._n_points_per_tile_and_dim**2)
+        self.assertEqual(self.pipeline.xResolution, self._grid_spacing)
+
+    def test_noFilesInFormat(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.input_folder = self._test_dir
+        with self.assertRaises(IOError):
+            self.pipeline.parse_point_cloud(format='.parquet')
+
+    def test_unsupportedFormat(self):
+        self.pipeline.input_folder = self._test_dir
+        with self.assertRaises(ValueError):
+            self.pipeline.parse_point_cloud(format='.las')
+
+    def test_manifest(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.parse_point_cloud(manifest=True)
+        self.assertIn('geotiff_writer_manifest.json',
+                      os.listdir(self._test_dir))
+        self.assertEqual(self.pipeline.LengthDataRecord,
+                         self._n_points_per_tile_and_dim**2)
+        self.assertEqual(self.pipeline.xResolution, self._grid_spacing)
+        self.assertEqual(len(self.pipeline.tileExtents),
+                         len(self._tile_indices))
+
+    def test_manifestIsReused(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.parse_point_cloud(manifest=True)
+        pipeline = GeotiffWriter()
+        pipeline.input_folder = self._test_dir
+        with patch('laserfarm.geotiff_writer._getTileStats') as mock_stats:
+            pipeline.parse_point_cloud(manifest=True)
+        mock_stats.assert_not_called()
+        self.assertEqual(pipeline.LengthDataRecord,
+                         self.pipeline.LengthDataRecord)
+        self.assertEqual(pipeline.xResolution, self.pipeline.xResolution)
+        self.assertDictEqual(pipeline.tileExtents, self.pipeline.tileExtents)
+
+    def test_manifestModifiedTileIsParsed(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.parse_point_cloud(manifest=True)
+        os.remove(os.path.join(self._test_dir, 'tile_0_0.ply'))
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices[:1],
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim,
+                          is_binary=True)
+        with patch('laserfarm.geotiff_writer._getTileStats',
+                   wraps=_getTileStats) as mock_stats:
+            self.pipeline.parse_point_cloud(manifest=True)
+        mock_stats.assert_called_once()
+
+    def test_manifestConcurrentUpdates(self):
+        tile_indices = [(nx, ny) for nx in range(4) for ny in range(4)]
+        write_PLY_targets(self._test_dir,
+                          indices=tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        tiles = ['tile_{}_{}.ply'.format(nx, ny) for (nx, ny) in tile_indices]
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(_updateManifest, self._test_dir,
+                                       [tile]) for tile in tiles]
+            for future in futures:
+                future.result()
+        with open(os.path.join(self._test_dir,
+                               'geotiff_writer_manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertSetEqual(set(manifest['tiles'].keys()), set(tiles))
+        self.assertListEqual([f for f in os.listdir(self._test_dir)
+                              if f.endswith('.tmp')], [])
+
     def test_singlePointPLYFile(self):
         write_PLY_targets(self._test_dir,
                           indices=self._tile_indices,
@@ -76,6 +198,44 @@ class test_parsePointCloud(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.pipeline.parse_point_cloud()
 
+    def test_rectangularTiles(self):
+        grid = Grid(0., 0., 400., 100., n_tiles_x=4, n_tiles_y=2)
+        write_rectangular_PLY_targets(self._test_dir, self._tile_indices,
+                                      grid, self._grid_spacing)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.parse_point_cloud()
+        self.assertEqual(self.pipeline.LengthDataRecord, 50)
+        self.assertAlmostEqual(self.pipeline.xResolution, self._grid_spacing)
+        self.assertAlmostEqual(self.pipeline.yResolution, self._grid_spacing)
+
+    def test_rectangularTilesWithGrid(self):
+        grid = Grid(0., 0., 400., 100., n_tiles_x=4, n_tiles_y=2)
+        write_rectangular_PLY_targets(self._test_dir, self._tile_indices,
+                                      grid, self._grid_spacing)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.set_grid(0., 0., 400., 100., n_tiles_x=4, n_tiles_y=2)
+        self.pipeline.parse_point_cloud()
+        self.assertAlmostEqual(self.pipeline.xResolution, self._grid_spacing)
+        self.assertAlmostEqual(self.pipeline.yResolution, self._grid_spacing)
+        # all the target points are assigned to different raster cells
+        geotransform, indexX, indexY, ncols, nrows = _getRasterFrame(
+            self.pipeline.InputTiles, self._test_dir,
+            self.pipeline.LengthDataRecord, self.pipeline.xResolution,
+            self.pipeline.yResolution, grid=grid
+        )
+        self.assertEqual((ncols, nrows), (10, 10))
+        self.assertEqual(np.unique(_getFlatIndex(indexX, indexY, ncols)).size,
+                         100)
+
+    def test_irregularTile(self):
+        grid = Grid(0., 0., 400., 100., n_tiles_x=4, n_tiles_y=2)
+        write_rectangular_PLY_targets(self._test_dir, self._tile_indices,
+                                      grid, self._grid_spacing)
+        self.pipeline.input_folder = self._test_dir
+        self.pipeline.set_grid(0., 0., 400., 400., n_tiles_side=4)
+        with self.assertRaises(ValueError):
+            self.pipeline.parse_point_cloud()
+
     def test_inputFolderNonexistent(self):
         self.pipeline.input_folder = os.path.join(self._test_dir, 'tmp')
         with self.assertRaises(FileNotFoundError):
@@ -101,6 +261,37 @@ class test_DataSplit(unittest.TestCase):
         for tile in _tiles:
             self.assertIn([tile], self.pipeline.subtilelists)
 
+    def test_gridSubRegions(self):
+        _tiles = ['tile_{}_{}.ply'.format(nx, ny) for (nx, ny) in self._indices]
+        self.pipeline.InputTiles = _tiles
+        self.pipeline.set_grid(min_x=0., min_y=0., max_x=256., max_y=256.,
+                               n_tiles_side=256)
+        self.pipeline.data_split(2, 2)
+        self.assertEqual(len(self.pipeline.subtilelists), 4)
+        self.assertListEqual(self.pipeline.subtilelists[0], _tiles)
+
+    def test_gridSubRegionsRectangularGrid(self):
+        _tiles = ['tile_{}_{}.ply'.format(nx, ny) for (nx, ny) in self._indices]
+        self.pipeline.InputTiles = _tiles
+        self.pipeline.set_grid(min_x=0., min_y=0., max_x=202., max_y=104.,
+                               n_tiles_x=202, n_tiles_y=104)
+        self.pipeline.data_split(2, 1)
+        self.assertListEqual(self.pipeline.subtilelists,
+                             [_tiles[:1], _tiles[1:]])
+
+    def test_gridTileOutsideGrid(self):
+        _tiles = ['tile_{}_{}.ply'.format(nx, ny) for (nx, ny) in self._indices]
+        self.pipeline.InputTiles = _tiles
+        self.pipeline.set_grid(min_x=0., min_y=0., max_x=103., max_y=103.,
+                               n_tiles_side=103)
+        with self.assertRaises(ValueError):
+            self.pipeline.data_split(2, 2)
+
+    def test_invalidTileName(self):
+        self.pipeline.InputTiles = ['tile.ply']
+        with self.assertRaises(ValueError):
+            self.pipeline.data_split(2, 2)
+
     def test_emptyInputTiles(self):
         self.pipeline.InputTiles = []
         with self.assertRaises(ValueError):
@@ -111,6 +302,9 @@ class test_DataSplit(unittest.TestCase):
             self.pipeline.data_split(2, 2)
 
 
+_origin = (-113107.8100, 214783.8700)
+
+
 class TestCreateSubregionGeotiffs(unittest.TestCase):
 
     _test_dir = 'test_tmp_dir'
@@ -154,6 +348,235 @@ class TestCreateSubregionGeotiffs(unittest.TestCase):
         self.assertEqual(len([f for f in os.listdir(self._test_dir)
                               if f.startswith('geotiff')]), 1)
 
+    def test_multiBandFiles(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.bands = ['feature_1', 'feature_2']
+        self.pipeline.create_subregion_geotiffs('geotiff',
+                                                multi_band_files=True)
+        self.assertEqual(len([f for f in os.listdir(self._test_dir)
+                              if f.startswith('geotiff')]), 4)
+
+    @patch('laserfarm.geotiff_writer._writeMultiBandGeoTiff')
+    def test_multiBandRasterData(self, mock_write):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.subtilelists = [['tile_{}_{}.ply'.format(nx, ny)
+                                      for (nx, ny) in self._tile_indices]]
+        self.pipeline.bands = ['x', 'feature_1', 'feature_2']
+        self.pipeline.create_subregion_geotiffs('geotiff',
+                                                multi_band_files=True)
+        mock_write.assert_called_once()
+        raster, band_names = mock_write.call_args[0][:2]
+        n_cells = 2 * self._n_points_per_tile_and_dim
+        self.assertListEqual(band_names, ['feature_1', 'feature_2'])
+        self.assertTupleEqual(raster.shape, (2, n_cells, n_cells))
+        np.testing.assert_array_equal(raster[0], 0.)
+        self.assertTrue(np.isnan(raster[1]).all())
+
+    def test_streaming(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.subtilelists = [['tile_{}_{}.ply'.format(nx, ny)
+                                      for (nx, ny) in self._tile_indices]]
+        self.pipeline.bands = ['z', 'feature_1', 'feature_2']
+        self.pipeline.create_subregion_geotiffs('geotiff')
+        self.pipeline.create_subregion_geotiffs('streaming', streaming=True)
+        self.assertEqual(len([f for f in os.listdir(self._test_dir)
+                              if f.startswith('streaming')]), 3)
+        for band in self.pipeline.bands:
+            file_name = '{}_TILE_000_BAND_' + band + '.tif'
+            data, geo_transform = read_geotiff(
+                os.path.join(self._test_dir, file_name.format('geotiff'))
+            )
+            streaming_data, streaming_geo_transform = read_geotiff(
+                os.path.join(self._test_dir, file_name.format('streaming'))
+            )
+            self.assertTupleEqual(streaming_geo_transform, geo_transform)
+            np.testing.assert_array_equal(streaming_data, data)
+
+    def test_streamingMultiBandFiles(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.subtilelists = [['tile_{}_{}.ply'.format(nx, ny)
+                                      for (nx, ny) in self._tile_indices]]
+        self.pipeline.bands = ['z', 'feature_1', 'feature_2']
+        self.pipeline.create_subregion_geotiffs('geotiff',
+                                                multi_band_files=True)
+        self.pipeline.create_subregion_geotiffs('streaming', streaming=True,
+                                                multi_band_files=True)
+        data, geo_transform = read_geotiff(
+            os.path.join(self._test_dir, 'geotiff_TILE_000.tif')
+        )
+        streaming_data, streaming_geo_transform = read_geotiff(
+            os.path.join(self._test_dir, 'streaming_TILE_000.tif')
+        )
+        self.assertTupleEqual(streaming_data.shape, (3, 20, 20))
+        self.assertTupleEqual(streaming_geo_transform, geo_transform)
+        np.testing.assert_array_equal(streaming_data, data)
+
+    def test_streamingRasterFrame(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        infiles = self.pipeline.subtilelists[0] + self.pipeline.subtilelists[3]
+        geo_transform, _, _, ncols, nrows = _getRasterFrame(
+            infiles, self._test_dir, self.pipeline.LengthDataRecord,
+            self._grid_spacing, self._grid_spacing
+        )
+        streaming_geo_transform, arrayinfo = _getStreamingRasterFrame(
+            infiles, self._test_dir, self._grid_spacing, self._grid_spacing
+        )
+        self.assertTupleEqual(streaming_geo_transform, geo_transform)
+        self.assertEqual(arrayinfo[3], ncols)
+        self.assertEqual(arrayinfo[7], nrows)
+
+    def test_gridRasterFrame(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        # test targets are at the lower-left corners of the cells
+        tile_width = self._grid_spacing * self._n_points_per_tile_and_dim
+        min_x, min_y = np.array(_origin) - self._grid_spacing / 2.
+        grid = Grid(min_x, min_y, min_x + 256 * tile_width,
+                    min_y + 256 * tile_width, n_tiles_side=256)
+        infiles = self.pipeline.subtilelists[0] + self.pipeline.subtilelists[3]
+        frame = _getRasterFrame(
+            infiles, self._test_dir, self.pipeline.LengthDataRecord,
+            self._grid_spacing, self._grid_spacing
+        )
+        grid_frame = _getRasterFrame(
+            infiles, self._test_dir, self.pipeline.LengthDataRecord,
+            self._grid_spacing, self._grid_spacing, grid=grid
+        )
+        np.testing.assert_allclose(grid_frame[0], frame[0])
+        for value, grid_value in zip(frame[1:], grid_frame[1:]):
+            np.testing.assert_array_equal(grid_value, value)
+
+    def test_streamingRasterFrameFromTileExtents(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.parse_point_cloud(manifest=True)
+        infiles = self.pipeline.subtilelists[0] + self.pipeline.subtilelists[3]
+        frame = _getStreamingRasterFrame(
+            infiles, self._test_dir, self._grid_spacing, self._grid_spacing
+        )
+        manifest_frame = _getStreamingRasterFrame(
+            infiles, self._test_dir, self._grid_spacing, self._grid_spacing,
+            tileExtents=self.pipeline.tileExtents
+        )
+        self.assertTupleEqual(manifest_frame[0], frame[0])
+        self.assertTupleEqual(manifest_frame[1], frame[1])
+
+    def test_tileWindow(self):
+        arrayinfo = (0., 90., 10., 10, 0., 90., 10., 10)
+        xy = np.array([[20., 50.], [30., 50.], [20., 40.], [30., 40.]])
+        xoff, yoff, index_x, index_y, ncols, nrows = _getTileWindow(xy,
+                                                                    arrayinfo)
+        self.assertTupleEqual((xoff, yoff, ncols, nrows), (2, 4, 2, 2))
+        np.testing.assert_array_equal(index_x, [0, 1, 0, 1])
+        np.testing.assert_array_equal(index_y, [0, 0, 1, 1])
+
+    def test_cog(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.bands = ['z']
+        self.pipeline.create_subregion_geotiffs('geotiff')
+        self.pipeline.create_subregion_geotiffs('cog', cog=True,
+                                                compress='DEFLATE',
+                                                predictor='FLOATING_POINT')
+        self.assertEqual(len([f for f in os.listdir(self._test_dir)
+                              if f.startswith('cog')]), 4)
+        for n in range(len(self._tile_indices)):
+            file_name = '{}_TILE_' + '{:03d}_BAND_z.tif'.format(n)
+            gtiff = gdal.Open(os.path.join(self._test_dir,
+                                           file_name.format('geotiff')))
+            cog = gdal.Open(os.path.join(self._test_dir,
+                                         file_name.format('cog')))
+            image_structure = cog.GetMetadata('IMAGE_STRUCTURE')
+            self.assertEqual(image_structure['LAYOUT'], 'COG')
+            self.assertEqual(image_structure['COMPRESSION'], 'DEFLATE')
+            self.assertEqual(image_structure['PREDICTOR'], '3')
+            self.assertTupleEqual(cog.GetGeoTransform(),
+                                  gtiff.GetGeoTransform())
+            np.testing.assert_array_equal(cog.ReadAsArray(),
+                                          gtiff.ReadAsArray())
+
+    @patch('laserfarm.geotiff_writer.gdal')
+    def test_cogConversionFails(self, mock_gdal):
+        file_name = os.path.join(self._test_dir, 'geotiff.tif')
+        pathlib.Path(file_name).touch()
+
+        def create_copy(dst_file_name, *args, **kwargs):
+            # partially written output
+            pathlib.Path(dst_file_name).touch()
+            return None
+        mock_gdal.Open.return_value.RasterCount = 0
+        mock_gdal.GetDriverByName.return_value.CreateCopy = create_copy
+        with self.assertRaises(RuntimeError):
+            _convertToCOG(file_name)
+        self.assertListEqual(os.listdir(self._test_dir), [])
+
+    @patch('laserfarm.geotiff_writer._convertToCOG')
+    @patch('laserfarm.geotiff_writer._writeGeoTiff')
+    def test_cogConvertsAllFiles(self, mock_write, mock_convert):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.subtilelists = [['tile_{}_{}.ply'.format(nx, ny)
+                                      for (nx, ny) in self._tile_indices]]
+        self.pipeline.bands = ['feature_1', 'feature_2']
+        self.pipeline.create_subregion_geotiffs('geotiff', cog=True,
+                                                compress='DEFLATE')
+        outfile = os.path.join(self._test_dir, 'geotiff_TILE_000')
+        self.assertEqual(mock_write.call_count, 2)
+        self.assertListEqual(
+            [c[0] for c in mock_convert.call_args_list],
+            [(outfile + '_BAND_feature_1.tif', 'DEFLATE', None),
+             (outfile + '_BAND_feature_2.tif', 'DEFLATE', None)]
+        )
+
+    def test_multipleThreads(self):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.bands = ['feature_1']
+        self.pipeline.create_subregion_geotiffs('geotiff', n_threads=2)
+        self.assertEqual(len([f for f in os.listdir(self._test_dir)
+                              if f.startswith('geotiff')]), 4)
+
+    @patch('laserfarm.geotiff_writer._writeMultiBandGeoTiff')
+    def test_multipleThreadsProcessAllSubregions(self, mock_write):
+        write_PLY_targets(self._test_dir,
+                          indices=self._tile_indices,
+                          grid_spacing=self._grid_spacing,
+                          nx_values=self._n_points_per_tile_and_dim)
+        self.pipeline.subtilelists.append([])
+        self.pipeline.bands = ['feature_1']
+        self.pipeline.create_subregion_geotiffs('geotiff',
+                                                multi_band_files=True,
+                                                n_threads=2)
+        outfiles = sorted(c[0][3] for c in mock_write.call_args_list)
+        expected = [os.path.join(self._test_dir, 'geotiff_TILE_{:03d}'.format(n))
+                    for n in range(len(self._tile_indices))]
+        self.assertListEqual(outfiles, expected)
+
     def test_emptySubTileList(self):
         self.pipeline.subtilelists = []
         self.pipeline.bands = ['feature_1']
@@ -174,10 +597,26 @@ class TestCreateSubregionGeotiffs(unittest.TestCase):
             self.pipeline.create_subregion_geotiffs('geotiff')
 
 
+class TestGeoCoding(unittest.TestCase):
 
+    _arrayinfo = (0., 90., 10., 10, 0., 90., 10., 10)
 
+    def test_indices(self):
+        xy = np.array([[0., 90.], [10.0000001, 80.], [89.9999999, 0.]])
+        index_x, index_y = _getGeoCoding(xy, self._arrayinfo)
+        self.assertEqual(index_x.dtype, np.int32)
+        self.assertEqual(index_y.dtype, np.int32)
+        np.testing.assert_array_equal(index_x, [0, 1, 9])
+        np.testing.assert_array_equal(index_y, [0, 1, 9])
 
+    def test_pointsNotOnRaster(self):
+        xy = np.array([[0., 90.], [15., 80.]])
+        with self.assertRaises(AssertionError):
+            _getGeoCoding(xy, self._arrayinfo)
 
-
-
-
+    def test_flatIndex(self):
+        index_x = np.array([0, 1, 9], dtype='int32')
+        index_y = np.array([0, 1, 9], dtype='int32')
+        flat_index = _getFlatIndex(index_x, index_y, 10)
+        np.testing.assert_array_equal(flat_index, [0, 11, 99])
+        self.assertEqual(flat_index.dtype, np.int64)
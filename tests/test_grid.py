@@ -1,4 +1,5 @@
 from pathlib import Path
+import pickle
 import unittest
 import numpy as np
 import laspy
@@ -52,6 +53,131 @@ class TestValidGridSetup(unittest.TestCase):
                                       (((0., 0.), (0., 4.)),
                                        ((4., 4.), (4., 8.))))
 
+    def test_tileIdsForArray(self):
+        tile_ids = self.grid.get_tile_ids(np.array([0.1, 19.9, 4.1]),
+                                          np.array([0.2, 19.8, 0.1]))
+        self.assertEqual(tile_ids.dtype, np.int32)
+        np.testing.assert_array_equal(tile_ids, [0, 24, 5])
+
+    def test_tileIdsOutsideGrid(self):
+        tile_ids = self.grid.get_tile_ids(np.array([-0.1, 20.1, 1., np.nan]),
+                                          np.array([1., 1., 20.1, 1.]))
+        np.testing.assert_array_equal(tile_ids, [-1, -1, -1, -1])
+
+    def test_tileIdsInChunks(self):
+        x, y = np.random.uniform(0., 20., (2, 1000))
+        np.testing.assert_array_equal(self.grid.get_tile_ids(x, y),
+                                      self.grid.get_tile_ids(x, y,
+                                                             chunk_size=7))
+
+    def test_tileIdsInvalidChunkSize(self):
+        x, y = np.random.uniform(0., 20., (2, 10))
+        for chunk_size in [0, -1]:
+            with self.assertRaises(ValueError):
+                self.grid.get_tile_ids(x, y, chunk_size=chunk_size)
+
+    def test_tileIdsFromStructuredArray(self):
+        points = np.zeros(2, dtype=[('x', 'f8'), ('y', 'f8'), ('z', 'f8')])
+        points['x'] = [0.1, 19.9]
+        points['y'] = [0.2, 19.8]
+        np.testing.assert_array_equal(
+            self.grid.get_tile_ids(points['x'], points['y']), [0, 24]
+        )
+
+    def test_tileIdsCounts(self):
+        x = np.array([0.1, 0.2, 19.9, -1.])
+        y = np.array([0.1, 0.2, 19.9, 0.])
+        _, counts = self.grid.get_tile_ids(x, y, chunk_size=2,
+                                           return_counts=True)
+        self.assertEqual(counts.size, 25)
+        self.assertEqual(counts[0], 2)
+        self.assertEqual(counts[24], 1)
+        self.assertEqual(counts.sum(), 3)
+
+    def test_tileIndexFromId(self):
+        ix, iy = self.grid.get_tile_index_from_id(np.array([0, 24, 5]))
+        np.testing.assert_array_equal(ix, [0, 4, 1])
+        np.testing.assert_array_equal(iy, [0, 4, 0])
+
+    def test_tileBoundsForLongArray(self):
+        tile_mins, tile_maxs = self.grid.get_tile_bounds((0, 1, 2), (0, 1, 4))
+        np.testing.assert_array_equal(tile_mins, ((0., 4., 8.),
+                                                  (0., 4., 16.)))
+        np.testing.assert_array_equal(tile_maxs, ((4., 8., 12.),
+                                                  (4., 8., 20.)))
+
+    def test_gridIsImmutable(self):
+        with self.assertRaises(AttributeError):
+            self.grid.min_x = 1.
+        with self.assertRaises(RuntimeError):
+            self.grid.setup(0., 0., 10., 10., 5)
+        with self.assertRaises(ValueError):
+            self.grid.grid_mins[0] = 1.
+
+    def test_gridIsHashable(self):
+        grid = Grid(0., 0., 20., 20., 5)
+        self.assertEqual(grid, self.grid)
+        self.assertEqual(hash(grid), hash(self.grid))
+        self.assertNotEqual(Grid(0., 0., 20., 20., 4), self.grid)
+
+    def test_gridIsPickled(self):
+        grid = pickle.loads(pickle.dumps(self.grid))
+        self.assertEqual(grid, self.grid)
+        np.testing.assert_allclose(grid.tile_width, 4.)
+
+    def test_gridNotSetIsPickled(self):
+        grid = pickle.loads(pickle.dumps(Grid()))
+        self.assertFalse(grid.is_set)
+
+
+class TestRectangularGridSetup(unittest.TestCase):
+    def setUp(self):
+        self.grid = Grid(0., 0., 30., 10., n_tiles_x=3, n_tiles_y=5)
+
+    def test_numberOfTiles(self):
+        self.assertEqual(self.grid.n_tiles_x, 3)
+        self.assertEqual(self.grid.n_tiles_y, 5)
+        self.assertEqual(self.grid.n_tiles, 15)
+        with self.assertRaises(ValueError):
+            self.grid.n_tiles_side
+
+    def test_tileWidth(self):
+        np.testing.assert_allclose(self.grid.tile_width, [10., 2.])
+
+    def test_tileIndexForArray(self):
+        np.testing.assert_array_equal(self.grid.get_tile_index((0.1, 29.9),
+                                                               (0.2, 9.8)),
+                                      ((0, 0), (2, 4)))
+
+    def test_tileIdsForArray(self):
+        tile_ids = self.grid.get_tile_ids(np.array([0.1, 29.9, 10.1, 1.]),
+                                          np.array([0.2, 9.8, 0.1, 10.1]))
+        np.testing.assert_array_equal(tile_ids, [0, 14, 5, -1])
+        ix, iy = self.grid.get_tile_index_from_id(tile_ids[:-1])
+        np.testing.assert_array_equal(ix, [0, 2, 1])
+        np.testing.assert_array_equal(iy, [0, 4, 0])
+
+    def test_pointInTile(self):
+        mask = self.grid.is_point_in_tile(np.array([15., 15.]),
+                                          np.array([3., 5.]), 1, 1)
+        np.testing.assert_array_equal(mask, [True, False])
+
+    def test_activeTiles(self):
+        mins = np.array([[1., 1.], [25., 9.], [-10., -10.]])
+        maxs = np.array([[12., 3.], [40., 20.], [-5., -5.]])
+        mask = self.grid.get_active_tiles(mins, maxs)
+        self.assertTupleEqual(mask.shape, (3, 5))
+        np.testing.assert_array_equal(np.argwhere(mask),
+                                      [[0, 0], [0, 1], [1, 0], [1, 1], [2, 4]])
+
+    def test_gridIsPickled(self):
+        grid = pickle.loads(pickle.dumps(self.grid))
+        self.assertEqual(grid, self.grid)
+
+    def test_squareGridIsEqual(self):
+        self.assertEqual(Grid(0., 0., 20., 20., n_tiles_x=5, n_tiles_y=5),
+                         Grid(0., 0., 20., 20., 5))
+
 
 class TestInvalidGridSetup(unittest.TestCase):
     def test_fractionalNumberOfTilesGrid(self):
@@ -74,6 +200,20 @@ class TestInvalidGridSetup(unittest.TestCase):
             grid = Grid()
             grid.setup(0., 0., 10., 20., 5)
 
+    def test_zeroHeightGrid(self):
+        with self.assertRaises(ValueError):
+            Grid(0., 0., 20., 0., n_tiles_x=5, n_tiles_y=1)
+
+    def test_missingNumberOfTilesAlongY(self):
+        with self.assertRaises(ValueError):
+            grid = Grid()
+            grid.setup(0., 0., 10., 20., n_tiles_x=5)
+
+    def test_numberOfTilesOverspecified(self):
+        with self.assertRaises(ValueError):
+            grid = Grid()
+            grid.setup(0., 0., 20., 20., 5, n_tiles_x=5, n_tiles_y=5)
+
 
 class TestRealGridValid(unittest.TestCase):
     _test_dir = 'test_tmp_dir'
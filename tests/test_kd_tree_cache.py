@@ -0,0 +1,75 @@
+import os
+import shutil
+import unittest
+
+import laserchicken.kd_tree
+from laserchicken import compute_neighborhoods, build_volume
+from laserchicken.utils import copy_point_cloud
+
+from laserfarm.kd_tree_cache import KDTreeCache, install_kd_tree_cache
+from .tools import create_test_point_cloud
+
+
+class TestKDTreeCache(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+
+    def setUp(self):
+        self.point_cloud = create_test_point_cloud(nx_values=10)
+        self.cache = KDTreeCache()
+
+    def tearDown(self):
+        KDTreeCache.uninstall()
+        if os.path.isdir(self._test_dir):
+            shutil.rmtree(self._test_dir)
+
+    def test_treeIsReused(self):
+        tree = self.cache.get_kdtree_for_pc(self.point_cloud)
+        self.assertIs(self.cache.get_kdtree_for_pc(self.point_cloud), tree)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_treeIsReusedForCopy(self):
+        tree = self.cache.get_kdtree_for_pc(self.point_cloud)
+        point_cloud = copy_point_cloud(self.point_cloud)
+        self.assertIs(self.cache.get_kdtree_for_pc(point_cloud), tree)
+
+    def test_differentCoordinates(self):
+        self.cache.get_kdtree_for_pc(self.point_cloud)
+        point_cloud = create_test_point_cloud(nx_values=5)
+        self.cache.get_kdtree_for_pc(point_cloud)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_leastRecentlyUsedIsEvicted(self):
+        point_clouds = [create_test_point_cloud(nx_values=10, offset=n)
+                        for n in (0., 1., 2.)]
+        tree = self.cache.get_kdtree_for_pc(point_clouds[0])
+        self.cache.max_memory = 2 * self.cache.memory + 1
+        self.cache.get_kdtree_for_pc(point_clouds[1])
+        self.cache.get_kdtree_for_pc(point_clouds[0])
+        self.cache.get_kdtree_for_pc(point_clouds[2])
+        self.assertEqual(len(self.cache), 2)
+        self.assertIs(self.cache.get_kdtree_for_pc(point_clouds[0]), tree)
+
+    def test_treeIsPersisted(self):
+        cache = KDTreeCache(cache_dir=self._test_dir)
+        tree = cache.get_kdtree_for_pc(self.point_cloud)
+        self.assertEqual(len(os.listdir(self._test_dir)), 1)
+        cache.clear()
+        loaded = cache.get_kdtree_for_pc(self.point_cloud)
+        self.assertIsNot(loaded, tree)
+        self.assertEqual(loaded.n, tree.n)
+
+    def test_install(self):
+        self.cache.install()
+        volume = build_volume('sphere', 2.)
+        targets = create_test_point_cloud(nx_values=3)
+        _ = list(compute_neighborhoods(self.point_cloud, targets, volume))
+        self.assertEqual(len(self.cache), 2)
+        KDTreeCache.uninstall()
+        self.assertIsNot(laserchicken.kd_tree.get_kdtree_for_pc,
+                         self.cache.get_kdtree_for_pc)
+
+    def test_processCacheIsShared(self):
+        cache = install_kd_tree_cache(max_memory=1024)
+        self.assertIs(install_kd_tree_cache(max_memory=2048), cache)
+        self.assertEqual(cache.max_memory, 2048)
@@ -3,7 +3,9 @@ import shutil
 import unittest
 
 from dask.distributed import LocalCluster
+import numpy as np
 
+from laserfarm.data_processing import DataProcessing
 from laserfarm.macro_pipeline import MacroPipeline
 from laserfarm.pipeline import Pipeline
 
@@ -49,6 +51,18 @@ class TestMacroPipelineObject(unittest.TestCase):
         mp.set_labels(labels)
         self.assertListEqual(labels, [task.label for task in mp.tasks])
 
+    def test_selectActiveTiles(self):
+        mp = MacroPipeline()
+        active_tiles = np.zeros((3, 2), dtype=bool)
+        active_tiles[1, 0] = active_tiles[2, 1] = True
+        mp.tasks = [DataProcessing(tile_index=(x, y))
+                    for x in range(4) for y in range(2)]
+        mp.add_task(Pipeline())
+        mp.select_active_tiles(active_tiles)
+        self.assertListEqual([getattr(task, '_tile_index', None)
+                              for task in mp.tasks],
+                             [(1, 0), (2, 1), None])
+
 
 class TestSetupClientMacroPipeline(unittest.TestCase):
 
@@ -0,0 +1,70 @@
+import os
+import shutil
+import unittest
+
+from laserchicken import export, load
+import numpy as np
+
+from laserfarm.parquet_handler import ParquetHandler, read_parquet_columns
+from .tools import create_test_point_cloud
+
+
+class TestParquetHandler(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _test_file = os.path.join(_test_dir, 'tile_0_0.parquet')
+
+    def setUp(self):
+        os.mkdir(self._test_dir)
+        self.point_cloud = create_test_point_cloud(nx_values=10)
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def test_writeAndRead(self):
+        ParquetHandler(self._test_file, 'w').write(self.point_cloud)
+        point_cloud = ParquetHandler(self._test_file, 'r').read()
+        for name, attribute in self.point_cloud['vertex'].items():
+            loaded = point_cloud['vertex'][name]
+            np.testing.assert_array_equal(loaded['data'], attribute['data'])
+            self.assertEqual(loaded['type'], attribute['type'])
+        self.assertListEqual(point_cloud['log'], self.point_cloud['log'])
+
+    def test_readSelectedAttributes(self):
+        ParquetHandler(self._test_file, 'w').write(self.point_cloud)
+        point_cloud = ParquetHandler(self._test_file, 'r').read(
+            attributes=['feature_2']
+        )
+        self.assertListEqual(list(point_cloud['vertex'].keys()),
+                             ['x', 'y', 'z', 'feature_2'])
+
+    def test_writeSelectedAttributes(self):
+        ParquetHandler(self._test_file, 'w').write(self.point_cloud,
+                                                   attributes=['feature_1'])
+        point_cloud = ParquetHandler(self._test_file, 'r').read()
+        self.assertListEqual(list(point_cloud['vertex'].keys()),
+                             ['x', 'y', 'z', 'feature_1'])
+
+    def test_multipleRowGroups(self):
+        ParquetHandler(self._test_file, 'w').write(self.point_cloud,
+                                                   row_group_size=7)
+        columns = read_parquet_columns(self._test_file, ['y'])
+        np.testing.assert_array_equal(columns['y'],
+                                      self.point_cloud['vertex']['y']['data'])
+
+    def test_readColumns(self):
+        ParquetHandler(self._test_file, 'w').write(self.point_cloud)
+        columns = read_parquet_columns(self._test_file, ['feature_1'])
+        self.assertListEqual(list(columns.keys()), ['feature_1'])
+        self.assertEqual(columns['feature_1'].dtype, np.int32)
+
+    def test_laserchickenExportAndLoad(self):
+        export(self.point_cloud, self._test_file)
+        point_cloud = load(self._test_file)
+        np.testing.assert_array_equal(point_cloud['vertex']['z']['data'],
+                                      self.point_cloud['vertex']['z']['data'])
+
+    def test_fileExists(self):
+        export(self.point_cloud, self._test_file)
+        with self.assertRaises(FileExistsError):
+            export(self.point_cloud, self._test_file)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import unittest
+
+from laserchicken import export
+import numpy as np
+
+from laserfarm.ply_reader import read_ply_columns, read_ply_header
+from .tools import create_test_point_cloud
+
+
+class TestReadPLYColumns(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _test_file = os.path.join(_test_dir, 'tile_0_0.ply')
+
+    def setUp(self):
+        os.mkdir(self._test_dir)
+        self.point_cloud = create_test_point_cloud(nx_values=10)
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def _check_columns(self, columns, names):
+        self.assertListEqual(list(columns.keys()), names)
+        for name in names:
+            expected = self.point_cloud['vertex'][name]['data']
+            np.testing.assert_array_equal(columns[name], expected)
+            self.assertEqual(columns[name].dtype, expected.dtype)
+
+    def test_asciiFile(self):
+        export(self.point_cloud, self._test_file)
+        columns = read_ply_columns(self._test_file, ['y', 'feature_1'])
+        self._check_columns(columns, ['y', 'feature_1'])
+
+    def test_binaryFile(self):
+        export(self.point_cloud, self._test_file, is_binary=True)
+        columns = read_ply_columns(self._test_file,
+                                   ['x', 'feature_2', 'feature_1'])
+        self._check_columns(columns, ['x', 'feature_2', 'feature_1'])
+
+    def test_binaryFileIsMemoryMapped(self):
+        export(self.point_cloud, self._test_file, is_binary=True)
+        columns = read_ply_columns(self._test_file, ['z'])
+        self.assertIsInstance(columns['z'].base, np.memmap)
+
+    def test_emptyFile(self):
+        point_cloud = create_test_point_cloud(nx_values=0, log=False)
+        export(point_cloud, self._test_file, is_binary=True)
+        columns = read_ply_columns(self._test_file, ['x'])
+        self.assertEqual(columns['x'].size, 0)
+
+    def test_propertyNotFound(self):
+        export(self.point_cloud, self._test_file)
+        with self.assertRaises(ValueError):
+            read_ply_columns(self._test_file, ['feature_3'])
+
+    def test_headerIsCached(self):
+        export(self.point_cloud, self._test_file)
+        header = read_ply_header(self._test_file)
+        self.assertIs(read_ply_header(self._test_file), header)
+        self.assertEqual(header.n_vertices, 100)
+        self.assertListEqual(list(header.properties.keys()),
+                             ['x', 'y', 'z', 'feature_1', 'feature_2'])
+
+    def test_headerIsUpdatedIfFileChanges(self):
+        export(self.point_cloud, self._test_file)
+        read_ply_header(self._test_file)
+        export(self.point_cloud, self._test_file, attributes=['feature_1'],
+               overwrite=True)
+        header = read_ply_header(self._test_file)
+        self.assertListEqual(list(header.properties.keys()),
+                             ['x', 'y', 'z', 'feature_1'])
@@ -0,0 +1,67 @@
+import os
+import shutil
+import unittest
+
+import numpy as np
+from laserchicken import load
+
+from laserfarm.point_cloud_loader import load_las_files
+from .tools import is_memory_mapped
+
+
+class TestLoadLASFiles(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _input_files = [os.path.join('testdata', f)
+                    for f in ('C_43FN1_1_1.LAZ', 'C_43FN1_1_2.LAZ')]
+
+    def tearDown(self):
+        if os.path.isdir(self._test_dir):
+            shutil.rmtree(self._test_dir)
+
+    def test_sameAsLaserchicken(self):
+        point_cloud = load_las_files(self._input_files, attributes='all')
+        expected = load(self._input_files[0], attributes='all')
+        n_points = expected['vertex']['x']['data'].size
+        for name, attribute in expected['vertex'].items():
+            loaded = point_cloud['vertex'][name]
+            self.assertEqual(loaded['type'], attribute['type'])
+            np.testing.assert_array_equal(loaded['data'][:n_points],
+                                          attribute['data'])
+
+    def test_allPointsAreLoaded(self):
+        point_cloud = load_las_files(self._input_files)
+        self.assertEqual(point_cloud['vertex']['x']['data'].size, 308880)
+
+    def test_multipleThreads(self):
+        point_cloud = load_las_files(self._input_files, n_threads=2)
+        expected = load_las_files(self._input_files)
+        for name, attribute in expected['vertex'].items():
+            np.testing.assert_array_equal(point_cloud['vertex'][name]['data'],
+                                          attribute['data'])
+
+    def test_selectedAttributes(self):
+        point_cloud = load_las_files(self._input_files,
+                                     attributes=['intensity'])
+        self.assertListEqual(list(point_cloud['vertex'].keys()),
+                             ['x', 'y', 'z', 'intensity'])
+
+    def test_invalidAttributes(self):
+        with self.assertRaises(ValueError):
+            load_las_files(self._input_files, attributes=['nonexistent'])
+
+    def test_provenanceIsAdded(self):
+        point_cloud = load_las_files(self._input_files)
+        self.assertEqual(len(point_cloud['log']), 1)
+
+    def test_memoryMapped(self):
+        os.mkdir(self._test_dir)
+        point_cloud = load_las_files(self._input_files,
+                                     scratch_dir=self._test_dir)
+        expected = load_las_files(self._input_files)
+        for name, attribute in expected['vertex'].items():
+            data = point_cloud['vertex'][name]['data']
+            self.assertTrue(is_memory_mapped(data))
+            self.assertFalse(is_memory_mapped(attribute['data']))
+            np.testing.assert_array_equal(data, attribute['data'])
+        self.assertListEqual(os.listdir(self._test_dir), [])
@@ -1,3 +1,4 @@
+import json
 import os
 import pathlib
 import shutil
@@ -40,6 +41,54 @@ class TestSplitAndRedistribute(unittest.TestCase):
                 epsg = file.header.parse_crs().to_epsg()
                 self.assertEqual(epsg, 28992)
 
+    def test_streaming(self):
+        self.pipeline.input_path = pathlib.Path('testdata').joinpath(self._input_file)
+        self.pipeline.output_folder = pathlib.Path(self._test_dir)
+        self.pipeline.grid.setup(*self._grid_input)
+        self.pipeline.split_and_redistribute(streaming=True, chunk_size=10000)
+        self.assertListEqual([d for d in sorted(os.listdir(self._test_dir))
+                              if d.startswith('tile_')],
+                             ["tile_101_101", "tile_101_102"])
+        for tile, expected_points in zip(("tile_101_101", "tile_101_102"),
+                                         (307670, 1210)):
+            filepath = os.path.join(self._test_dir, tile, self._input_file)
+            with laspy.open(filepath) as file:
+                self.assertEqual(file.header.point_count, expected_points)
+
+    def test_streamingRectangularGrid(self):
+        self.pipeline.input_path = pathlib.Path('testdata').joinpath(self._input_file)
+        self.pipeline.output_folder = pathlib.Path(self._test_dir)
+        self.pipeline.set_grid(*self._grid_input[:4], n_tiles_x=256,
+                               n_tiles_y=128)
+        self.pipeline.split_and_redistribute(streaming=True)
+        self.assertListEqual([d for d in sorted(os.listdir(self._test_dir))
+                              if d.startswith('tile_')],
+                             ["tile_101_50", "tile_101_51"])
+        n_points = 0
+        for filepath in pathlib.Path(self._test_dir).glob("tile_*/*.LAZ"):
+            with laspy.open(filepath) as file:
+                n_points += file.header.point_count
+        self.assertEqual(n_points, 308880)
+
+    def test_rectangularGridRequiresStreaming(self):
+        self.pipeline.input_path = pathlib.Path('testdata').joinpath(self._input_file)
+        self.pipeline.output_folder = pathlib.Path(self._test_dir)
+        self.pipeline.set_grid(*self._grid_input[:4], n_tiles_x=256,
+                               n_tiles_y=128)
+        with self.assertRaises(ValueError):
+            self.pipeline.split_and_redistribute()
+
+    def test_streamingOverrideSRS(self):
+        self.pipeline.input_path = pathlib.Path('testdata').joinpath(self._input_file)
+        self.pipeline.output_folder = pathlib.Path(self._test_dir)
+        self.pipeline.grid.setup(*self._grid_input)
+        self.pipeline.split_and_redistribute(override_srs="EPSG:28992",
+                                             streaming=True)
+        for filepath in pathlib.Path(self._test_dir).glob("*/*.LAZ"):
+            with laspy.open(filepath) as file:
+                epsg = file.header.parse_crs().to_epsg()
+                self.assertEqual(epsg, 28992)
+
     def test_inputFileNotSet(self):
         self.pipeline.output_folder = pathlib.Path(self._test_dir)
         self.pipeline.grid.setup(*self._grid_input)
@@ -53,6 +102,93 @@ class TestSplitAndRedistribute(unittest.TestCase):
             self.pipeline.split_and_redistribute()
 
 
+class TestSplitAndRedistributeDirectory(unittest.TestCase):
+
+    _test_dir = 'test_tmp_dir'
+    _input_dir = 'test_tmp_dir/input'
+    _input_files = ['C_43FN1_1_1.LAZ', 'C_43FN1_1_2.LAZ']
+    _grid_input = (-113107.8100, 214783.8700, 398892.1900, 726783.87, 256)
+
+    def setUp(self):
+        os.makedirs(self._input_dir)
+        for input_file in self._input_files:
+            shutil.copy(os.path.join('testdata', input_file), self._input_dir)
+        self.pipeline = Retiler(input_file=self._input_dir)
+        self.pipeline.output_folder = pathlib.Path(self._test_dir)
+        self.pipeline.grid.setup(*self._grid_input)
+
+    def tearDown(self):
+        shutil.rmtree(self._test_dir)
+
+    def test_oneFilePerTile(self):
+        self.pipeline.split_and_redistribute(chunk_size=10000,
+                                             max_open_files=1)
+        for tile, expected_points in zip(("tile_101_101", "tile_101_102"),
+                                         (307670, 1210)):
+            files = os.listdir(os.path.join(self._test_dir, tile))
+            self.assertListEqual(files, ['input.LAZ'])
+            filepath = os.path.join(self._test_dir, tile, files[0])
+            with laspy.open(filepath) as file:
+                self.assertEqual(file.header.point_count, expected_points)
+
+    def test_twoDirectoriesToSameFolder(self):
+        other_input_dir = os.path.join(self._test_dir, 'other_input')
+        shutil.copytree(self._input_dir, other_input_dir)
+        self.pipeline.split_and_redistribute(chunk_size=10000)
+        pipeline = Retiler(input_file=other_input_dir)
+        pipeline.output_folder = pathlib.Path(self._test_dir)
+        pipeline.grid.setup(*self._grid_input)
+        pipeline.split_and_redistribute(chunk_size=10000)
+        files = sorted(os.listdir(os.path.join(self._test_dir,
+                                               'tile_101_101')))
+        self.assertListEqual(files, ['input.LAZ', 'other_input.LAZ'])
+        for file in files:
+            filepath = os.path.join(self._test_dir, 'tile_101_101', file)
+            with laspy.open(filepath) as f:
+                self.assertEqual(f.header.point_count, 307670)
+        for retiler, name in [(self.pipeline, 'input'),
+                              (pipeline, 'other_input')]:
+            retiler.validate()
+            record_file = os.path.join(self._test_dir,
+                                       '{}_retile_record.js'.format(name))
+            with open(record_file) as f:
+                record = json.load(f)
+            self.assertTrue(record['validated'])
+
+    def test_validate(self):
+        self.pipeline.split_and_redistribute(chunk_size=10000,
+                                             max_open_files=1)
+        self.pipeline.validate()
+        record_file = os.path.join(self._test_dir, 'input_retile_record.js')
+        with open(record_file) as f:
+            record = json.load(f)
+        self.assertTrue(record['validated'])
+
+    def test_catalogueSkipsFilesOutsideGrid(self):
+        self.pipeline.set_grid(0., 0., 1000., 1000., 1)
+        self.pipeline.set_catalogue(os.path.join(self._test_dir,
+                                                 'catalogue.sqlite'))
+        self.pipeline.split_and_redistribute()
+        self.assertListEqual([d for d in os.listdir(self._test_dir)
+                              if d.startswith('tile_')], [])
+
+    def test_validateWithCatalogue(self):
+        self.pipeline.set_catalogue(os.path.join(self._test_dir,
+                                                 'catalogue.sqlite'))
+        self.pipeline.split_and_redistribute()
+        self.pipeline.validate()
+        record_file = os.path.join(self._test_dir, 'input_retile_record.js')
+        with open(record_file) as f:
+            record = json.load(f)
+        self.assertTrue(record['validated'])
+
+    def test_emptyDirectory(self):
+        for input_file in self._input_files:
+            os.remove(os.path.join(self._input_dir, input_file))
+        with self.assertRaises(FileNotFoundError):
+            self.pipeline.split_and_redistribute()
+
+
 class TestValidate(unittest.TestCase):
 
     _test_dir = 'test_tmp_dir'
@@ -1,8 +1,10 @@
+import mmap
 import os
 import laspy
 import unittest
 
 import numpy as np
+import shapefile
 
 from laserchicken import export
 
@@ -122,7 +124,7 @@ def create_test_point_cloud(nx_values=10, grid_spacing=1., offset=0., log=True):
 
 def write_PLY_targets(directory, indices, grid_spacing=10., nx_values=10,
                       origin=(-113107.8100, 214783.8700), feature='',
-                      is_binary=False):
+                      is_binary=False, format='.ply'):
     cell_offset = grid_spacing * nx_values
     for (nx, ny) in indices:
         offset_x = origin[0] + nx * cell_offset
@@ -132,17 +134,34 @@ def write_PLY_targets(directory, indices, grid_spacing=10., nx_values=10,
                                               offset=(offset_x,
                                                       offset_y))
         if feature:
-            file_name = 'tile_{}_{}_{}.ply'.format(nx, ny, feature)
+            file_name = 'tile_{}_{}_{}{}'.format(nx, ny, feature, format)
             attributes = [feature]
         else:
-            file_name = 'tile_{}_{}.ply'.format(nx, ny)
+            file_name = 'tile_{}_{}{}'.format(nx, ny, format)
             attributes = 'all'
         file_path = os.path.join(directory, file_name)
-        export(point_cloud, file_path, attributes=attributes,
-               is_binary=is_binary)
+        export_opts = {'is_binary': is_binary} if format == '.ply' else {}
+        export(point_cloud, file_path, attributes=attributes, **export_opts)
 
 
 def get_number_of_points_in_LAZ_file(filename):
     with laspy.open(filename) as f:
         count = f.header.point_count
     return count
+
+
+def write_shapefile(path, polygons):
+    with shapefile.Writer(path, shapeType=shapefile.POLYGON) as writer:
+        writer.field('name', 'C')
+        for n, rings in enumerate(polygons):
+            writer.poly(rings)
+            writer.record(str(n))
+
+
+def is_memory_mapped(array):
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, 'base', None)
+    return False